@@ -0,0 +1,48 @@
+"""
+Compares requests per second for the old one-connection-per-call transport
+(module-level ``requests.get``) against the pooled, keep-alive session owned
+by ``CanvasAPI``.
+"""
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fake_canvas import FakeCanvas
+from waltz.services.canvas.api import CanvasAPI
+
+REQUESTS = 500
+PAGE = [{'id': index, 'title': 'Page {}'.format(index)} for index in range(10)]
+
+
+def per_call_connections(base):
+    url = base + "api/v1/courses/1/pages/"
+    for _ in range(REQUESTS):
+        requests.get(url, data={'access_token': 'token'}, headers={'Connection': 'close'}).json()
+
+
+def pooled_session(base):
+    api = CanvasAPI(base, 'token', '1')
+    for _ in range(REQUESTS):
+        api.get("pages/")
+    api.close()
+
+
+def main():
+    with FakeCanvas({"/api/v1/courses/1/pages/": PAGE}) as canvas:
+        for label, run in [("per-call connections", per_call_connections),
+                           ("pooled session", pooled_session)]:
+            before = canvas.connections
+            start = time.perf_counter()
+            run(canvas.base)
+            elapsed = time.perf_counter() - start
+            print("{:<22} {:>8.1f} req/s  ({} connections)".format(
+                label, REQUESTS / elapsed, canvas.connections - before))
+
+
+if __name__ == '__main__':
+    main()
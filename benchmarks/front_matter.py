@@ -0,0 +1,91 @@
+"""
+Times decoding front matter with the round-trip loader (``extract_front_matter``, which
+the encoders need) against the read-only ``decode_front_matter`` (which indexing and
+lookups use), over front matter written by Waltz's own page and quiz question decoders.
+
+Pass a directory to time the Markdown files of a real course instead:
+
+    python benchmarks/front_matter.py path/to/course
+"""
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waltz.resources.page import Page
+from waltz.resources.quizzes.quiz_question import QuizQuestion
+from waltz.tools import extract_front_matter
+from waltz.tools.front_matter import FRONT_MATTER_BOUNDARY, decode_front_matter, get_loader
+
+PAGES = 200
+QUESTIONS = 800
+ROUNDS = 3
+
+
+def make_question(index):
+    kind = ['multiple_choice_question', 'multiple_answers_question', 'true_false_question',
+            'short_answer_question'][index % 4]
+    return {
+        'id': index, 'question_name': 'Question {}'.format(index), 'question_type': kind,
+        'question_text': '<p>Which of these is true of <code>x = {}</code>?</p>'.format(index),
+        'points_possible': 1.0,
+        'correct_comments_html': '<p>Right!</p>', 'incorrect_comments_html': '<p>Review the <em>slides</em>.</p>',
+        'neutral_comments_html': '',
+        'answers': [{'id': answer, 'text': 'Option {}'.format(answer), 'html': '', 'weight': 100 if answer == 0 else 0,
+                     'comments_html': '<p>Because {}.</p>'.format(answer)} for answer in range(4)],
+    }
+
+
+def make_corpus():
+    args = SimpleNamespace(combine=False, hide_answers=False)
+    corpus = []
+    for index in range(PAGES):
+        page = {'title': 'Lecture {}: Loops'.format(index), 'published': index % 2 == 0,
+                'body': '<h1>Loops</h1><p>Repeat yourself, but not too much.</p>'}
+        corpus.append(Page.decode_json(None, json.dumps(page), args)[0])
+    for index in range(QUESTIONS):
+        question = make_question(index)
+        corpus.append(QuizQuestion.TYPES[question['question_type']].decode_json(None, question, args))
+    return corpus
+
+
+def read_corpus(directory):
+    corpus = []
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith('.md'):
+                with open(os.path.join(folder, name), encoding='utf8') as markdown_file:
+                    text = markdown_file.read()
+                if FRONT_MATTER_BOUNDARY.match(text.split('\n', 1)[0]):
+                    corpus.append(text)
+    return corpus
+
+
+def timed(decode, corpus):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for text in corpus:
+            decode(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    corpus = read_corpus(sys.argv[1]) if len(sys.argv) > 1 else make_corpus()
+    for text in corpus:
+        regular, waltz, body = extract_front_matter(text)
+        assert decode_front_matter(text) == (dict(regular), json.loads(json.dumps(waltz)), body)
+    print("{} front matter blocks, decoded with {}".format(len(corpus), get_loader().__mro__[1].__name__))
+    round_trip = timed(extract_front_matter, corpus)
+    read_only = timed(decode_front_matter, corpus)
+    print("round-trip (ruamel)       {:>8.3f}s".format(round_trip))
+    print("read-only                 {:>8.3f}s  ({:.1f}x)".format(read_only, round_trip / read_only))
+
+
+if __name__ == '__main__':
+    main()
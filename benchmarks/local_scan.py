@@ -0,0 +1,92 @@
+"""
+Times describing every file of a synthetic local course from its front matter (what
+`waltz list local` does with a cold index) in one process and across a process pool,
+against reading each file whole for the search index. Then times resolving filenames
+by checking every indexed path against the indexed lookup by path suffix.
+"""
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waltz.registry import Registry
+from waltz.services.local import local as local_module
+from waltz.services.local.local import Local
+from waltz.tools.front_matter import read_front_matter
+from waltz.tools.utilities import all_path_parts_match
+
+FILES = 2000
+BODY_LINES = 2000
+LOOKUPS = 200
+
+
+def make_course(directory):
+    paths = []
+    for index in range(FILES):
+        folder = os.path.join(directory, 'Quiz {}'.format(index // 20))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'Question {}.md'.format(index))
+        with open(path, 'w') as markdown_file:
+            markdown_file.write("---\nwaltz:\n  resource: quiz question\n  title: Question {}\n"
+                                "  type: multiple_choice_question\n  points: 1\n---\n".format(index))
+            markdown_file.write("What is the value of `x` after this line runs?\n" * BODY_LINES)
+        paths.append(path)
+    return paths
+
+
+def timed(function, *arguments):
+    start = time.perf_counter()
+    result = function(*arguments)
+    return time.perf_counter() - start, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_course(directory)
+        local = Local('local', {'path': directory})
+        minimum = local_module.PARALLEL_SCAN_MINIMUM
+        local_module.PARALLEL_SCAN_MINIMUM = len(paths) + 1
+        serial_time, serial = timed(local.describe_files, paths)
+        local_module.PARALLEL_SCAN_MINIMUM = minimum
+        parallel_time, parallel = timed(local.describe_files, paths)
+        assert serial == parallel
+        print("describe {} files, 1 process    {:>8.3f}s".format(FILES, serial_time))
+        print("describe {} files, {} processes {:>8.3f}s".format(FILES, os.cpu_count(), parallel_time))
+        print("index {} files' text           {:>8.3f}s".format(FILES, timed(local.describe_file_texts, paths)[0]))
+
+        def read_whole():
+            for path in paths:
+                with open(path, encoding='utf8') as markdown_file:
+                    markdown_file.read()
+
+        def read_bounded():
+            for path in paths:
+                read_front_matter(path)
+
+        print("read whole files               {:>8.3f}s".format(timed(read_whole)[0]))
+        print("read front matter only         {:>8.3f}s".format(timed(read_bounded)[0]))
+
+        registry = Registry.init(directory)
+        local.attach(registry)
+        registry.refresh_local_files(local.name, directory, local.describe_files)
+        titles = ['Question {}'.format(index) for index in range(0, FILES, FILES // LOOKUPS)]
+
+        def scan_every_path():
+            for title in titles:
+                [local_file.path for local_file in registry.find_local_files(directory)
+                 if all_path_parts_match(local_file.path, title + '.md')]
+
+        def look_up_suffixes():
+            for title in titles:
+                local.find_existing(registry, title, top_directories=[directory], args=SimpleNamespace())
+
+        print("resolve {} names, every path  {:>8.3f}s".format(LOOKUPS, timed(scan_every_path)[0]))
+        print("resolve {} names, by suffix   {:>8.3f}s".format(LOOKUPS, timed(look_up_suffixes)[0]))
+        registry.close()
+
+
+if __name__ == '__main__':
+    main()
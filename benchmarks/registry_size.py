@@ -0,0 +1,94 @@
+"""
+Compares the size of .waltz.db, and the time to read every resource back from a
+fresh connection, for a synthetic course stored as plain JSON text (how older
+versions of Waltz stored it) against the current compressed storage.
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waltz.registry import Registry
+
+QUIZZES = 300
+QUESTIONS = 30
+
+
+def make_quiz(index):
+    return json.dumps({
+        'id': index, 'title': 'Quiz {}'.format(index), 'quiz_type': 'assignment', 'published': True,
+        'description': '<p>Read chapter {} before starting.</p>'.format(index),
+        'html_url': 'https://canvas.example.edu/courses/1/quizzes/{}'.format(index),
+        'questions': [{
+            'id': index * 1000 + number, 'quiz_id': index, 'position': number, 'quiz_group_id': None,
+            'question_name': 'Question {}'.format(number), 'question_type': 'multiple_choice_question',
+            'question_text': '<p>What does <code>f({})</code> return when <em>x</em> is {}?</p>'.format(
+                number, index),
+            'points_possible': 1.0, 'correct_comments': '', 'incorrect_comments': '', 'neutral_comments': '',
+            'correct_comments_html': '', 'incorrect_comments_html': '', 'neutral_comments_html': '',
+            'answers': [{'id': number * 10 + choice, 'text': str(choice * index), 'html': '', 'comments': '',
+                         'comments_html': '', 'weight': 100.0 if choice == 0 else 0.0}
+                        for choice in range(4)],
+        } for number in range(QUESTIONS)]})
+
+
+ROWS = [('canvas', 'quiz', 'Quiz {}'.format(index), '', make_quiz(index)) for index in range(QUIZZES)]
+
+
+def store_plain(path):
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE resources (service text, category text, title text, disambiguate text, data text)")
+    db.executemany("INSERT INTO resources VALUES (?, ?, ?, ?, ?)", ROWS)
+    db.commit()
+    db.close()
+
+
+def read_plain(path):
+    db = sqlite3.connect(path)
+    total = sum(len(json.loads(data)['questions']) for data, in db.execute("SELECT data FROM resources"))
+    db.close()
+    return total
+
+
+def store_compressed(directory):
+    registry = Registry.init(directory)
+    with registry.transaction():
+        registry.store_resources(ROWS)
+    registry.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    registry.db.close()
+
+
+def read_compressed(directory):
+    registry = Registry.load(directory)
+    total = sum(len(json.loads(resource.data)['questions'])
+                for resource in registry.find_all_resources('canvas', 'quiz'))
+    registry.db.close()
+    return total
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        plain_path = os.path.join(directory, 'plain.db')
+        store_plain(plain_path)
+        start = time.perf_counter()
+        read_plain(plain_path)
+        plain_read = time.perf_counter() - start
+        compressed_directory = os.path.join(directory, 'compressed')
+        os.makedirs(compressed_directory)
+        store_compressed(compressed_directory)
+        start = time.perf_counter()
+        read_compressed(compressed_directory)
+        compressed_read = time.perf_counter() - start
+        compressed_path = Registry.get_waltz_database_path(compressed_directory)
+        for label, path, elapsed in [("plain JSON text", plain_path, plain_read),
+                                     ("compressed", compressed_path, compressed_read)]:
+            print("{:<16} {:>8.1f} KB  read all in {:.3f}s".format(
+                label, os.path.getsize(path) / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
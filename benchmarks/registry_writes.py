@@ -0,0 +1,53 @@
+"""
+Compares storing 5,000 synthetic resources the old way (a commit per resource,
+on a rollback-journal database) against a single ``Registry.transaction``
+with ``store_resources`` on the WAL-mode database that Waltz now creates.
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waltz.registry import Registry
+
+RESOURCES = 5000
+ROWS = [('canvas', 'page', 'Page {}'.format(index), '',
+         json.dumps({'title': 'Page {}'.format(index), 'body': '<p>{}</p>'.format('x' * 2000)}))
+        for index in range(RESOURCES)]
+
+
+def commit_per_resource(directory):
+    registry = Registry.init(directory)
+    registry.db.close()
+    # What older versions of Waltz did: default journal, fsync on every commit
+    registry.db = sqlite3.connect(Registry.get_waltz_database_path(directory))
+    registry.db.execute("PRAGMA journal_mode=DELETE")
+    for row in ROWS:
+        registry.store_resource(*row)
+    return registry
+
+
+def batched_transaction(directory):
+    registry = Registry.init(directory)
+    with registry.transaction():
+        registry.store_resources(ROWS)
+    return registry
+
+
+def main():
+    for label, run in [("commit per resource", commit_per_resource),
+                       ("batched, WAL", batched_transaction)]:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            registry = run(directory)
+            elapsed = time.perf_counter() - start
+            registry.db.close()
+        print("{:<20} {:>10.1f} resources/s".format(label, RESOURCES / elapsed))
+
+
+if __name__ == '__main__':
+    main()
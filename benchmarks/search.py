@@ -0,0 +1,47 @@
+"""
+Times `Registry.search` over a synthetic course of thousands of stored quizzes, along
+with how long indexing them took as part of storing them.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waltz.registry import Registry
+
+QUIZZES = 3000
+TOPICS = ['recursion', 'loops', 'dictionaries', 'classes', 'testing', 'strings', 'lists', 'functions']
+
+
+def make_quiz(index):
+    topic = TOPICS[index % len(TOPICS)]
+    return json.dumps({
+        'id': index, 'title': 'Quiz {} on {}'.format(index, topic),
+        'description': '<p>Practice with {} before the exam.</p>'.format(topic),
+        'questions': [{'question_text': '<p>Question {} about <code>{}</code> and {}.</p>'.format(
+                           number, topic, TOPICS[(index + number) % len(TOPICS)]),
+                       'answers': [{'text': 'Answer {}'.format(choice)} for choice in range(4)]}
+                      for number in range(10)]})
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        registry = Registry.init(directory)
+        start = time.perf_counter()
+        with registry.transaction():
+            registry.store_resources([('canvas', 'quiz', 'Quiz {}'.format(index), '', make_quiz(index))
+                                      for index in range(QUIZZES)])
+        print("store and index {} quizzes {:>8.3f}s".format(QUIZZES, time.perf_counter() - start))
+        for query in ['recursion', 'recur*', 'dictionaries classes', 'nothing']:
+            start = time.perf_counter()
+            results = registry.search('quiz', query)
+            print("search {:<22} {:>8.2f}ms ({} results)".format(
+                repr(query), (time.perf_counter() - start) * 1000, len(results)))
+        registry.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Times how long `waltz --help` and `waltz list` take to start up and finish, as
+fresh processes, in a throwaway Waltz directory. Exits with an error if either
+takes longer than BUDGET, so that a new eager import doesn't sneak back in.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RUNS = 10
+BUDGET = 0.150
+
+
+def run_waltz(directory, arguments):
+    subprocess.run([sys.executable, '-m', 'waltz'] + arguments, cwd=directory, env=dict(os.environ, PYTHONPATH=ROOT),
+                   stdout=subprocess.DEVNULL, check=True)
+
+
+def time_command(directory, arguments):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        run_waltz(directory, arguments)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        run_waltz(directory, ['init'])
+        over_budget = False
+        for arguments in (['--help'], ['list']):
+            elapsed = time_command(directory, arguments)
+            over_budget = over_budget or elapsed > BUDGET
+            print("waltz {:<8} {:>8.3f}s (median of {})".format(" ".join(arguments), elapsed, RUNS))
+        if over_budget:
+            sys.exit("Startup took longer than {:.3f}s".format(BUDGET))
+
+
+if __name__ == '__main__':
+    main()
@@ -42,5 +42,5 @@ setup(name='lms-waltz',
           "Operating System :: OS Independent",
           "Typing :: Typed"
       ],
-      python_requires='>=3.6',
+      python_requires='>=3.7',
       )
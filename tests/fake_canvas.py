@@ -0,0 +1,117 @@
+"""
+A tiny stand-in for the Canvas REST API, used by the tests and benchmarks so
+that the HTTP layer of ``CanvasAPI`` can be exercised without a real server.
+"""
+import fnmatch
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeCanvasHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        super().handle()
+
+    def _respond(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+        route = self.server.routes.get(url.path)
+        if route is None:
+            route = next((route for pattern, route in self.server.routes.items()
+                          if fnmatch.fnmatch(url.path, pattern)), None)
+        if route is None:
+            status, headers, payload = 404, {}, {'errors': [{'message': 'Not found'}]}
+        elif callable(route):
+            # Canvas accepts parameters in either the query string or a form body
+            query = parse_qs(body.decode('utf8')) if body and not body.startswith(b'{') else {}
+            query.update(parse_qs(url.query))
+            status, headers, payload = route(self, url, query, body)
+        else:
+            status, headers, payload = 200, {}, route
+        encoded = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf8')
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+
+def paginate(items, include_last=True, delay=0):
+    """
+    Builds a route that serves ``items`` in Canvas-style pages, with ``Link``
+    headers for the next (and optionally last) page.
+    """
+    def route(handler, url, query, body):
+        per_page = int(query.get('per_page', ['10'])[0])
+        page = int(query.get('page', ['1'])[0])
+        last_page = max(1, -(-len(items) // per_page))
+        if delay:
+            time.sleep(delay)
+        link = "http://{}{}?page={{}}&per_page={}".format(handler.headers['Host'], url.path, per_page)
+        links = []
+        if page < last_page:
+            links.append('<{}>; rel="next"'.format(link.format(page + 1)))
+        if include_last:
+            links.append('<{}>; rel="last"'.format(link.format(last_page)))
+        headers = {'Link': ", ".join(links)} if links else {}
+        return 200, headers, items[(page - 1) * per_page:page * per_page]
+    return route
+
+
+class FakeCanvas:
+    """
+    Runs the stand-in server on a background thread. ``routes`` maps a full
+    path (e.g. ``/api/v1/courses/1/pages/``, or a pattern like
+    ``/api/v1/courses/1/pages/*``) to either a JSON-able payload or a
+    function ``(handler, url, query, body) -> (status, headers, payload)``.
+    """
+
+    def __init__(self, routes=None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCanvasHandler)
+        self.server.daemon_threads = True
+        self.server.routes = routes if routes is not None else {}
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base(self):
+        return "http://127.0.0.1:{}/".format(self.server.server_address[1])
+
+    @property
+    def routes(self):
+        return self.server.routes
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,87 @@
+import contextlib
+import io
+import threading
+import unittest
+from types import SimpleNamespace
+
+from fake_canvas import FakeCanvas
+from waltz.resources.assignment import Assignment
+from waltz.services.canvas.canvas import Canvas
+from waltz_test_case import WaltzTestCase
+
+COURSE_PATH = "/api/v1/courses/1/"
+
+
+class TestRemoteReferences(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.routes = {COURSE_PATH + "assignments/": [{'id': 3, 'name': 'Lab'}],
+                       COURSE_PATH + "assignments/3": {'id': 3, 'name': 'Lab', 'html_url': 'lab',
+                                                       'updated_at': '2020-01-01T00:00:00Z'}}
+        self.canvas = FakeCanvas(self.routes).__enter__()
+        self.service = Canvas('canvas', {'base': self.canvas.base, 'token': 'token', 'course': '1'})
+        self.registry.configure_service(self.service)
+        self.registry.store_resource('canvas', 'assignment', 'Lab', '', '{"name": "Lab"}')
+
+    def tearDown(self):
+        self.service.api.close()
+        self.canvas.__exit__(None, None, None)
+
+    def requested_paths(self):
+        return [path.split("?")[0][len(COURSE_PATH):] for _, path, _ in self.canvas.requests]
+
+    def test_known_resources_skip_the_search(self):
+        self.assertEqual(Assignment.find_remote(self.registry, self.service, 'Lab')['id'], 3)
+        self.assertEqual(self.registry.find_remote_id('canvas', 'assignment', 'Lab'), '3')
+        url, = self.registry.db.execute("SELECT remote_url FROM resources WHERE title = 'Lab'").fetchone()
+        self.assertEqual(url, 'lab')
+        self.canvas.requests.clear()
+        self.assertEqual(Assignment.find_remote(self.registry, self.service, 'Lab')['id'], 3)
+        self.assertEqual(self.requested_paths(), ['assignments/3'])
+
+    def test_deleted_resources_fall_back_to_searching(self):
+        self.registry.store_remote_reference('canvas', 'assignment', 'Lab', 99)
+        self.assertEqual(Assignment.find_remote(self.registry, self.service, 'Lab')['id'], 3)
+        self.assertEqual(self.requested_paths(), ['assignments/99', 'assignments/', 'assignments/3'])
+        self.assertEqual(self.registry.find_remote_id('canvas', 'assignment', 'Lab'), '3')
+
+    def test_download_all_skips_unchanged(self):
+        self.routes[COURSE_PATH + "assignments/"] = [{'id': 3, 'name': 'Lab', 'updated_at': '2020-01-01T00:00:00Z'}]
+        args = SimpleNamespace(service='canvas', local_service=None, all=True)
+        Assignment.download_all(self.registry, args)
+        self.assertIn('assignments/3', self.requested_paths())
+        self.canvas.requests.clear()
+        Assignment.download_all(self.registry, args)
+        self.assertEqual(self.requested_paths(), ['assignments/'])
+        # Once the local copy changes, it has to be downloaded again
+        self.registry.store_resource('canvas', 'assignment', 'Lab', '', '{"name": "Lab", "edited": true}')
+        self.canvas.requests.clear()
+        Assignment.download_all(self.registry, args)
+        self.assertEqual(self.requested_paths(), ['assignments/', 'assignments/3'])
+
+    def test_list_prints_each_page_as_it_arrives(self):
+        printed_first_page = threading.Event()
+
+        class Output(io.StringIO):
+            def write(self, text):
+                if 'Lab' in text:
+                    printed_first_page.set()
+                return super().write(text)
+
+        def assignments(handler, url, query, body):
+            if query.get('page') == ['2']:
+                # Canvas is slow to send the second page; the first should already be on screen
+                return 200, {}, [{'id': 4, 'name': 'Project' if printed_first_page.wait(5) else 'Too late'}]
+            link = '<http://{}{}?page=2>; rel="next"'.format(handler.headers['Host'], url.path)
+            return 200, {'Link': link}, [{'id': 3, 'name': 'Lab'}]
+
+        self.routes[COURSE_PATH + "assignments/"] = assignments
+        output = Output()
+        with contextlib.redirect_stdout(output):
+            Assignment.list(self.registry, self.service, SimpleNamespace(local_service=None, term=None))
+        self.assertEqual([line.split()[2] for line in output.getvalue().splitlines()[2:]], ['Lab', 'Project'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import tempfile
+import time
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+from fake_canvas import FakeCanvas, paginate
+from waltz.command_line import parse_command_line
+from waltz.registry import Registry
+from waltz.services.canvas.api import CanvasAPI, WaltzCanvasServiceError
+from waltz.services.canvas.cache import CanvasResponseCache
+
+COURSE_PATH = "/api/v1/courses/1/"
+
+
+class TestCanvasAPI(unittest.TestCase):
+
+    def test_session_reuses_connections(self):
+        with FakeCanvas({COURSE_PATH + "pages/": [{'title': 'Syllabus'}]}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1")
+            for _ in range(20):
+                self.assertEqual(api.get("pages/"), [{'title': 'Syllabus'}])
+            api.close()
+        self.assertEqual(len(canvas.requests), 20)
+        self.assertEqual(canvas.connections, 1)
+
+    def test_pool_size_is_configurable(self):
+        api = CanvasAPI("http://localhost/", "token", "1", pool_size=3)
+        adapter = api.session.get_adapter("https://example.com/")
+        self.assertEqual(adapter._pool_maxsize, 3)
+        api.close()
+
+    def test_retrieve_all_fans_out_in_order(self):
+        items = [{'id': index} for index in range(1050)]
+        with FakeCanvas({COURSE_PATH + "assignments/": paginate(items, delay=0.05)}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1", max_workers=8)
+            self.assertEqual(api.get("assignments/", retrieve_all=True), items)
+            api.close()
+        pages = sorted(int(parse_qs(urlparse(path).query)['page'][0])
+                       for _, path, _ in canvas.requests if "?" in path)
+        self.assertEqual(pages, list(range(2, 12)))
+
+    def test_retrieve_all_without_last_walks_sequentially(self):
+        items = [{'id': index} for index in range(250)]
+        with FakeCanvas({COURSE_PATH + "assignments/": paginate(items, include_last=False)}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1")
+            self.assertEqual(api.get("assignments/", retrieve_all=True), items)
+            api.close()
+        self.assertEqual(len(canvas.requests), 3)
+
+    def test_iter_items_streams_and_stops_early(self):
+        items = [{'id': index} for index in range(1000)]
+        with FakeCanvas({COURSE_PATH + "assignments/": paginate(items, include_last=False)}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1")
+            for item in api.iter_items("assignments/"):
+                if item['id'] == 150:
+                    break
+            self.assertEqual(list(api.iter_items("assignments/")), items)
+            api.close()
+        # The second page is being read and the third prefetched when we stop
+        self.assertLessEqual(len(canvas.requests), 3 + 10)
+
+    def test_async_requests_overlap(self):
+        routes = {COURSE_PATH + "pages/{}".format(index): paginate([{'id': index}], delay=0.2)
+                  for index in range(8)}
+        with FakeCanvas(routes) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1", max_workers=8)
+            start = time.perf_counter()
+            results = api.get_many(["pages/{}".format(index) for index in range(8)])
+            elapsed = time.perf_counter() - start
+            api.close()
+        self.assertEqual(results, [[{'id': index}] for index in range(8)])
+        self.assertLess(elapsed, 1.0)
+
+    def make_flaky_route(self, failures, status, text):
+        calls = []
+
+        def route(handler, url, query, body):
+            calls.append(handler.command)
+            if len(calls) <= failures:
+                return status, {'X-Rate-Limit-Remaining': '0'}, text.encode('utf8')
+            return 200, {'X-Rate-Limit-Remaining': '600'}, {'id': 1}
+        return route, calls
+
+    def test_throttled_requests_are_retried_and_shrink_concurrency(self):
+        route, calls = self.make_flaky_route(2, 403, "403 Forbidden (Rate Limit Exceeded)")
+        with FakeCanvas({COURSE_PATH + "quizzes/1/questions": route}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1", max_workers=8)
+            api.BACKOFF_BASE = 0
+            self.assertEqual(api.post("quizzes/1/questions"), {'id': 1})
+            api.close()
+        self.assertEqual(calls, ['POST'] * 3)
+        self.assertLess(api.throttle.limit, 8)
+
+    def test_server_errors_only_retry_idempotent_verbs(self):
+        route, calls = self.make_flaky_route(1, 502, "Bad Gateway")
+        with FakeCanvas({COURSE_PATH + "pages/a": route}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1")
+            api.BACKOFF_BASE = 0
+            with self.assertRaises(WaltzCanvasServiceError):
+                api.post("pages/a")
+            self.assertEqual(api.put("pages/a"), {'id': 1})
+            api.close()
+        self.assertEqual(calls, ['POST', 'PUT'])
+
+
+class TestCanvasResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, ".waltz.cache.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @classmethod
+    def etag_route(cls, payload):
+        def route(handler, url, query, body):
+            if handler.headers.get('If-None-Match') == '"v1"':
+                return 304, {'ETag': '"v1"'}, b''
+            return 200, {'ETag': '"v1"'}, payload
+        return route
+
+    def test_revalidates_with_etag(self):
+        page = {'title': 'Syllabus', 'body': 'x' * 1000}
+        with FakeCanvas({COURSE_PATH + "pages/syllabus": self.etag_route(page)}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1", cache=CanvasResponseCache(self.cache_path))
+            self.assertEqual(api.get("pages/syllabus"), page)
+            self.assertEqual(api.get("pages/syllabus"), page)
+            api.close()
+        self.assertEqual(len(canvas.requests), 2)
+        self.assertNotIn('If-None-Match', canvas.requests[0][2])
+        self.assertEqual(canvas.requests[1][2]['If-None-Match'], '"v1"')
+
+    def test_ttl_override_skips_the_network(self):
+        cache = CanvasResponseCache(self.cache_path, ttls={'pages/*': 300})
+        with FakeCanvas({COURSE_PATH + "pages/syllabus": self.etag_route({'title': 'Syllabus'})}) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1", cache=cache)
+            for _ in range(3):
+                self.assertEqual(api.get("pages/syllabus"), {'title': 'Syllabus'})
+            api.close()
+        self.assertEqual(len(canvas.requests), 1)
+
+    def test_evicts_least_recently_used(self):
+        routes = {COURSE_PATH + "pages/{}".format(name): self.etag_route({'body': name * 400})
+                  for name in "abc"}
+        cache = CanvasResponseCache(self.cache_path, max_bytes=1000)
+        with FakeCanvas(routes) as canvas:
+            api = CanvasAPI(canvas.base, "token", "1", cache=cache)
+            for name in "abca":
+                api.get("pages/{}".format(name))
+            urls = [url for url, in cache.db.execute("SELECT url FROM responses")]
+            api.close()
+        self.assertEqual(len(urls), 2)
+        self.assertFalse(any(url.endswith("pages/b") for url in urls))
+
+    def test_cache_is_configurable(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+        parse_command_line(['init']).close()
+        parse_command_line(['configure', 'canvas', 'course', '--base', 'https://canvas.example.edu/',
+                            '--course', '1', '--token', 'token', '--cache_ttl', 'pages/*=300',
+                            '--cache_ttl', 'quizzes/*=-1', '--cache_size', '1000']).close()
+        registry = Registry.load(self.directory.name)
+        cache = registry.get_service('course').cache
+        self.assertEqual(cache.ttl_for("api/v1/courses/1/pages/syllabus"), 300)
+        self.assertEqual(cache.ttl_for("api/v1/courses/1/quizzes/4"), -1)
+        self.assertEqual(cache.max_bytes, 1000)
+        cache.close()
+        registry.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import tempfile
+import time
+import unittest
+
+from fake_canvas import FakeCanvas
+from waltz.registry import Registry
+from waltz.services.gradescope.gradescope import GradeScope
+from waltz.services.gradescope.pyscope.pyscope import GSSession, ConnState
+
+
+def course_page(handler, url, query, body):
+    if 'signed_token=fresh' in (handler.headers.get('Cookie') or ''):
+        return 200, {}, {'course': 1}
+    return 302, {'Location': '/login'}, {}
+
+
+class TestGradeScopeSessions(unittest.TestCase):
+
+    def test_session_logs_back_in_when_redirected_to_login(self):
+        logins = []
+
+        def relogin():
+            logins.append(True)
+            session.cookies.set('signed_token', 'fresh')
+            return True
+
+        with FakeCanvas({"/courses/1": course_page, "/login": {}}) as gradescope:
+            session = GSSession()
+            session.relogin = relogin
+            session.cookies.set('signed_token', 'stale')
+            self.assertEqual(session.get(gradescope.base + "courses/1").json(), {'course': 1})
+            self.assertEqual(session.get(gradescope.base + "courses/1").json(), {'course': 1})
+            session.close()
+        self.assertEqual(len(logins), 1)
+
+    def test_stored_cookies_are_reused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry.init(directory)
+            service = GradeScope('autograders', {'email': 'me@example.edu', 'password': 'secret', 'course': '1'})
+            registry.configure_service(service)
+            registry.store_session('autograders', [
+                {'name': 'signed_token', 'value': 'fresh', 'domain': 'www.gradescope.com', 'path': '/',
+                 'expires': time.time() + 60, 'secure': True},
+                {'name': 'old_token', 'value': 'stale', 'domain': 'www.gradescope.com', 'path': '/',
+                 'expires': time.time() - 60, 'secure': True}])
+            self.assertEqual(service.api.state, ConnState.LOGGED_IN)
+            self.assertEqual([cookie.name for cookie in service.api.session.cookies], ['signed_token'])
+            registry.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
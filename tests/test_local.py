@@ -0,0 +1,243 @@
+import contextlib
+import io
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs
+
+from fake_canvas import FakeCanvas
+from waltz.exceptions import WaltzAmbiguousResource
+from waltz.services.canvas.canvas import Canvas
+from waltz.services.local import local as local_module
+from waltz.tools import extract_front_matter
+from waltz.tools.front_matter import decode_front_matter, read_front_matter, read_waltz_front_matter
+from waltz.tools.watching import InotifyWatcher, PollingWatcher, watch_changes
+from waltz_test_case import WaltzTestCase
+
+
+class TestLocalFileIndex(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.local = self.registry.get_service('local')
+        self.write('quizzes/Week 1/index.md', 'quiz', 'Week 1 Quiz')
+        self.write('quizzes/Week 2/index.md', 'quiz', 'Week 2 Quiz')
+        self.write('pages/Syllabus.md', 'page', 'Course Syllabus')
+        self.write('pages/broken.md', None, None, "---\nwaltz: [unclosed\n---\n")
+        self.described = []
+        describe_file = self.local.describe_file
+        self.local.describe_file = lambda path: self.described.append(path) or describe_file(path)
+
+    def write(self, path, resource, title, text=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as markdown_file:
+            markdown_file.write(text or "---\nwaltz:\n  resource: {}\n  title: {}\n---\nBody\n".format(resource, title))
+
+    def find(self, title, **options):
+        return os.path.normpath(self.local.find_existing(self.registry, title, args=SimpleNamespace(), **options))
+
+    def test_find_existing_uses_the_index(self):
+        self.assertEqual(self.find('Syllabus'), os.path.join('pages', 'Syllabus.md'))
+        self.assertEqual(self.find('Week 1 Quiz', check_front_matter=True, folder_file='index'),
+                         os.path.join('quizzes', 'Week 1', 'index.md'))
+        with self.assertRaises(WaltzAmbiguousResource):
+            self.find('index')
+        self.assertEqual(len(self.described), 4)
+        # The directory was already walked, so nothing is read again
+        self.find('Syllabus')
+        self.assertEqual(len(self.described), 4)
+
+    def test_only_changed_files_are_read_again(self):
+        self.local.refresh_search_index(self.registry)
+        self.described.clear()
+        self.write('pages/Syllabus.md', 'page', 'Course Syllabus (Spring)')
+        os.remove('quizzes/Week 2/index.md')
+        self.local.refresh_search_index(self.registry)
+        self.assertEqual(self.described, [os.path.abspath('pages/Syllabus.md')])
+        self.assertEqual(self.local.get_title('pages/Syllabus.md'), 'Course Syllabus (Spring)')
+        self.assertIsNone(self.registry.find_local_file('quizzes/Week 2/index.md'))
+
+    def test_find_existing_matches_whole_path_parts(self):
+        self.write('quizzes/Week 10/index.md', 'quiz', 'Week 10 Quiz')
+        self.write('quizzes/Week 1/index.md.bak', None, None, "Backup")
+        self.write('old/quizzes/Week 1/index.md', 'quiz', 'Week 1 Quiz')
+        self.assertEqual(self.find('Week 1', folder_file='index', top_directories=['quizzes']),
+                         os.path.join('quizzes', 'Week 1', 'index.md'))
+        with self.assertRaises(WaltzAmbiguousResource) as context:
+            self.find('Week 1', folder_file='index')
+        self.assertEqual(len(context.exception.args[0]), 2)
+        with self.assertRaises(FileNotFoundError):
+            self.find('Week', folder_file='index')
+        plan = str(self.registry.db.execute("EXPLAIN QUERY PLAN SELECT path FROM local_files "
+                                            "WHERE suffix_key >= 'a' AND suffix_key < 'b'").fetchall())
+        self.assertIn('idx_local_files_suffix_key', plan)
+
+    def test_written_files_are_indexed(self):
+        self.find('Syllabus')
+        self.local.write('pages/Office Hours.md', "---\nwaltz:\n  title: Office Hours\n---\n")
+        self.assertEqual(self.find('Office Hours', check_front_matter=True, folder_file='missing'),
+                         os.path.join('pages', 'Office Hours.md'))
+
+    def test_list_reads_the_index(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.local.list(self.registry, SimpleNamespace(category=None))
+        lines = output.getvalue().splitlines()[2:]
+        self.assertEqual([line.split()[0] for line in lines], ['[page]', '[invalid]', '[quiz]', '[quiz]'])
+
+    def test_list_stops_reading_at_the_closing_line(self):
+        # A full read of this file would fail to decode the bytes after the body
+        with open('pages/Huge.md', 'wb') as markdown_file:
+            markdown_file.write(b"---\nwaltz:\n  resource: page\n  title: Huge Page\n---\n")
+            markdown_file.write(b"Body\n" * 20000 + b"\xff\xfe\n")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.local.list(self.registry, SimpleNamespace(category='page'))
+        self.assertIn("Huge Page", output.getvalue())
+        # Only searching needs the whole file, and it has not happened yet
+        content_hash, = self.registry.db.execute("SELECT content_hash FROM local_files WHERE path = ?",
+                                                 (os.path.abspath('pages/Huge.md'),)).fetchone()
+        self.assertIsNone(content_hash)
+        self.local.refresh_search_index(self.registry)
+        self.assertEqual([result.title for result in self.registry.search('page', 'huge')], ['Huge Page'])
+
+    def test_parallel_scan_matches_serial_scan(self):
+        for index in range(40):
+            self.write('bank/Question {}.md'.format(index), 'quiz question', 'Question {}'.format(index))
+        paths = sorted(os.path.abspath(os.path.join(directory, name))
+                       for directory, _, names in os.walk('.') for name in names if not name.startswith('.'))
+        serial = self.local.describe_files(paths)
+        self.addCleanup(setattr, local_module, 'PARALLEL_SCAN_MINIMUM', local_module.PARALLEL_SCAN_MINIMUM)
+        local_module.PARALLEL_SCAN_MINIMUM = 10
+        self.described.clear()
+        with mock.patch('os.cpu_count', return_value=4):
+            self.assertEqual(self.local.describe_files(paths), serial)
+        # The Markdown files were all described by other processes
+        self.assertEqual(self.described, [])
+
+    def test_front_matter_is_read_without_the_body(self):
+        with open('long.md', 'w') as markdown_file:
+            markdown_file.write("---\nwaltz:\n  title: Long\n---\n" + "Body\n" * 100000)
+        self.assertEqual(read_front_matter('long.md'), "waltz:\n  title: Long\n")
+        self.assertEqual(read_waltz_front_matter('long.md'), {'title': 'Long'})
+        with open('unclosed.md', 'w') as markdown_file:
+            markdown_file.write("---\nwaltz:\n  title: Unclosed\n")
+        self.assertEqual(read_front_matter('unclosed.md'), "")
+
+    def test_read_only_decoding_matches_round_trip(self):
+        text = ("---\nauthor: acbart\nwaltz:\n  title: No\n  resource: quiz question\n  points: 010\n"
+                "  duration: 1:30\n  shuffle: on\n  published: true\n  weight: 0.5\n  mask: 0o17\n"
+                "  answers:\n  - correct: Yes # a comment\n---\nThe body\n")
+        regular, waltz, body = extract_front_matter(text)
+        self.assertEqual(decode_front_matter(text), (regular, waltz, body))
+        self.assertEqual(decode_front_matter(text)[1]['title'], 'No')
+        self.assertEqual(decode_front_matter("No front matter"), ({}, {}, "No front matter"))
+
+
+class TestLocalWatch(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.local = self.registry.get_service('local')
+        self.write('Week 1 Quiz/index.md', "waltz:\n  resource: quiz\n  title: Week 1 Quiz\n"
+                                           "  questions:\n  - First\n  - group: Pool\n    questions:\n    - Second\n")
+        self.write('Week 2 Quiz/index.md', "waltz:\n  resource: quiz\n  title: Week 2 Quiz\n"
+                                           "  questions:\n  - Second\n")
+        self.write('Syllabus.md', "waltz:\n  resource: page\n  title: Syllabus\n")
+
+    def write(self, path, front_matter):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as markdown_file:
+            markdown_file.write("---\n{}---\nBody\n".format(front_matter))
+
+    def write_question(self, title):
+        self.write('Week 1 Quiz/{}.md'.format(title), "waltz:\n  resource: quiz question\n  title: {}\n".format(title))
+
+    def watch(self, poll):
+        pushes = []
+        self.local.push = lambda registry, category, title, args: pushes.append((category, title))
+
+        def save_questions():
+            time.sleep(0.2)
+            for title in ('First', 'Second'):
+                self.write_question(title)
+
+        writer = threading.Thread(target=save_questions)
+        writer.start()
+        deadline = time.monotonic() + 10
+        args = SimpleNamespace(push=True, poll=poll, interval=0.1, debounce=0.3, banks=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.local.watch(self.registry, args, lambda: pushes or time.monotonic() > deadline)
+        writer.join()
+        return pushes
+
+    def test_question_saves_are_coalesced_into_quiz_pushes(self):
+        for poll in (True, False):
+            with self.subTest(poll=poll):
+                self.assertEqual(self.watch(poll), [('quiz', 'Week 1 Quiz'), ('quiz', 'Week 2 Quiz')])
+        self.assertEqual(self.registry.find_local_file('Week 1 Quiz/First.md').resource, 'quiz question')
+
+    def test_saved_pages_are_really_pushed(self):
+        uploads = []
+
+        def page(handler, url, query, body):
+            uploads.append((handler.command, url.path, parse_qs(body.decode('utf8'))))
+            return 200, {}, {'url': 'syllabus', 'title': 'Syllabus'}
+
+        with FakeCanvas({"/api/v1/courses/1/pages/*": page}) as canvas:
+            service = Canvas('canvas', {'base': canvas.base, 'token': 'token', 'course': '1'})
+            self.registry.configure_service(service)
+            self.addCleanup(service.api.close)
+
+            def save_page():
+                time.sleep(0.2)
+                self.write('Syllabus.md', "waltz:\n  resource: page\n  title: Syllabus\n  published: true\n")
+
+            writer = threading.Thread(target=save_page)
+            writer.start()
+            deadline = time.monotonic() + 10
+            args = SimpleNamespace(push=True, poll=True, interval=0.1, debounce=0.3, banks=None)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.local.watch(self.registry, args, lambda: uploads or time.monotonic() > deadline)
+            writer.join()
+        self.assertIn("Pushed page 'Syllabus'", output.getvalue())
+        (command, path, form), = uploads
+        self.assertEqual((command, path), ('PUT', '/api/v1/courses/1/pages/Syllabus'))
+        self.assertEqual(form['wiki_page[title]'], ['Syllabus'])
+        self.assertEqual(form['wiki_page[published]'], ['True'])
+        self.assertIn('<p>Body</p>', form['wiki_page[body]'][0])
+        self.assertEqual(self.registry.find_remote_id('canvas', 'page', 'Syllabus'), 'syllabus')
+
+    def test_watchers_notice_new_directories(self):
+        for watcher in (InotifyWatcher(self.directory.name), PollingWatcher(self.directory.name, 0.01)):
+            with self.subTest(watcher=type(watcher).__name__):
+                os.makedirs('{} Bank'.format(type(watcher).__name__))
+                path = os.path.abspath('{} Bank/Third.md'.format(type(watcher).__name__))
+                self.write(path, "waltz:\n  title: Third\n")
+                changes = set()
+                deadline = time.monotonic() + 5
+                while path not in changes and time.monotonic() < deadline:
+                    changes |= watcher.changes(0.1)
+                self.assertIn(path, changes)
+                watcher.close()
+
+    def test_bursts_are_debounced(self):
+        class ScriptedWatcher:
+            script = [{'a'}, {'b'}, set(), {'c'}, set()]
+
+            def changes(self, timeout):
+                time.sleep(0.01)
+                return self.script.pop(0) if self.script else set()
+
+        batches = []
+        watch_changes(ScriptedWatcher(), 0, batches.append, lambda: len(batches) == 2)
+        self.assertEqual(batches, [{'a', 'b'}, {'c'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from fake_canvas import FakeCanvas
+from waltz.registry import Registry
+from waltz.resources.quiz import Quiz
+from waltz.services.canvas.canvas import Canvas
+
+COURSE_PATH = "/api/v1/courses/1/"
+
+
+class FakeQuizCanvas(FakeCanvas):
+    """ Just enough of the Canvas quiz endpoints to exercise uploads. """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.next_id = 100
+        self.mutations = []
+        self.routes[COURSE_PATH + "quizzes/*"] = self.handle
+
+    def handle(self, handler, url, query, body):
+        form = {key: values[0] for key, values in parse_qs(body.decode('utf8')).items()}
+        parts = url.path[len(COURSE_PATH):].strip("/").split("/")
+        with self.lock:
+            self.next_id += 1
+            new_id = self.next_id
+            self.mutations.append((handler.command, parts, form))
+        if handler.command == 'DELETE':
+            return 200, {}, {}
+        if parts[-1] == 'groups' or (len(parts) == 4 and parts[2] == 'groups'):
+            group_id = int(parts[3]) if len(parts) == 4 else new_id
+            return 200, {}, {'quiz_groups': [{'id': group_id, 'name': form['quiz_groups[][name]']}]}
+        if parts[-1] == 'questions' or (len(parts) == 4 and parts[2] == 'questions'):
+            question_id = int(parts[3]) if len(parts) == 4 else new_id
+            return 200, {}, {'id': question_id, 'question_name': form['question[question_name]']}
+        return 200, {}, {'id': 1, 'title': form.get('quiz[title]')}
+
+
+def make_question(name, group=None):
+    return {'question_name': name, 'question_type': 'essay_question', 'question_text': name,
+            'points_possible': 1, 'correct_comments_html': '', 'incorrect_comments_html': '',
+            'neutral_comments_html': '', 'quiz_group_id': group}
+
+
+def make_quiz(questions, groups):
+    return {'title': 'Exam', 'description': '', 'quiz_type': 'assignment',
+            'questions': questions, 'groups': groups}
+
+
+class TestQuizUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.canvas = FakeQuizCanvas().__enter__()
+        self.registry = Registry.init(self.directory.name)
+        self.service = Canvas('canvas', {'base': self.canvas.base, 'token': 'token', 'course': '1'})
+        self.registry.configure_service(self.service)
+        self.args = SimpleNamespace(service='canvas')
+
+    def tearDown(self):
+        self.service.api.close()
+        self.registry.db.close()
+        self.canvas.__exit__(None, None, None)
+        self.directory.cleanup()
+
+    def test_upload_new_creates_groups_before_questions(self):
+        groups = {'Pool': {'name': 'Pool', 'pick_count': 1, 'question_points': 2}}
+        questions = [make_question("Q{}".format(index), 'Pool' if index % 2 else None) for index in range(20)]
+        Quiz.upload_new(self.registry, make_quiz(questions, groups), self.args)
+        verbs = [(verb, parts[-1]) for verb, parts, _ in self.canvas.mutations]
+        self.assertEqual(verbs[:2], [('POST', 'quizzes'), ('POST', 'groups')])
+        uploaded = {form['question[question_name]']: form for _, parts, form in self.canvas.mutations[2:]}
+        self.assertEqual(len(uploaded), 20)
+        for index in range(20):
+            question = uploaded["Q{}".format(index)]
+            self.assertEqual(question['question[position]'], str(index + 1))
+            self.assertEqual(question.get('question[quiz_group_id]'), '102' if index % 2 else None)
+
+    def test_upload_edit_updates_and_deletes(self):
+        old_quiz = dict(make_quiz([dict(make_question("Keep"), id=7), dict(make_question("Stale"), id=8)], {}),
+                        id=1, title="Old Exam")
+        new_quiz = make_quiz([make_question("New"), make_question("Keep")], {})
+        Quiz.upload_edit(self.registry, old_quiz, new_quiz, self.args)
+        mutations = [(verb, "/".join(parts)) for verb, parts, _ in self.canvas.mutations]
+        self.assertEqual(mutations[0], ('PUT', 'quizzes/1'))
+        self.assertEqual(sorted(mutations[1:3]), [('POST', 'quizzes/1/questions'), ('PUT', 'quizzes/1/questions/7')])
+        self.assertEqual(mutations[3:], [('DELETE', 'quizzes/1/questions/8')])
+
+    def test_upload_edit_skips_unchanged_questions(self):
+        groups = {'Pool': {'name': 'Pool', 'pick_count': 1, 'question_points': 2}}
+        remote_questions = [dict(make_question("Q{}".format(index)), id=index, position=index + 1,
+                                 points_possible=1.0)
+                            for index in range(200)]
+        old_quiz = dict(make_quiz(remote_questions, {5: dict(groups['Pool'], id=5, pick_count=1.0)}), id=1)
+        new_questions = [make_question("Q{}".format(index)) for index in range(200)]
+        new_questions[42]['question_text'] = "Fixed a typo"
+        Quiz.upload_edit(self.registry, old_quiz, make_quiz(new_questions, groups), self.args)
+        mutations = [(verb, "/".join(parts)) for verb, parts, _ in self.canvas.mutations]
+        self.assertEqual(mutations, [('PUT', 'quizzes/1/questions/42')])
+
+    def test_upload_edit_keeps_small_edits(self):
+        remote_questions = [dict(make_question(name), id=index, position=index + 1, points_possible=1.0)
+                            for index, name in enumerate(["Q0", "Q1", "Q2", "Q3"])]
+        remote_questions[1]['question_text'] = "Answer 010"
+        remote_questions[3]['question_type'] = 'unknown_question'
+        old_quiz = dict(make_quiz(remote_questions, {}), id=1)
+        new_questions = [make_question("Q{}".format(index)) for index in range(4)]
+        new_questions[0]['question_text'] = "Q0 "
+        new_questions[1]['question_text'] = "Answer 10"
+        new_questions[2]['question_text'] = "Q2\r\n"
+        remote_questions[2]['question_text'] = "Q2\n"
+        Quiz.upload_edit(self.registry, old_quiz, make_quiz(new_questions, {}), self.args)
+        mutations = sorted("/".join(parts) for verb, parts, _ in self.canvas.mutations)
+        self.assertEqual(mutations, ['quizzes/1/questions/0', 'quizzes/1/questions/1', 'quizzes/1/questions/3'])
+
+
+class TestQuizFind(unittest.TestCase):
+
+    def test_find_is_memoized_per_quiz(self):
+        questions = [{'id': index, 'quiz_group_id': 10 + index % 3} for index in range(6)]
+        routes = {COURSE_PATH + "quizzes/": [{'id': 1, 'title': 'Exam'}],
+                  COURSE_PATH + "quizzes/1": {'id': 1, 'title': 'Exam'},
+                  COURSE_PATH + "quizzes/1/questions/": questions,
+                  COURSE_PATH + "quizzes/1/groups/*": {'name': 'Pool'}}
+        with FakeCanvas(routes) as canvas:
+            service = Canvas('canvas', {'base': canvas.base, 'token': 'token', 'course': '1'})
+            quiz = Quiz.find(service, 'Exam')
+            quiz['questions'].clear()
+            self.assertEqual(len(Quiz.find(service, 'Exam')['questions']), 6)
+            self.assertIsNone(Quiz.find(service, 'Missing'))
+            self.assertEqual(len(canvas.requests), 1 + 1 + 1 + 3 + 1)
+            # The next command asks Canvas again, in case the quiz was changed there
+            routes[COURSE_PATH + "quizzes/1"] = {'id': 1, 'title': 'Exam', 'description': 'Edited'}
+            service.start_command()
+            self.assertEqual(Quiz.find(service, 'Exam')['description'], 'Edited')
+            service.api.close()
+        self.assertEqual(sorted(quiz['groups']), [10, 11, 12])
+
+
+if __name__ == '__main__':
+    unittest.main()
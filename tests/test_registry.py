@@ -0,0 +1,305 @@
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from waltz.command_line import parse_command_line
+from waltz.exceptions import WaltzException, WaltzResourceNotFound, WaltzAmbiguousResource
+from waltz.registry import Registry
+from waltz.services.canvas.canvas import Canvas
+from waltz_test_case import WaltzTestCase
+
+
+class TestRegistryWrites(WaltzTestCase):
+
+    def other_connection_count(self):
+        db = sqlite3.connect(Registry.get_waltz_database_path(self.directory.name))
+        count, = db.execute("SELECT COUNT(*) FROM resources").fetchone()
+        db.close()
+        return count
+
+    def test_database_uses_wal(self):
+        mode, = self.registry.db.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode, 'wal')
+
+    def test_store_resources_in_one_transaction(self):
+        rows = [('canvas', 'page', 'Page {}'.format(index), '', '{}') for index in range(100)]
+        with self.registry.transaction():
+            self.registry.store_resources(rows[:50])
+            with self.registry.transaction():
+                for row in rows[50:]:
+                    self.registry.store_resource(*row)
+            self.assertEqual(self.other_connection_count(), 0)
+        self.assertEqual(self.other_connection_count(), 100)
+        self.assertEqual(len(self.registry.find_all_resources('canvas', 'page')), 100)
+
+    def test_failed_transaction_rolls_back(self):
+        with self.assertRaises(ValueError):
+            with self.registry.transaction():
+                self.registry.store_resource('canvas', 'page', 'Syllabus', '', '{}')
+                raise ValueError()
+        with self.assertRaises(WaltzResourceNotFound):
+            self.registry.find_resource('canvas', 'page', 'Syllabus')
+        self.registry.store_resource('canvas', 'page', 'Syllabus', '', '{}')
+        self.assertEqual(self.other_connection_count(), 1)
+
+    def test_data_is_compressed(self):
+        quiz = json.dumps({'title': 'Exam', 'questions': [
+            {'question_name': 'Q{}'.format(index), 'question_type': 'essay_question',
+             'question_text': '<p>Explain step {} of the algorithm.</p>'.format(index),
+             'quiz_group_id': None, 'points_possible': 1.0} for index in range(100)]})
+        autograder = b'PK\x03\x04' + bytes(range(256))
+        self.registry.store_resources([('canvas', 'quiz', 'Exam', '', quiz),
+                                       ('gradescope', 'gradescope_assignment', 'Lab', '', autograder)])
+        self.assertEqual(self.registry.find_resource('canvas', 'quiz', 'Exam').data, quiz)
+        self.assertEqual(self.registry.find_resource('gradescope', 'gradescope_assignment', 'Lab').data,
+                         autograder)
+        stored, codec, size = self.registry.db.execute("SELECT LENGTH(data), codec, size FROM resources "
+                                                       "WHERE title = 'Exam'").fetchone()
+        self.assertEqual((codec, size), ('zlib-1', len(quiz)))
+        self.assertLess(stored * 5, len(quiz))
+
+
+class TestRegistryLoading(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry.close()
+
+    def test_database_opens_lazily(self):
+        registry = Registry.load(self.directory.name)
+        self.assertIsNone(registry._db)
+        self.assertEqual(registry.find_all_resources('canvas', 'page'), [])
+        self.assertIsNotNone(registry._db)
+        registry.close()
+
+    def test_list_shares_one_registry_without_the_database(self):
+        registry = parse_command_line(['--waltz_directory', self.directory.name, 'list'])
+        self.assertIsNone(registry._db)
+        self.assertIsNotNone(registry.get_service('local'))
+
+
+class TestRegistryLookups(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry.store_resources([('canvas', 'page', 'Lesson {}'.format(index), str(index), '{}')
+                                       for index in range(30)] +
+                                      [('blockpy', 'problem', 'Lesson 1', 'problem-1', '{}'),
+                                       ('canvas', 'page', '100%_Done', 'done', '{}')])
+
+    def plan(self, **terms):
+        queries = []
+        self.registry.db.set_trace_callback(queries.append)
+        self.registry.query_resources(**terms).fetchall()
+        self.registry.db.set_trace_callback(None)
+        return str(self.registry.db.execute("EXPLAIN QUERY PLAN " + queries[-1]).fetchall())
+
+    def test_ambiguity_and_absence(self):
+        with self.assertRaises(WaltzAmbiguousResource) as context:
+            self.registry.find_resource(title='Lesson 1')
+        self.assertEqual(len(context.exception.args[0]), 2)
+        self.assertEqual(self.registry.find_resource(service='canvas', title='Lesson 1').disambiguate, '1')
+        with self.assertRaises(WaltzResourceNotFound):
+            self.registry.find_resource(service='canvas', title='Lesson 99')
+
+    def test_case_insensitive_and_prefix_titles(self):
+        self.assertEqual(self.registry.find_resource('canvas', 'page', 'LESSON 7', ignore_case=True).title,
+                         'Lesson 7')
+        self.assertEqual([resource.title for resource in self.registry.iter_resources(title='lesson 2', prefix=True)],
+                         ['Lesson 2'] + ['Lesson {}'.format(index) for index in range(20, 30)])
+        # LIKE wildcards in the title are taken literally
+        self.assertEqual(self.registry.find_resource(title='100%_', prefix=True).disambiguate, 'done')
+        with self.assertRaises(WaltzResourceNotFound):
+            self.registry.find_resource(title='100_', prefix=True)
+
+    def test_lookups_use_indexes(self):
+        self.assertIn('idx_resource_disambiguate', self.plan(disambiguate='7'))
+        self.assertIn('idx_resource_title_nocase', self.plan(title='lesson 7', ignore_case=True))
+        self.assertIn('idx_resource_title_nocase', self.plan(title='lesson', prefix=True))
+        self.assertIn('USING INDEX', self.plan(service='canvas', category='page'))
+
+    def test_remote_references_are_per_resource(self):
+        self.assertTrue(self.registry.store_remote_reference('canvas', 'page', 'Lesson 1', 'lesson-one',
+                                                             remote_url='https://canvas/pages/lesson-one',
+                                                             disambiguate='1'))
+        self.assertEqual(self.registry.find_remote_id('canvas', 'page', 'Lesson 1', '1'), 'lesson-one')
+        self.assertIsNone(self.registry.find_remote_id('canvas', 'page', 'Lesson 2', '2'))
+        url, = self.registry.db.execute("SELECT remote_url FROM resources WHERE disambiguate = '1'").fetchone()
+        self.assertEqual(url, 'https://canvas/pages/lesson-one')
+        # Nothing is stored for a resource the registry has never seen
+        self.assertFalse(self.registry.store_remote_reference('canvas', 'page', 'Lesson 1', 'lesson-one'))
+        self.assertIsNone(self.registry.find_remote_id('canvas', 'page', 'Lesson 1'))
+        self.registry.forget_remote_reference('canvas', 'page', 'Lesson 1', '1')
+        self.assertIsNone(self.registry.find_remote_id('canvas', 'page', 'Lesson 1', '1'))
+
+
+class TestRegistryMigrations(unittest.TestCase):
+
+    def test_version_1_database_is_migrated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Registry.init(directory).db.close()
+            path = Registry.get_waltz_database_path(directory)
+            os.remove(path)
+            db = sqlite3.connect(path)
+            db.execute("CREATE TABLE resources (service text, category text, title text, "
+                       "disambiguate text, data text)")
+            db.execute("CREATE UNIQUE INDEX idx_resource ON resources(service, category, title, disambiguate)")
+            db.execute("INSERT INTO resources VALUES ('canvas', 'page', 'Syllabus', '', '{}')")
+            db.commit()
+            db.close()
+            registry = Registry.load(directory)
+            version, = registry.db.execute("PRAGMA user_version").fetchone()
+            self.assertEqual(version, 9)
+            registry.store_remote_reference('canvas', 'page', 'Syllabus', 'syllabus', remote_updated_at='now')
+            self.assertEqual(registry.find_remote_id('canvas', 'page', 'Syllabus'), 'syllabus')
+            self.assertEqual(registry.find_remote_versions('canvas', 'page'), {'syllabus': 'now'})
+            content_hash, size, codec = registry.db.execute("SELECT content_hash, size, codec "
+                                                            "FROM resources").fetchone()
+            self.assertEqual((content_hash, size, codec), (Registry.hash_data('{}'), 2, 'text'))
+            self.assertEqual(registry.find_resource('canvas', 'page', 'Syllabus').data, '{}')
+            plan = registry.db.execute("EXPLAIN QUERY PLAN SELECT remote_id, remote_updated_at FROM resources "
+                                       "WHERE service = 'canvas' AND category = 'page' "
+                                       "AND remote_id IS NOT NULL").fetchall()
+            self.assertIn('idx_resource_remote_id', str(plan))
+            self.assertEqual(registry.db.execute("SELECT title FROM search_index").fetchall(), [('Syllabus',)])
+            registry.db.close()
+
+    def test_old_sqlite_is_refused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch('sqlite3.sqlite_version_info', (3, 22, 0)):
+                with self.assertRaisesRegex(WaltzException, "SQLite 3.25.0 or newer"):
+                    Registry.init(directory)
+
+
+class TestRegistryHistory(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.key = ('canvas', 'page', 'Syllabus')
+
+    def make_page(self, revision):
+        return json.dumps({'title': 'Syllabus', 'body': "".join("<p>Week {}: {}</p>".format(
+            week, "Exam" if week == revision % 15 else "Reading") for week in range(15))})
+
+    def pull(self, data):
+        self.registry.store_resource(*self.key, '', data)
+        self.registry.record_versions([self.key + ('', data)])
+
+    def test_versions_are_deltas_and_bounded(self):
+        pages = [self.make_page(revision) for revision in range(30)]
+        for page in pages:
+            self.pull(page)
+            self.pull(page)
+        versions = self.registry.find_versions(*self.key)
+        self.assertEqual([version for version, _, _, _ in versions], list(range(11, 31)))
+        for version, _, _, _ in versions:
+            self.assertEqual(self.registry.load_version(*self.key, version), pages[version - 1])
+        deltas, full_copies = self.registry.db.execute(
+            "SELECT COUNT(base_hash), COUNT(*) - COUNT(base_hash) FROM history_contents").fetchone()
+        self.assertEqual(deltas + full_copies, 15)
+        self.assertGreater(deltas, full_copies)
+
+    def test_restore_and_prune(self):
+        for revision in range(5):
+            self.pull(self.make_page(revision))
+        self.registry.restore_version(*self.key, 2)
+        self.assertEqual(self.registry.find_resource(*self.key).data, self.make_page(1))
+        self.assertEqual(self.registry.prune_history(*self.key, max_versions=2), 3)
+        self.assertEqual([row[0] for row in self.registry.find_versions(*self.key)], [4, 5])
+        self.assertEqual(self.registry.load_version(*self.key, 5), self.make_page(4))
+        count, = self.registry.db.execute("SELECT COUNT(*) FROM history_contents").fetchone()
+        self.assertEqual(count, 2)
+        # The latest version is kept, however old it is
+        self.assertEqual(self.registry.prune_history(max_age_days=-1), 1)
+        self.assertEqual(self.registry.load_version(*self.key, 5), self.make_page(4))
+
+    def test_latest_version_is_always_kept(self):
+        for revision in range(3):
+            self.pull(self.make_page(revision))
+        self.assertEqual(self.registry.prune_history(*self.key, max_versions=0), 2)
+        self.assertEqual([row[0] for row in self.registry.find_versions(*self.key)], [3])
+        for arguments in (['--keep', '0'], ['--diff', '1', '2', '3']):
+            with self.subTest(arguments=arguments):
+                with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                    parse_command_line(['--waltz_directory', self.directory.name, 'history', 'page', 'Syllabus',
+                                        *arguments])
+
+    def test_history_command_with_just_a_title(self):
+        self.registry.configure_service(Canvas('canvas', {'base': 'https://example.edu/', 'token': 'token',
+                                                          'course': '1'}))
+        self.registry.save_to_file()
+        for revision in range(3):
+            self.pull(self.make_page(revision))
+        for resource in (['Syllabus'], ['page', 'Syllabus']):
+            with self.subTest(resource=resource):
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    parse_command_line(['--waltz_directory', self.directory.name, 'history', *resource])
+                self.assertEqual([line.split()[0] for line in output.getvalue().splitlines()[2:]],
+                                 ['1', '2', '3'])
+
+
+class TestRegistrySearch(WaltzTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry.configure_service(Canvas('canvas', {'base': 'https://canvas.example.edu/', 'token': 'token',
+                                                          'course': '1'}))
+        self.registry.save_to_file()
+        self.registry.store_resources([
+            ('canvas', 'quiz', 'Week 5 Quiz', '', json.dumps({
+                'title': 'Week 5 Quiz', 'description': '<p>Functions calling themselves</p>',
+                'questions': [{'question_text': '<p>What does this <b>recursive</b> function return?</p>',
+                               'answers': [{'text': 'A stack overflow'}]}]})),
+            ('canvas', 'quiz', 'Week 6 Quiz', '', json.dumps({'title': 'Week 6 Quiz', 'questions': []})),
+            ('canvas', 'page', 'Recursion Notes', '', json.dumps({'title': 'Recursion Notes', 'body': ''}))])
+        self.path = os.path.abspath('recursion.md')
+        self.write_quiz("Recursion Practice", "Base cases first.")
+
+    def write_quiz(self, title, body):
+        with open(self.path, 'w') as quiz_file:
+            quiz_file.write("---\nwaltz:\n  resource: quiz\n  title: {}\n---\n{}\n".format(title, body))
+
+    def titles(self, query):
+        return [result.title for result in self.registry.search('quiz', query)]
+
+    def test_search_ranks_titles_first(self):
+        self.assertEqual(self.titles("recursion"), ["Recursion Practice", "Week 5 Quiz"])
+        result = self.registry.search('quiz', "overflow")[0]
+        self.assertEqual((result.service, result.title), ('canvas', 'Week 5 Quiz'))
+        self.assertIn('[overflow]', result.snippet)
+
+    def test_search_follows_changes(self):
+        self.registry.store_resource('canvas', 'quiz', 'Week 6 Quiz', '', json.dumps({'title': 'Week 6 Quiz',
+                                                                                       'description': 'Recursion!'}))
+        self.write_quiz("Loops Practice", "While loops.")
+        self.assertEqual(sorted(self.titles("recursion")), ["Week 5 Quiz", "Week 6 Quiz"])
+        self.assertEqual(self.titles("loop*"), ["Loops Practice"])
+        os.remove(self.path)
+        self.assertEqual(self.titles("loops"), [])
+
+    def test_search_only_rereads_changed_files(self):
+        self.titles("recursion")
+        stamp = self.registry.db.execute("SELECT id, mtime_ns FROM local_files").fetchall()
+        self.titles("recursion")
+        self.assertEqual(self.registry.db.execute("SELECT id, mtime_ns FROM local_files").fetchall(), stamp)
+
+    def test_search_command(self):
+        self.registry.close()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            parse_command_line(['search', 'quiz', 'recursion', '--service', 'canvas']).close()
+        self.assertEqual(output.getvalue().splitlines()[0], "[quiz] Week 5 Quiz (canvas)")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            parse_command_line(['search', 'quiz', 'practice']).close()
+        self.assertEqual(output.getvalue().splitlines()[0], "[quiz] Recursion Practice (./: recursion.md)")
+
+
+if __name__ == '__main__':
+    unittest.main()
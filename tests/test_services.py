@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from fake_canvas import FakeCanvas
+from waltz.command_line import parse_command_line
+from waltz.registry import Registry
+from waltz.services.blockpy.blockpy import BlockPy
+from waltz.services.canvas.canvas import Canvas
+from waltz.services.gradescope.gradescope import GradeScope
+
+COURSE_PATH = "/api/v1/courses/1/"
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ['requests', 'markdown', 'bs4', 'html2text', 'frontmatter', 'tabulate', 'natsort']
+
+
+class TestLazyServices(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+        self.canvas = FakeCanvas({COURSE_PATH + "pages/": [{'url': 'syllabus', 'title': 'Syllabus'}],
+                                  COURSE_PATH + "pages/syllabus": {'url': 'syllabus', 'title': 'Syllabus',
+                                                                   'body': '<p>Hello</p>', 'published': True}})
+        self.blockpy = FakeCanvas({"/api/*": {}})
+        for server in (self.canvas, self.blockpy):
+            server.__enter__()
+            self.addCleanup(server.__exit__, None, None, None)
+        registry = parse_command_line(['init'])
+        registry.configure_service(Canvas('course', {'base': self.canvas.base, 'token': 'token', 'course': '1'}))
+        registry.configure_service(BlockPy('problems', {'base': self.blockpy.base, 'email': 'me@example.edu',
+                                                        'password': 'secret'}))
+        registry.configure_service(GradeScope('autograders', {'email': 'me@example.edu', 'password': 'secret',
+                                                              'course': '1'}))
+        registry.save_to_file()
+        registry.close()
+
+    def test_canvas_command_leaves_other_services_alone(self):
+        registry = parse_command_line(['download', 'course', 'page', 'Syllabus'])
+        self.assertEqual(registry.find_resource('course', 'page', 'Syllabus').title, 'Syllabus')
+        self.assertGreater(len(self.canvas.requests), 0)
+        self.assertEqual(self.blockpy.requests, [])
+        self.assertIsNone(registry.get_service('problems')._api)
+        self.assertIsNone(registry.get_service('autograders')._api)
+        registry.get_service('course').api.close()
+        registry.close()
+
+    def test_loading_does_not_connect(self):
+        registry = Registry.load(self.directory.name)
+        for services in registry.services.values():
+            for service in services:
+                self.assertIsNone(service._api)
+        registry.close()
+
+
+class TestDeferredImports(unittest.TestCase):
+
+    def imported_by(self, code, modules=HEAVY_MODULES):
+        output = subprocess.run([sys.executable, '-c', code + "\nimport sys\n"
+                                 "print(' '.join(sorted(name for name in {!r} if name in sys.modules)))".format(
+                                     modules)],
+                                cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT), check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        return output.split()
+
+    def test_command_line_imports_no_plugins(self):
+        self.assertEqual(self.imported_by("import waltz.command_line", HEAVY_MODULES + ['ruamel']), [])
+
+    def test_listing_local_services_imports_no_plugins(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Registry.init(directory).close()
+            self.assertEqual(self.imported_by("from waltz.registry import Registry\n"
+                                              "Registry.load({!r}).close()".format(directory)), [])
+
+    def test_resource_categories_load_on_demand(self):
+        from waltz.resources.quiz import Quiz
+        self.assertIs(Registry.get_resource_category('quizzes'), Quiz)
+        self.assertIs(Canvas.get_resource_base('quiz'), Quiz)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+"""
+A base class for tests that need a real Waltz directory to work in.
+"""
+import os
+import tempfile
+import unittest
+
+from waltz.command_line import parse_command_line
+
+
+class WaltzTestCase(unittest.TestCase):
+    """
+    Runs each test inside a fresh temporary directory (which is also the working
+    directory), after a ``waltz init`` there. Its registry is ``self.registry``.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+        self.registry = parse_command_line(['init'])
+        self.addCleanup(self.registry.close)
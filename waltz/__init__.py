@@ -1 +0,0 @@
-import waltz.services
\ No newline at end of file
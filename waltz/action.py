@@ -1,18 +1,19 @@
 import logging
+import os
 from waltz import defaults
-from waltz.services.local import Local
 from waltz.registry import Registry
 from waltz.services.service import Service
-from waltz.tools import extract_front_matter
+from waltz.tools.front_matter import read_waltz_front_matter
 
 
-def handle_registry(args, registry):
+def handle_registry(args, registry=None):
     if registry is None:
-        return Registry.load(args.registry_path)
+        registry = Registry.load(args.waltz_directory, use_cache=not args.no_cache)
+    registry.start_command()
     return registry
 
 
-def Init(args):
+def Init(args, registry=None):
     if Registry.exists(args.directory):
         logging.warning("Existing Waltz registry in this directory.")
         if args.overwrite:
@@ -20,28 +21,29 @@ def Init(args):
         else:
             return Registry.load(args.directory)
     registry = Registry.init(args.directory)
+    Local = defaults.get_service_type('local')
     registry.configure_service(Local(args.directory, {'path': args.directory}))
     registry.save_to_file()
     return registry
 
 
-def Reset(args):
-    registry = Registry.load(args.waltz_directory)
+def Reset(args, registry=None):
+    registry = handle_registry(args, registry)
     registry.reset_database()
     registry.save_to_file()
     return registry
 
 
-def Configure(args):
-    registry = Registry.load(args.waltz_directory)
+def Configure(args, registry=None):
+    registry = handle_registry(args, registry)
     new_service = Service.from_type(args.type).configure(args)
     registry.configure_service(new_service)
     registry.save_to_file()
     return registry
 
 
-def List(args):
-    registry = Registry.load(args.waltz_directory)
+def List(args, registry=None):
+    registry = handle_registry(args, registry)
     if not args.service:
         print("The following services are available:")
         for service_type, services in registry.services.items():
@@ -57,7 +59,7 @@ def List(args):
     return registry
 
 
-def Download(args):
+def Download(args, registry=None):
     """
     > waltz download --filename for_loops.md
     > waltz download "Programming 37: For Loops"
@@ -75,25 +77,25 @@ def Download(args):
     > waltz download --all
 
     """
-    registry = Registry.load(args.waltz_directory)
+    registry = handle_registry(args, registry)
     resource_category = registry.guess_resource_category(args)
     resource_category.download(registry, args)
     return registry
 
 
-def Upload(args):
+def Upload(args, registry=None):
     """
     > waltz upload "Programming 37: For Loops"
         If service/category not in registry database,
         Then we can go ask all the services if they already know about
         this thing.
     """
-    registry = Registry.load(args.waltz_directory)
+    registry = handle_registry(args, registry)
     resource_category = registry.guess_resource_category(args)
     resource_category.upload(registry, args)
 
 
-def Encode(args):
+def Encode(args, registry=None):
     """
     > waltz encode "Programming 37: For Loops"
     > waltz encode canvas assignment "Programming 37: For Loops"
@@ -102,18 +104,18 @@ def Encode(args):
         That might also allow us to infer the Service.
 
     """
-    registry = Registry.load(args.waltz_directory)
+    registry = handle_registry(args, registry)
     resource_category = registry.guess_resource_category(args)
     resource_category.encode(registry, args)
 
 
-def Push(args):
-    registry = Registry.load(args.waltz_directory)
+def Push(args, registry=None):
+    registry = handle_registry(args, registry)
     resource_category = None
     if len(args.resource) == 1:
         local = registry.get_service('local', args.local_service)
         existing_file = local.find_existing(registry, args.resource[0], False, None)
-        _, waltz, _ = extract_front_matter(local.read(existing_file))
+        waltz = read_waltz_front_matter(existing_file)
         if 'resource' in waltz: # TODO: validate resource category
             resource_category = registry.get_resource_category(waltz['resource'])
             args.category = waltz['resource']
@@ -125,25 +127,50 @@ def Push(args):
     resource_category.upload(registry, args)
 
 
-def Pull(args):
-    registry = Registry.load(args.waltz_directory)
+def Pull(args, registry=None):
+    registry = handle_registry(args, registry)
     resource_category = registry.guess_resource_category(args)
     resource_category.download(registry, args)
     resource_category.decode(registry, args)
 
 
-def Decode(args):
-    registry = Registry.load(args.waltz_directory)
+def Decode(args, registry=None):
+    registry = handle_registry(args, registry)
     resource_category = registry.guess_resource_category(args)
     resource_category.decode(registry, args)
 
 
-def Diff(args):
-    registry = Registry.load(args.waltz_directory)
+def Diff(args, registry=None):
+    registry = handle_registry(args, registry)
     resource_category = registry.guess_resource_category(args)
     resource_category.diff(registry, args)
 
 
+def Watch(args, registry=None):
+    """
+    > waltz watch
+    > waltz watch --push
+    """
+    registry = handle_registry(args, registry)
+    local = registry.get_service(args.local_service, 'local')
+    local.watch(registry, args)
+    return registry
+
+
+def History(args, registry=None):
+    """
+    > waltz history page "Syllabus"
+    > waltz history page "Syllabus" --diff 3
+    > waltz history page "Syllabus" --diff 3 5
+    > waltz history page "Syllabus" --restore 3
+    > waltz history page "Syllabus" --keep 5
+    """
+    registry = handle_registry(args, registry)
+    resource_category = registry.guess_resource_category(args)
+    resource_category.history(registry, args)
+    return registry
+
+
 def Search(args, registry=None):
     registry = handle_registry(args, registry)
     # Given service, go immediately find the resource
@@ -152,9 +179,16 @@ def Search(args, registry=None):
     filter_by_services = []
     if args.service:
         filter_by_services.append(args.service)
-    results = registry.search(args.category, args.what, filter_by_services)
+    results = registry.search(args.category, args.what, filter_by_services, args.limit)
+    if not results:
+        print("No matching resources.")
     for result in results:
-        print(result)
+        where = result.service
+        if registry.get_service(result.service).type == 'local':
+            # Local files are indexed by their path
+            where += ": " + os.path.relpath(result.disambiguate)
+        print("[{}] {} ({})".format(result.category, result.title, where))
+        print("\t" + " ".join(result.snippet.split()))
     return registry
 
 
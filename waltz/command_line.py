@@ -42,12 +42,26 @@ from waltz import defaults
 from waltz.registry import Registry
 
 
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not {}".format(value))
+    return value
+
+
 def parse_command_line(args):
-    parser = argparse.ArgumentParser(prog='waltz', description='Sync resources between services for a course')
-    parser.set_defaults(func=lambda args: parser.print_help())
+    global_parser = argparse.ArgumentParser(add_help=False)
+    global_parser.add_argument('--waltz_directory', type=str, default="./",
+                               help="Path to the main waltz directory with the Waltz registry and DB file.")
+    global_parser.add_argument('--no_cache', action='store_true', default=False,
+                               help="Ignore and do not update the local cache of remote (e.g., Canvas) responses.")
+    global_args, command = global_parser.parse_known_args(args)
+    # The registry is loaded at most once, and then shared with the action
+    registry = None
 
-    parser.add_argument('--waltz_directory', type=str, default="./",
-                        help="Path to the main waltz directory with the Waltz registry and DB file.")
+    parser = argparse.ArgumentParser(prog='waltz', description='Sync resources between services for a course',
+                                     parents=[global_parser])
+    parser.set_defaults(func=lambda args, registry=None: parser.print_help())
     subparsers = parser.add_subparsers(help='Available commands')
 
     # Init Waltz
@@ -68,23 +82,26 @@ def parse_command_line(args):
     parser_configure = subparsers.add_parser('configure', help='Configure a new instance of the service.')
     parser_configure_services = parser_configure.add_subparsers(dest='type',
                                                                 help="The type of the service you are configuring.")
-    for name, service_type in defaults.get_service_types().items():
-        service_type.add_parser_configure(parser_configure_services)
+    if command[:1] == ['configure']:
+        # Every type of service is imported to describe its settings, so only do that when configuring
+        for name, service_type in defaults.get_service_types().items():
+            service_type.add_parser_configure(parser_configure_services)
     parser_configure.set_defaults(func=actions.Configure)
 
     # List Services or Resources
     parser_list = subparsers.add_parser('list', help='List available services or resources')
     parser_list_services = parser_list.add_subparsers(dest='service', help="The service to search within.")
-    for name, service_type in defaults.get_service_types().items():
-        service_type.add_parser_list(parser_list_services)
-    registry = Registry.load('./', False)
-    if registry is not None:
-        for name, services in registry.services.items():
-            for service_type in services:
-                service_type.add_parser_list(parser_list_services, service_type.name)
-        # TODO: Make this close more elegant
-        #   It's absolutely needed though, otherwise the DB stays open!
-        registry.db.close()
+    if command[:1] == ['list']:
+        # Only the list command needs to know the configured services while parsing
+        registry = Registry.load(global_args.waltz_directory, False, use_cache=not global_args.no_cache)
+        # A bare `waltz list` just names the services, so their options aren't needed
+        if command[1:]:
+            for name, service_type in defaults.get_service_types().items():
+                service_type.add_parser_list(parser_list_services)
+            if registry is not None:
+                for name, services in registry.services.items():
+                    for service_type in services:
+                        service_type.add_parser_list(parser_list_services, service_type.name)
     parser_list.set_defaults(func=actions.List)
 
     # Show [Course|Service]
@@ -94,6 +111,7 @@ def parse_command_line(args):
     parser_search.add_argument('category', type=str, help="The category of resource to search")
     parser_search.add_argument('what', type=str, help="The resource to download")
     parser_search.add_argument("--service", type=str, help="The specific service to use in case of ambiguity.")
+    parser_search.add_argument("--limit", type=int, default=20, help="The most results to show.")
     parser_search.set_defaults(func=actions.Search)
 
     def add_id_and_url(subparser):
@@ -191,6 +209,37 @@ def parse_command_line(args):
     add_id_and_url(parser_pull)
     parser_pull.set_defaults(func=actions.Pull)
 
+    # History
+    parser_history = subparsers.add_parser('history',
+                                           help='List, compare, or restore previously downloaded versions of a resource.')
+    parser_history.add_argument('resource', nargs='+', type=str, help="The resource to look up. Could be a "
+                                "resource title, or some combination of that and the service and category.")
+    parser_history.add_argument("--service", type=str, help="The specific service to use in case of ambiguity.")
+    parser_history.add_argument("--diff", nargs="+", type=int, metavar="VERSION",
+                                help="Compare an old version with a newer one (by default, the latest). "
+                                     "Takes one or two versions.")
+    parser_history.add_argument("--restore", type=int, metavar="VERSION",
+                                help="Make an old version the current raw resource again.")
+    parser_history.add_argument("--keep", type=positive_int,
+                                help="Throw away all but this many of the most recent versions (at least 1).")
+    add_id_and_url(parser_history)
+    parser_history.set_defaults(func=actions.History)
+
+    # Watch
+    parser_watch = subparsers.add_parser('watch', help='Keep track of local files as they change, and optionally push them.')
+    parser_watch.add_argument("--push", action="store_true", default=False,
+                              help="Encode and upload resources whenever their files are saved.")
+    parser_watch.add_argument("--debounce", type=float, default=0.5,
+                              help="How many seconds to wait for saves to settle down before acting on them.")
+    parser_watch.add_argument("--poll", action="store_true", default=False,
+                              help="Check the files' timestamps instead of relying on inotify.")
+    parser_watch.add_argument("--interval", type=float, default=1.0,
+                              help="How many seconds to wait between checks when polling.")
+    parser_watch.add_argument("--local_service", type=str, help="The specific local service to watch.")
+    parser_watch.add_argument("--banks", nargs="*", type=str,
+                              help="The question bank folders to check.")
+    parser_watch.set_defaults(func=actions.Watch)
+
     # Extract
 
     # Build
@@ -199,7 +248,9 @@ def parse_command_line(args):
 
     # ... Conclude!
     parsed = parser.parse_args(args)
-    return parsed.func(parsed)
+    if parsed.func is actions.History and parsed.diff is not None and len(parsed.diff) > 2:
+        parser_history.error("--diff takes one or two versions, not {}".format(len(parsed.diff)))
+    return parsed.func(parsed, registry)
 
 '''
 parser.add_argument('verb', choices=['pull', 'push', 'build', 'publicize'])
@@ -1,14 +1,45 @@
+from importlib import import_module
 from typing import Type
 
 WALTZ_VERSION = '0.1.0'
 
 WALTZ_REGISTRY_FILE_NAME = ".waltz"
 WALTZ_DATABASE_FILE_NAME = ".waltz.db"
+WALTZ_CACHE_FILE_NAME = ".waltz.cache.db"
+
+# How many pulled versions of each resource to keep, and how old they can get (None is forever)
+HISTORY_SETTINGS = {'max_versions': 20, 'max_age_days': None}
+# Every so many versions, store a full copy instead of a delta
+HISTORY_KEYFRAME_INTERVAL = 10
+
+# The registry database uses upserts (3.24) and window functions (3.25)
+MINIMUM_SQLITE_VERSION = (3, 25, 0)
+
+# The built-in services and the resource categories they offer, as "module:Class" paths.
+# Nothing here is imported until a command actually needs that service or category, so
+# that `waltz --help` doesn't pay for requests, markdown, BeautifulSoup, etc.
+SERVICE_TYPE_PLUGINS = {
+    'local': ('waltz.services.local.local:Local', ['waltz.resources.page:Page']),
+    'canvas': ('waltz.services.canvas.canvas:Canvas', ['waltz.resources.page:Page',
+                                                       'waltz.resources.quiz:Quiz',
+                                                       'waltz.resources.assignment:Assignment']),
+    'blockpy': ('waltz.services.blockpy.blockpy:BlockPy', ['waltz.resources.blockpy.problem:Problem',
+                                                           'waltz.resources.blockpy.blockpy_course:BlockPyCourse',
+                                                           'waltz.resources.blockpy.blockpy_group:BlockPyGroup']),
+    'gradescope': ('waltz.services.gradescope.gradescope:GradeScope',
+                   ['waltz.resources.gradescope_assignment:GradeScopeAssignment',
+                    'waltz.resources.gradescope_course:GradeScopeCourse']),
+}
 
 SERVICE_TYPES = {}
 RESOURCE_CATEGORIES = {}
 
 
+def import_plugin(path: str):
+    module_name, name = path.split(':')
+    return getattr(import_module(module_name), name)
+
+
 def register_service_type(service: 'Type[Service]'):
     """
     Includes the given Service as a default
@@ -22,9 +53,33 @@ def register_service_type(service: 'Type[Service]'):
         RESOURCE_CATEGORIES[name] = Resource
 
 
+def get_service_type_names():
+    return list(dict.fromkeys(list(SERVICE_TYPE_PLUGINS) + list(SERVICE_TYPES)))
+
+
+def get_service_type(name: str) -> 'Type[Service]':
+    if name not in SERVICE_TYPES:
+        if name not in SERVICE_TYPE_PLUGINS:
+            raise KeyError(name)
+        SERVICE_TYPES[name] = import_plugin(SERVICE_TYPE_PLUGINS[name][0])
+    return SERVICE_TYPES[name]
+
+
+def load_resources(service: 'Type[Service]'):
+    """ Imports and registers the resource categories of the given service, if it has not been done yet. """
+    if service.type in SERVICE_TYPE_PLUGINS and not service.RESOURCES:
+        for path in SERVICE_TYPE_PLUGINS[service.type][1]:
+            service.register_resource(import_plugin(path))
+    for name, Resource in service.RESOURCES.items():
+        RESOURCE_CATEGORIES[name] = Resource
+    return service.RESOURCES
+
+
 def get_service_types():
-    return SERVICE_TYPES.copy()
+    return {name: get_service_type(name) for name in get_service_type_names()}
 
 
 def get_resource_categories():
+    for service in get_service_types().values():
+        load_resources(service)
     return RESOURCE_CATEGORIES.copy()
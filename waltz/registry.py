@@ -1,14 +1,25 @@
 import gc
+import hashlib
+import json
 import logging
 import os
 import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
 from typing import Type
 
 from waltz import defaults as defaults
 from waltz.exceptions import WaltzException, WaltzServiceNotFound, WaltzAmbiguousResource, WaltzResourceNotFound
 from waltz.resources.raw import RawResource
 from waltz.services.service import services_from_data, services_as_data
-from waltz.tools.yaml_setup import yaml
+from waltz.tools.compression import compress, decompress, make_delta, apply_delta
+from waltz.tools.full_text import searchable_text, make_match_query
+from waltz.tools.utilities import make_path_suffix_key
+from waltz import tools
+
+SearchResult = namedtuple('SearchResult', ['service', 'category', 'title', 'disambiguate', 'snippet'])
+LocalFile = namedtuple('LocalFile', ['path', 'resource', 'title', 'status'])
 
 
 class Registry:
@@ -16,15 +27,47 @@ class Registry:
     A collection of available courses and default services.
     """
     services: 'Dict[str, Service]'
-    db: sqlite3.Connection
     directory: str
     version: str
+    use_cache: bool
+    history_settings: dict
 
-    def __init__(self, directory, db, services, version):
+    def __init__(self, directory, db, services, version, use_cache=True, history=None):
         self.directory = directory
-        self.db = db
+        # If no database is given, it is only opened once something needs it
+        self._db = db
         self.services = services
         self.version = version
+        self.use_cache = use_cache
+        self.history_settings = dict(defaults.HISTORY_SETTINGS, **(history or {}))
+        self._transaction_depth = 0
+        # Directories whose local files were already checked for changes
+        self._refreshed_roots = set()
+        for services_of_type in self.services.values():
+            for service in services_of_type:
+                service.attach(self)
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self.connect_database(self.get_waltz_database_path(self.directory))
+            self.upgrade_database(self._db)
+        return self._db
+
+    @db.setter
+    def db(self, db):
+        self._db = db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def start_command(self):
+        """ Lets every service forget what it remembered during the previous command. """
+        for services_of_type in self.services.values():
+            for service in services_of_type:
+                service.start_command()
 
     @classmethod
     def get_waltz_registry_path(cls, directory):
@@ -34,10 +77,26 @@ class Registry:
     def get_waltz_database_path(cls, directory):
         return os.path.join(directory, defaults.WALTZ_DATABASE_FILE_NAME)
 
+    @classmethod
+    def get_waltz_cache_path(cls, directory):
+        return os.path.join(directory, defaults.WALTZ_CACHE_FILE_NAME)
+
+    @classmethod
+    def connect_database(cls, path):
+        if sqlite3.sqlite_version_info < defaults.MINIMUM_SQLITE_VERSION:
+            raise WaltzException("Waltz needs SQLite {} or newer, but Python is using SQLite {}".format(
+                ".".join(map(str, defaults.MINIMUM_SQLITE_VERSION)), sqlite3.sqlite_version))
+        db = sqlite3.connect(path)
+        # Readers don't block the writer, and we only fsync at checkpoints. Losing the last
+        # few writes on a power cut is fine: the registry is just a cache of remote data.
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
     @classmethod
     def make_default(cls, directory) -> 'Registry':
-        db = sqlite3.connect(cls.get_waltz_database_path(directory))
-        services = {name: [] for name in defaults.get_service_types()}
+        db = cls.connect_database(cls.get_waltz_database_path(directory))
+        services = {name: [] for name in defaults.get_service_type_names()}
         new_registry = Registry(directory=directory,
                         db=db,
                         services=services,
@@ -46,13 +105,14 @@ class Registry:
         return new_registry
 
     @classmethod
-    def load_version_010(cls, directory, data) -> 'Registry':
-        db = sqlite3.connect(cls.get_waltz_database_path(directory))
-        services = services_from_data(data['services'], defaults.get_service_types())
+    def load_version_010(cls, directory, data, use_cache=True) -> 'Registry':
+        services = services_from_data(data['services'])
         return Registry(directory=directory,
-                        db=db,
+                        db=None,
                         services=services,
-                        version=data['version'])
+                        version=data['version'],
+                        use_cache=use_cache,
+                        history=data.get('history'))
 
     @classmethod
     def exists(cls, directory):
@@ -68,6 +128,11 @@ class Registry:
     def delete(cls, directory):
         os.remove(cls.get_waltz_registry_path(directory))
         os.remove(cls.get_waltz_database_path(directory))
+        for path in (cls.get_waltz_database_path(directory) + "-wal",
+                     cls.get_waltz_database_path(directory) + "-shm",
+                     cls.get_waltz_cache_path(directory)):
+            if os.path.exists(path):
+                os.remove(path)
 
     @classmethod
     def init(cls, directory):
@@ -85,14 +150,14 @@ class Registry:
             directory = parent_directory
 
     @classmethod
-    def load(cls, directory, create_if_not_exists=True):
+    def load(cls, directory, create_if_not_exists=True, use_cache=True):
         directory = cls.search_up_for_waltz_registry(directory)
         if directory is not None:
             with open(cls.get_waltz_registry_path(directory)) as registry_file:
-                registry_data = yaml.load(registry_file)
+                registry_data = tools.yaml.load(registry_file)
             version = registry_data['version']
             if version in ('0.1.0', ):
-                return Registry.load_version_010(directory, registry_data)
+                return Registry.load_version_010(directory, registry_data, use_cache)
             else:
                 raise WaltzException("Unknown registry file version: {}\nMy version is: {}".format(
                     version, defaults.WALTZ_VERSION))
@@ -105,58 +170,582 @@ class Registry:
     def save_to_file(self):
         registry_path = self.get_waltz_registry_path(self.directory)
         with open(registry_path, 'w') as registry_file:
-            yaml.dump({
+            tools.yaml.dump({
                 'version': self.version,
                 'services': services_as_data(self.services),
+                'history': self.history_settings,
             }, registry_file)
         return self
 
     def create_database(self):
-        self.db.execute("CREATE TABLE resources (service text, category text, title text, disambiguate text, data text)")
-        self.db.execute("CREATE UNIQUE INDEX idx_resource ON resources(service, category, title, disambiguate)")
-        self.db.commit()
+        self.upgrade_database(self.db)
+
+    @classmethod
+    def upgrade_database(cls, db):
+        """ Brings a database made by an older version of Waltz up to the current schema. """
+        version, = db.execute("PRAGMA user_version").fetchone()
+        migrations = [(1, cls.migrate_to_version_1), (2, cls.migrate_to_version_2), (3, cls.migrate_to_version_3),
+                      (4, cls.migrate_to_version_4), (5, cls.migrate_to_version_5),
+                      (6, cls.migrate_to_version_6), (7, cls.migrate_to_version_7),
+                      (8, cls.migrate_to_version_8), (9, cls.migrate_to_version_9)]
+        for target, migrate in migrations:
+            if version < target:
+                db.execute("BEGIN")
+                try:
+                    migrate(db)
+                    db.execute("PRAGMA user_version = {}".format(target))
+                except Exception:
+                    db.rollback()
+                    raise
+                db.commit()
+        if version < 3:
+            # Give the space saved by compression back to the filesystem
+            db.execute("VACUUM")
+
+    @classmethod
+    def migrate_to_version_1(cls, db):
+        # The original schema, which databases made before versioning already have
+        db.execute("CREATE TABLE IF NOT EXISTS resources "
+                   "(service text, category text, title text, disambiguate text, data text)")
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_resource "
+                   "ON resources(service, category, title, disambiguate)")
+
+    @classmethod
+    def migrate_to_version_2(cls, db):
+        # Sync state: what the remote version of the data was, and when we last pulled/pushed it
+        for column, kind in [('content_hash', 'text'), ('remote_id', 'text'), ('remote_updated_at', 'text'),
+                             ('remote_url', 'text'), ('last_pulled', 'real'), ('last_pushed', 'real'),
+                             ('size', 'integer')]:
+            db.execute("ALTER TABLE resources ADD COLUMN {} {}".format(column, kind))
+        db.execute("CREATE INDEX idx_resource_remote_id ON resources(service, category, remote_id)")
+        db.execute("CREATE INDEX idx_resource_content_hash ON resources(content_hash)")
+        rows = db.execute("SELECT rowid, data FROM resources").fetchall()
+        db.executemany("UPDATE resources SET content_hash = ?, size = ? WHERE rowid = ?",
+                       [(cls.hash_data(data), cls.size_of_data(data), rowid) for rowid, data in rows])
+
+    @classmethod
+    def migrate_to_version_3(cls, db):
+        # The data becomes a compressed BLOB, tagged with how it was compressed
+        db.execute("CREATE TABLE resources_v3 (service text, category text, title text, disambiguate text, "
+                   "data blob, codec text, content_hash text, remote_id text, remote_updated_at text, "
+                   "remote_url text, last_pulled real, last_pushed real, size integer)")
+        rows = db.execute("SELECT service, category, title, disambiguate, data, content_hash, remote_id, "
+                          "remote_updated_at, remote_url, last_pulled, last_pushed, size FROM resources")
+        db.executemany("INSERT INTO resources_v3 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (row[:4] + compress(row[4]) + row[5:] for row in rows))
+        db.execute("DROP TABLE resources")
+        db.execute("ALTER TABLE resources_v3 RENAME TO resources")
+        db.execute("CREATE UNIQUE INDEX idx_resource ON resources(service, category, title, disambiguate)")
+        db.execute("CREATE INDEX idx_resource_remote_id ON resources(service, category, remote_id)")
+        db.execute("CREATE INDEX idx_resource_content_hash ON resources(content_hash)")
+
+    @classmethod
+    def migrate_to_version_4(cls, db):
+        # Every version we have pulled, keyed by content so repeated versions are stored once
+        db.execute("CREATE TABLE history (service text, category text, title text, disambiguate text, "
+                   "version integer, content_hash text, pulled_at real, "
+                   "PRIMARY KEY (service, category, title, disambiguate, version))")
+        db.execute("CREATE INDEX idx_history_content_hash ON history(content_hash)")
+        # Contents are either full copies (no base) or deltas against their base's contents
+        db.execute("CREATE TABLE history_contents (content_hash text PRIMARY KEY, base_hash text, "
+                   "data blob, codec text, size integer)")
+        db.execute("CREATE INDEX idx_history_contents_base ON history_contents(base_hash)")
+
+    @classmethod
+    def migrate_to_version_5(cls, db):
+        # Logged-in sessions (e.g., cookies) that services can reuse instead of logging in again
+        db.execute("CREATE TABLE service_sessions (service text PRIMARY KEY, data text, saved_at real)")
+
+    @classmethod
+    def migrate_to_version_6(cls, db):
+        # Full-text search over raw resources (rowid = the resource's rowid) and local
+        # files (rowid = minus the file's id in search_files, and later local_files)
+        db.execute("CREATE VIRTUAL TABLE search_index USING fts5(service UNINDEXED, category UNINDEXED, title, "
+                   "disambiguate UNINDEXED, body, tokenize = 'porter unicode61')")
+        db.execute("CREATE TABLE search_files (id integer PRIMARY KEY, path text UNIQUE, service text, "
+                   "mtime_ns integer, size integer)")
+        rows = db.execute("SELECT rowid, service, category, title, disambiguate, data, codec FROM resources")
+        db.executemany("INSERT INTO search_index (rowid, service, category, title, disambiguate, body) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (row[:5] + (searchable_text(decompress(row[5], row[6])),) for row in rows))
+
+    @classmethod
+    def migrate_to_version_7(cls, db):
+        # Lookups by --id/--url alone, and by title regardless of case (or by its start)
+        db.execute("CREATE INDEX idx_resource_disambiguate ON resources(disambiguate)")
+        db.execute("CREATE INDEX idx_resource_title_nocase ON resources(title COLLATE NOCASE)")
+
+    @classmethod
+    def migrate_to_version_8(cls, db):
+        # Every local file with what its front matter says, so that commands don't have to walk and
+        # parse the whole directory. Replaces search_files; the local files are indexed again on demand.
+        db.execute("DELETE FROM search_index WHERE rowid < 0")
+        db.execute("DROP TABLE search_files")
+        db.execute("CREATE TABLE local_files (id integer PRIMARY KEY, path text UNIQUE, service text, "
+                   "mtime_ns integer, size integer, content_hash text, resource text, title text, status text)")
+
+    @classmethod
+    def migrate_to_version_9(cls, db):
+        # Finding local files by how their paths end (see make_path_suffix_key), or by their title
+        db.execute("ALTER TABLE local_files ADD COLUMN suffix_key text")
+        db.executemany("UPDATE local_files SET suffix_key = ? WHERE id = ?",
+                       [(make_path_suffix_key(path), file_id)
+                        for file_id, path in db.execute("SELECT id, path FROM local_files").fetchall()])
+        db.execute("CREATE INDEX idx_local_files_suffix_key ON local_files(suffix_key)")
+        db.execute("CREATE INDEX idx_local_files_title ON local_files(title)")
+
+    @classmethod
+    def hash_data(cls, data):
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        return hashlib.sha256(data).hexdigest()
+
+    @classmethod
+    def size_of_data(cls, data):
+        if data is None:
+            return 0
+        return len(data.encode('utf8')) if isinstance(data, str) else len(data)
 
     def reset_database(self):
-        self.db.close()
+        self.close()
         waltz_database_path = self.get_waltz_database_path(self.directory)
         # TODO: Are these still necessary? My gut says no.
         # del self.db
         # import gc
         # gc.collect()
         os.remove(waltz_database_path)
-        self.db = sqlite3.connect(waltz_database_path)
+        self.db = self.connect_database(waltz_database_path)
         self.create_database()
+        for services_of_type in self.services.values():
+            for service in services_of_type:
+                service.clear_cache()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups writes into a single commit. Transactions can be nested; only the outermost
+        one commits (or rolls back, if something goes wrong inside it).
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self.db.rollback()
+            raise
+        self._transaction_depth -= 1
+        self.commit()
+
+    def commit(self):
+        if not self._transaction_depth:
+            self.db.commit()
+
+    # If the data changes, it no longer matches the remote version we last saw
+    STORE_RESOURCE_SQL = ("INSERT INTO resources (service, category, title, disambiguate, data, codec, "
+                          "content_hash, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                          "ON CONFLICT (service, category, title, disambiguate) DO UPDATE SET "
+                          "data = excluded.data, codec = excluded.codec, "
+                          "content_hash = excluded.content_hash, size = excluded.size, "
+                          "remote_updated_at = CASE WHEN resources.content_hash = excluded.content_hash "
+                          "THEN resources.remote_updated_at END")
 
     def store_resource(self, service, category, title, disambiguate, resource_data):
-        # TODO: Replace existing
-        self.db.execute("REPLACE INTO resources VALUES (?, ?, ?, ?, ?)",
-                        (service, category, title, disambiguate, resource_data))
-        self.db.commit()
+        self.db.execute(self.STORE_RESOURCE_SQL, (service, category, title, disambiguate,
+                                                  *compress(resource_data),
+                                                  self.hash_data(resource_data), self.size_of_data(resource_data)))
+        self.index_resources([(service, category, title, disambiguate, resource_data)])
+        self.commit()
 
-    def find_all_resources(self, service=None, category=None):
-        resources = self.db.execute("SELECT service, category, title, disambiguate, data FROM resources "
-                                    "WHERE service = ? AND category = ?", (service, category))
-        return [RawResource.from_database(result) for result in resources.fetchall()]
+    def store_resources(self, resources):
+        """ Stores many (service, category, title, disambiguate, data) rows in one go. """
+        resources = list(resources)
+        self.db.executemany(self.STORE_RESOURCE_SQL, [
+            (service, category, title, disambiguate, *compress(data), self.hash_data(data), self.size_of_data(data))
+            for service, category, title, disambiguate, data in resources])
+        self.index_resources(resources)
+        self.commit()
+
+    def index_resources(self, resources):
+        """ Brings the search index up to date with some just-stored resources. """
+        # One prepared statement for the batch, which finds each rowid through idx_resource itself
+        self.db.executemany("INSERT OR REPLACE INTO search_index (rowid, service, category, title, disambiguate, "
+                            "body) SELECT rowid, service, category, title, disambiguate, ? FROM resources "
+                            "WHERE service = ? AND category = ? AND title = ? AND disambiguate = ?", [
+            (searchable_text(data), service, category, title, disambiguate)
+            for service, category, title, disambiguate, data in resources])
+
+    def refresh_local_files(self, service, root, describe_files, force=False):
+        """
+        Brings the index of local files up to date with everything under the given directory.
+        Only files whose mtime or size changed are described again, and only from their front
+        matter; their content hash and search text are left for ``index_local_texts``. Each
+        directory is only walked once per registry, unless forced.
+
+        Args:
+            service (str): The name of the local service the files belong to.
+            root (str): The directory to walk (hidden files and directories, like Waltz's own, are skipped).
+            describe_files (list[str] -> list[tuple]): Gets each file's resource category, title, and
+                parse status (or Nones, if the file isn't worth reading).
+            force (bool): Walk the directory again, even if it was already walked.
+        """
+        root = os.path.abspath(root)
+        if root in self._refreshed_roots and not force:
+            return
+        stamps = {}
+        for directory, directories, names in os.walk(root):
+            directories[:] = [name for name in directories if not name.startswith('.')]
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        # Everything under the root, using the range of the path index
+        prefix = os.path.join(root, '')
+        known = {path: (file_id, (mtime_ns, size)) for file_id, path, mtime_ns, size in self.db.execute(
+            "SELECT id, path, mtime_ns, size FROM local_files WHERE path >= ? AND path < ?",
+            (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))}
+        with self.transaction():
+            gone = [(file_id,) for path, (file_id, _) in known.items() if path not in stamps]
+            self.db.executemany("DELETE FROM search_index WHERE rowid = -?", gone)
+            self.db.executemany("DELETE FROM local_files WHERE id = ?", gone)
+            changed = [path for path, stamp in stamps.items() if path not in known or known[path][1] != stamp]
+            for path, description in zip(changed, describe_files(changed)):
+                self.store_local_file(service, path, stamps[path], description)
+        self._refreshed_roots.add(root)
 
-    def find_resource(self, service=None, category=None, title=None, disambiguate=None):
+    def refresh_local_file(self, service, path, describe):
+        """ Brings a single local file's entry up to date, returning it (or None if it doesn't exist). """
+        path = os.path.abspath(path)
+        row = self.db.execute("SELECT mtime_ns, size FROM local_files WHERE path = ?", (path,)).fetchone()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if row is not None:
+                with self.transaction():
+                    self.db.execute("DELETE FROM search_index WHERE rowid = -(SELECT id FROM local_files "
+                                    "WHERE path = ?)", (path,))
+                    self.db.execute("DELETE FROM local_files WHERE path = ?", (path,))
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if row != stamp:
+            with self.transaction():
+                self.store_local_file(service, path, stamp, describe(path))
+        return self.find_local_file(path)
+
+    def store_local_file(self, service, path, stamp, description):
+        """ Stores what a file's front matter says. Its old content hash and search text no longer apply. """
+        resource, title, status = description
+        self.db.execute(
+            "INSERT INTO local_files (path, suffix_key, service, mtime_ns, size, content_hash, resource, title, "
+            "status) VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+            "service = excluded.service, mtime_ns = excluded.mtime_ns, size = excluded.size, content_hash = NULL, "
+            "resource = excluded.resource, title = excluded.title, status = excluded.status",
+            (path, make_path_suffix_key(path), service, *stamp, resource, title, status))
+        self.db.execute("DELETE FROM search_index WHERE rowid = -(SELECT id FROM local_files WHERE path = ?)",
+                        (path,))
+
+    def index_local_texts(self, root, describe_texts):
+        """
+        Reads the whole of each (Markdown) file under the directory that changed since its text
+        was last indexed, to put its content hash and searchable text in the index.
+
+        Args:
+            root (str): The directory whose files to index.
+            describe_texts (list[str] -> list[tuple]): Gets each file's content hash and searchable text.
+        """
+        prefix = os.path.join(os.path.abspath(root), '')
+        stale = self.db.execute(
+            "SELECT id, path, service, resource, title FROM local_files WHERE content_hash IS NULL "
+            "AND status IS NOT NULL AND path >= ? AND path < ?",
+            (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))).fetchall()
+        if not stale:
+            return
+        texts = describe_texts([path for _, path, _, _, _ in stale])
+        with self.transaction():
+            for (file_id, path, service, resource, title), (content_hash, text) in zip(stale, texts):
+                if text is None:
+                    # It couldn't be read; try again next time
+                    continue
+                self.db.execute("UPDATE local_files SET content_hash = ? WHERE id = ?", (content_hash, file_id))
+                self.db.execute("INSERT OR REPLACE INTO search_index (rowid, service, category, title, "
+                                "disambiguate, body) VALUES (?, ?, ?, ?, ?, ?)",
+                                (-file_id, service, resource or "", title or "", path, text))
+
+    def find_local_file(self, path):
+        row = self.db.execute("SELECT path, resource, title, status FROM local_files WHERE path = ?",
+                              (os.path.abspath(path),)).fetchone()
+        return None if row is None else LocalFile(*row)
+
+    def find_local_files(self, root):
+        """ The indexed files under the given directory, ordered by path. """
+        prefix = os.path.join(os.path.abspath(root), '')
+        return [LocalFile(*row) for row in self.db.execute(
+            "SELECT path, resource, title, status FROM local_files WHERE path >= ? AND path < ? ORDER BY path",
+            (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))]
+
+    def find_local_files_ending_with(self, root, end_path):
+        """ The indexed files under the given directory whose paths end with all the parts of ``end_path``. """
+        prefix = os.path.join(os.path.abspath(root), '')
+        key = make_path_suffix_key(end_path)
+        return [LocalFile(*row) for row in self.db.execute(
+            "SELECT path, resource, title, status FROM local_files WHERE suffix_key >= ? AND suffix_key < ? "
+            "AND path >= ? AND path < ? ORDER BY path",
+            (key, key[:-1] + chr(ord(key[-1]) + 1), prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))]
+
+    def find_local_files_titled(self, root, title):
+        """ The indexed files under the given directory whose front matter has the given title. """
+        prefix = os.path.join(os.path.abspath(root), '')
+        return [LocalFile(*row) for row in self.db.execute(
+            "SELECT path, resource, title, status FROM local_files WHERE title = ? "
+            "AND path >= ? AND path < ? ORDER BY path",
+            (title, prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))]
+
+    def store_remote_reference(self, service, category, title, remote_id, remote_url=None, remote_updated_at=None,
+                               pulled=False, pushed=False, disambiguate=""):
+        """
+        Remembers where a stored resource lives on its remote service (so that later commands can
+        go straight to it instead of searching for it by title), and which version of it we have.
+        Returns whether the resource was stored; references to anything else are not kept.
+        """
+        now = time.time()
+        columns = {"remote_id = ?": str(remote_id), "remote_url = ?": remote_url,
+                   "remote_updated_at = ?": remote_updated_at,
+                   "last_pulled = ?": now if pulled else None, "last_pushed = ?": now if pushed else None}
+        columns = {column: value for column, value in columns.items() if value is not None}
+        updated = self.db.execute("UPDATE resources SET {} WHERE service = ? AND category = ? AND title = ? "
+                                  "AND disambiguate = ?".format(", ".join(columns.keys())),
+                                  tuple(columns.values()) + (service, category, title, disambiguate)).rowcount
+        self.commit()
+        if not updated:
+            logging.info("Not remembering where %s %s %r is, since it isn't stored yet", service, category, title)
+        return bool(updated)
+
+    def find_remote_id(self, service, category, title, disambiguate=""):
+        result = self.db.execute("SELECT remote_id FROM resources WHERE service = ? AND category = ? AND title = ? "
+                                 "AND disambiguate = ? AND remote_id IS NOT NULL",
+                                 (service, category, title, disambiguate)).fetchone()
+        return result[0] if result else None
+
+    def forget_remote_reference(self, service, category, title, disambiguate=""):
+        self.db.execute("UPDATE resources SET remote_id = NULL, remote_url = NULL, remote_updated_at = NULL "
+                        "WHERE service = ? AND category = ? AND title = ? AND disambiguate = ?",
+                        (service, category, title, disambiguate))
+        self.commit()
+
+    def find_remote_versions(self, service, category):
+        """ Maps the remote id of every stored resource in this category to its remote `updated_at`. """
+        rows = self.db.execute("SELECT remote_id, remote_updated_at FROM resources "
+                               "WHERE service = ? AND category = ? AND remote_id IS NOT NULL", (service, category))
+        return dict(rows.fetchall())
+
+    def record_versions(self, resources):
+        """
+        Adds freshly pulled (service, category, title, disambiguate, data) rows to the history of
+        those resources, unless they are the same as the latest version we already have.
+        """
+        evicted = set()
+        with self.transaction():
+            for service, category, title, disambiguate, data in resources:
+                key = (service, category, title, disambiguate)
+                content_hash = self.hash_data(data)
+                latest = self.db.execute("SELECT version, content_hash FROM history WHERE service = ? AND "
+                                         "category = ? AND title = ? AND disambiguate = ? "
+                                         "ORDER BY version DESC LIMIT 1", key).fetchone()
+                if latest is not None and latest[1] == content_hash:
+                    continue
+                self._store_history_contents(content_hash, data, latest[1] if latest else None)
+                self.db.execute("INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                key + ((latest[0] + 1) if latest else 1, content_hash, time.time()))
+                evicted |= self._evict_history(service, category, title, disambiguate)
+            # Once for the whole batch, since it has to check which contents are still used
+            self._collect_history_garbage({content_hash for _, content_hash in evicted})
+
+    def _store_history_contents(self, content_hash, data, base_hash):
+        if self.db.execute("SELECT 1 FROM history_contents WHERE content_hash = ?", (content_hash,)).fetchone():
+            return
+        blob, codec = compress(data)
+        stored_base = None
+        if isinstance(data, str) and base_hash is not None:
+            chain = self._find_history_chain(base_hash)
+            if len(chain) < defaults.HISTORY_KEYFRAME_INTERVAL:
+                delta_blob, delta_codec = compress(make_delta(self.load_history_contents(base_hash), data))
+                if len(delta_blob) < len(blob):
+                    blob, codec, stored_base = delta_blob, delta_codec, base_hash
+        self.db.execute("INSERT INTO history_contents VALUES (?, ?, ?, ?, ?)",
+                        (content_hash, stored_base, blob, codec, self.size_of_data(data)))
+
+    def _find_history_chain(self, content_hash):
+        """ The contents needed to rebuild this one, from the full copy up to itself. """
+        chain = []
+        while content_hash is not None:
+            row = self.db.execute("SELECT base_hash, data, codec FROM history_contents WHERE content_hash = ?",
+                                  (content_hash,)).fetchone()
+            if row is None:
+                raise WaltzResourceNotFound("History is missing contents {}".format(content_hash))
+            chain.append(row)
+            content_hash = row[0]
+        return list(reversed(chain))
+
+    def load_history_contents(self, content_hash):
+        data = None
+        for base_hash, blob, codec in self._find_history_chain(content_hash):
+            contents = decompress(blob, codec)
+            data = contents if base_hash is None else apply_delta(data, contents)
+        return data
+
+    def find_versions(self, service, category, title, disambiguate=""):
+        """ Returns (version, pulled_at, size, content_hash) for each version we have, oldest first. """
+        return self.db.execute("SELECT version, pulled_at, size, history.content_hash FROM history "
+                               "JOIN history_contents ON history.content_hash = history_contents.content_hash "
+                               "WHERE service = ? AND category = ? AND title = ? AND disambiguate = ? "
+                               "ORDER BY version", (service, category, title, disambiguate)).fetchall()
+
+    def load_version(self, service, category, title, version, disambiguate=""):
+        row = self.db.execute("SELECT content_hash FROM history WHERE service = ? AND category = ? AND "
+                              "title = ? AND disambiguate = ? AND version = ?",
+                              (service, category, title, disambiguate, version)).fetchone()
+        if row is None:
+            raise WaltzResourceNotFound("No version {} of {} in the history.".format(version, title))
+        return self.load_history_contents(row[0])
+
+    def restore_version(self, service, category, title, version, disambiguate=""):
+        """ Makes an old version the current raw resource again, e.g. so it can be decoded. """
+        data = self.load_version(service, category, title, version, disambiguate)
+        self.store_resource(service, category, title, disambiguate, data)
+        return data
+
+    def prune_history(self, service=None, category=None, title=None, disambiguate=None,
+                      max_versions=None, max_age_days=None):
+        """
+        Evicts versions beyond the configured limits (the latest version of a resource is always
+        kept), then drops any contents that no version needs anymore.
+        """
+        with self.transaction():
+            evicted = self._evict_history(service, category, title, disambiguate, max_versions, max_age_days)
+            self._collect_history_garbage({content_hash for _, content_hash in evicted})
+        return len(evicted)
+
+    def _evict_history(self, service, category, title, disambiguate, max_versions=None, max_age_days=None):
+        """ Deletes the versions past the limits, returning the (rowid, content_hash) of each. """
+        if max_versions is None:
+            max_versions = self.history_settings['max_versions']
+        if max_versions is not None:
+            # The latest version is always kept
+            max_versions = max(1, max_versions)
+        if max_age_days is None:
+            max_age_days = self.history_settings['max_age_days']
         parameters = {"service = ?": service, "category = ?": category,
                       "title = ?": title, "disambiguate = ?": disambiguate}
         terms = {column: term for column, term in parameters.items() if term is not None}
-        resources = self.db.execute("SELECT service, category, title, disambiguate, data FROM resources "
-                                    "WHERE {}".format(" AND ".join(terms.keys())), tuple(terms.values()))
-        results = resources.fetchall()
-        if resources.rowcount > 1:
-            raise WaltzAmbiguousResource(
-                "Ambiguous resource {}, found {} versions".format(" ".join(terms.values()), resources.rowcount),
-                results
-            )
-        elif not results or not resources.rowcount:
-            raise WaltzResourceNotFound("Could not find resource {}.".format(" ".join(map(str, terms.values()))))
+        where = " AND ".join(terms.keys()) or "1"
+        ranked = ("SELECT rowid, content_hash, pulled_at, ROW_NUMBER() OVER (PARTITION BY service, category, "
+                  "title, disambiguate ORDER BY version DESC) AS age FROM history WHERE " + where)
+        doomed = set()
+        if max_versions is not None:
+            doomed.update(self.db.execute("SELECT rowid, content_hash FROM ({}) WHERE age > ?".format(ranked),
+                                          tuple(terms.values()) + (max_versions,)).fetchall())
+        if max_age_days is not None:
+            oldest = time.time() - max_age_days * 24 * 60 * 60
+            doomed.update(self.db.execute("SELECT rowid, content_hash FROM ({}) WHERE age > 1 AND pulled_at < ?"
+                                          .format(ranked), tuple(terms.values()) + (oldest,)).fetchall())
+        self.db.executemany("DELETE FROM history WHERE rowid = ?", [(rowid,) for rowid, _ in doomed])
+        return doomed
+
+    def _collect_history_garbage(self, content_hashes):
+        """ Drops whichever of these contents no version needs anymore. """
+        unused = {content_hash for content_hash in content_hashes
+                  if not self.db.execute("SELECT 1 FROM history WHERE content_hash = ? LIMIT 1",
+                                         (content_hash,)).fetchone()}
+        # Anything still needed that is built on top of these contents has to become a full copy first
+        for content_hash in unused:
+            dependents = self.db.execute("SELECT content_hash FROM history_contents WHERE base_hash = ?",
+                                         (content_hash,)).fetchall()
+            for dependent, in dependents:
+                if dependent not in unused:
+                    data = self.load_history_contents(dependent)
+                    self.db.execute("UPDATE history_contents SET base_hash = NULL, data = ?, codec = ? "
+                                    "WHERE content_hash = ?", compress(data) + (dependent,))
+        self.db.executemany("DELETE FROM history_contents WHERE content_hash = ?",
+                            [(content_hash,) for content_hash in unused])
+
+    def store_session(self, service, data):
+        self.db.execute("REPLACE INTO service_sessions VALUES (?, ?, ?)", (service, json.dumps(data), time.time()))
+        self.commit()
+
+    def find_session(self, service):
+        result = self.db.execute("SELECT data FROM service_sessions WHERE service = ?", (service,)).fetchone()
+        return json.loads(result[0]) if result else None
+
+    def forget_session(self, service):
+        self.db.execute("DELETE FROM service_sessions WHERE service = ?", (service,))
+        self.commit()
+
+    RESOURCE_COLUMNS = "service, category, title, disambiguate, data, codec"
+
+    def query_resources(self, service=None, category=None, title=None, disambiguate=None,
+                        ignore_case=False, prefix=False, limit=None):
+        """
+        Runs a lookup of raw resources on the indexed columns, returning the cursor.
+
+        Args:
+            ignore_case (bool): Whether the title can differ in case.
+            prefix (bool): Whether the title only has to start with the given title (ignoring case).
+        """
+        terms, parameters = [], []
+        for column, value in (("service", service), ("category", category), ("disambiguate", disambiguate)):
+            if value is not None:
+                terms.append(column + " = ?")
+                parameters.append(value)
+        if title is not None:
+            if prefix:
+                terms.append("title LIKE ? ESCAPE '\\'")
+                parameters.append(title.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+            elif ignore_case:
+                terms.append("title = ? COLLATE NOCASE")
+                parameters.append(title)
+            else:
+                terms.append("title = ?")
+                parameters.append(title)
+        query = "SELECT {} FROM resources".format(self.RESOURCE_COLUMNS)
+        if terms:
+            query += " WHERE " + " AND ".join(terms)
+        if limit is not None:
+            query += " LIMIT {:d}".format(limit)
+        return self.db.execute(query, parameters)
+
+    def iter_resources(self, service=None, category=None, title=None, disambiguate=None,
+                       ignore_case=False, prefix=False):
+        """ Yields the matching raw resources one at a time, rather than loading them all at once. """
+        for row in self.query_resources(service, category, title, disambiguate, ignore_case, prefix):
+            yield RawResource.from_database(row)
+
+    def find_all_resources(self, service=None, category=None):
+        return list(self.iter_resources(service, category))
+
+    def find_resource(self, service=None, category=None, title=None, disambiguate=None,
+                      ignore_case=False, prefix=False):
+        # Two rows are enough to know that the lookup is ambiguous
+        results = self.query_resources(service, category, title, disambiguate, ignore_case, prefix,
+                                       limit=2).fetchall()
+        terms = " ".join(str(term) for term in (service, category, title, disambiguate) if term is not None)
+        if len(results) > 1:
+            raise WaltzAmbiguousResource("Ambiguous resource {}, found multiple versions".format(terms),
+                                         [RawResource.from_database(result) for result in results])
+        elif not results:
+            raise WaltzResourceNotFound("Could not find resource {}.".format(terms))
         else:
             return RawResource.from_database(results[0])
 
     def configure_service(self, service):
         self.services[service.type].append(service)
+        service.attach(self)
 
     def get_service(self, name, default_name=None):
         if name is None:
@@ -173,18 +762,20 @@ class Registry:
 
     @classmethod
     def get_resource_category(cls, name: str):
-        categories = defaults.get_resource_categories()
-        if name in categories:
-            return categories[name]
+        if name not in defaults.RESOURCE_CATEGORIES:
+            defaults.get_resource_categories()
+        if name in defaults.RESOURCE_CATEGORIES:
+            return defaults.RESOURCE_CATEGORIES[name]
         raise WaltzResourceNotFound("Unknown resource category: {}".format(name))
 
     @classmethod
     def fill_args(cls, args, raw_resource):
-        if args.service is None:
+        # Not every command's parser has all of these
+        if getattr(args, 'service', None) is None:
             args.service = raw_resource.service
-        if args.category is None:
+        if getattr(args, 'category', None) is None:
             args.category = raw_resource.category
-        if args.title is None:
+        if getattr(args, 'title', None) is None:
             args.title = raw_resource.title
 
     def guess_resource_category(self, args, arbitrary_service_order=None) -> 'Type[Resource]':
@@ -270,9 +861,26 @@ class Registry:
             args.service = service.name
             return self.get_resource_category(args.resource[1])
 
-    def search(self, category, resource_name, filter_by_services):
-        for service_name, service in self.services.items():
-            if service_name in filter_by_services or not filter_by_services:
-                for result in service.search(category, resource_name):
-                    yield result
+    def search(self, category, query, filter_by_services=None, limit=20):
+        """
+        Finds the resources of a given category (raw resources and local files alike) that match
+        the query, best matches first, as SearchResults with a highlighted snippet.
+        """
+        services = [self.get_service(name) for name in filter_by_services or []]
+        for service in services or [service for services in self.services.values() for service in services]:
+            service.refresh_search_index(self)
+        category_names = self.get_resource_category(category).category_names
+        match_query = make_match_query(query)
+        if not match_query:
+            return []
+        terms = ["search_index MATCH ?", "category IN ({})".format(", ".join("?" * len(category_names)))]
+        if services:
+            terms.append("service IN ({})".format(", ".join("?" * len(services))))
+        # Matches in the title count for much more than matches in the body
+        results = self.db.execute(
+            "SELECT service, category, title, disambiguate, snippet(search_index, -1, '[', ']', '...', 12) "
+            "FROM search_index WHERE {} ORDER BY bm25(search_index, 0, 0, 10.0, 0, 1.0) LIMIT ?".format(
+                " AND ".join(terms)),
+            (match_query, *category_names, *(service.name for service in services), limit))
+        return [SearchResult(*result) for result in results]
 
@@ -60,11 +60,14 @@ class Assignment(CanvasResource):
                                               category=cls.name, disambiguate="")
         full_assignment = json.loads(raw_resource.data)
         assignment_data = cls._make_canvas_upload(registry, full_assignment, args)
-        remote_assignment = cls.find(canvas, args.title)
+        remote_assignment = cls.find_remote(registry, canvas, args.title)
         if remote_assignment is None:
-            canvas.api.post('assignments/', data=assignment_data)
+            uploaded_assignment = canvas.api.post('assignments/', data=assignment_data)
         else:
-            canvas.api.put("assignments/{aid}".format(aid=remote_assignment['id']), data=assignment_data)
+            uploaded_assignment = canvas.api.put("assignments/{aid}".format(aid=remote_assignment['id']),
+                                                 data=assignment_data)
+        if 'id' in uploaded_assignment:
+            cls.remember(registry, canvas, args.title, uploaded_assignment, pushed=True)
 
     @classmethod
     def _make_canvas_upload(cls, registry: Registry, data, args):
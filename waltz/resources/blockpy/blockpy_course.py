@@ -61,11 +61,12 @@ class BlockPyCourse(BlockPyResource):
     def download(cls, registry: Registry, args):
         blockpy = registry.get_service(args.service, "blockpy")
         course, groups, problems = cls.get_full_course(blockpy, args.title)
-        for url, contents in problems.items():
-            registry.store_resource(blockpy.name, 'problem', url, "", json.dumps(contents))
-        for url, contents in groups.items():
-            registry.store_resource(blockpy.name, "blockpy_group", url, "", json.dumps(contents))
-        registry.store_resource(blockpy.name, "blockpy_course", args.title, course['id'], json.dumps(course))
+        pulled = ([(blockpy.name, 'problem', url, "", json.dumps(contents)) for url, contents in problems.items()] +
+                  [(blockpy.name, "blockpy_group", url, "", json.dumps(contents)) for url, contents in groups.items()] +
+                  [(blockpy.name, "blockpy_course", args.title, course['id'], json.dumps(course))])
+        with registry.transaction():
+            registry.store_resources(pulled)
+            registry.record_versions(pulled)
 
     @classmethod
     def get_full_course(cls, blockpy, title):
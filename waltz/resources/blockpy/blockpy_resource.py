@@ -24,7 +24,7 @@ class BlockPyResource(Resource):
         local = registry.get_service(args.local_service, 'local')
         # TODO: use disambiguate
         if args.all:
-            raw_resources = registry.find_all_resources(service=args.service, category=cls.name)
+            raw_resources = registry.iter_resources(service=args.service, category=cls.name)
         else:
             raw_resources = [registry.find_resource(title=args.title,
                                                     service=args.service, category=cls.name)]
@@ -57,7 +57,10 @@ class Problem(BlockPyResource):
         elif not potentials:
             raise WaltzResourceNotFound(f"No problem with URL '{args.title}' found.")
         assignment = potentials[0]
-        registry.store_resource(blockpy.name, 'problem', assignment['url'], "", json.dumps(assignment))
+        pulled = (blockpy.name, 'problem', assignment['url'], "", json.dumps(assignment))
+        with registry.transaction():
+            registry.store_resource(*pulled)
+            registry.record_versions([pulled])
 
     @classmethod
     def upload(cls, registry: Registry, args):
@@ -29,51 +29,103 @@ class CanvasResource(Resource):
                 pass
         return None
 
+    # Fixed widths, so that rows can be printed as soon as their page arrives
+    LIST_ROW = "{:<8}{:<10}{:<40} {}"
+
     @classmethod
     def list(cls, registry, canvas, args):
+        """ Prints each page of resources as it arrives, in the order Canvas sends them. """
         local = registry.get_service(args.local_service, 'local')
-        resources = canvas.api.get(cls.endpoint, retrieve_all=True, data={"search_term": args.term})
-        rows = []
-        for resource in natsorted(resources, key=cls.sort_resource):
-            try:
-                path = local.find_existing(registry, resource[cls.title_attribute], args=args)
-                rows.append(("Yes", "Yes", resource[cls.title_attribute], os.path.relpath(path)))
-            except WaltzAmbiguousResource as war:
-                paths = "\n".join(os.path.relpath(path) for path in war.args[0])
-                rows.append(("Yes", "Multiple", resource[cls.title_attribute], paths))
-            except FileNotFoundError:
-                rows.append(("Yes", "No", resource[cls.title_attribute], ""))
-        print(tabulate(rows, ('Remote', 'Local', 'Title', 'Path')))
+        print(cls.LIST_ROW.format('Remote', 'Local', 'Title', 'Path'))
+        print(cls.LIST_ROW.format('------', '-----', '-----', '----'))
+        for resources in canvas.api.iter_pages(cls.endpoint, data={"search_term": args.term}):
+            for resource in resources:
+                remote, present, title, paths = cls.make_list_row(registry, local, resource, args)
+                # Every other path of an ambiguous resource goes on its own line, under the first
+                paths = paths.replace("\n", "\n" + " " * len(cls.LIST_ROW.format("", "", "", "")))
+                print(cls.LIST_ROW.format(remote, present, title, paths), flush=True)
 
+    @classmethod
+    def make_list_row(cls, registry, local, resource, args):
+        try:
+            path = local.find_existing(registry, resource[cls.title_attribute], args=args)
+            return "Yes", "Yes", resource[cls.title_attribute], os.path.relpath(path)
+        except WaltzAmbiguousResource as war:
+            paths = "\n".join(os.path.relpath(path) for path in war.args[0])
+            return "Yes", "Multiple", resource[cls.title_attribute], paths
+        except FileNotFoundError:
+            return "Yes", "No", resource[cls.title_attribute], ""
 
     @classmethod
     def find(cls, canvas, title):
         # TODO: Change canvas -> registry, title -> args
-        resources = canvas.api.get(cls.endpoint, retrieve_all=True, data={"search_term": title})
-        for resource in resources:
+        for resource in canvas.api.iter_items(cls.endpoint, data={"search_term": title}):
             if resource[cls.title_attribute] == title:
                 return canvas.api.get(cls.endpoint + str(resource[cls.id]))
         return None
 
+    @classmethod
+    def find_by_id(cls, canvas, resource_id):
+        resource = canvas.api.get(cls.endpoint + str(resource_id))
+        if not isinstance(resource, dict) or 'errors' in resource:
+            return None
+        return resource
+
+    @classmethod
+    def find_remote(cls, registry: Registry, canvas, title):
+        """
+        Finds the remote version of a resource. If we have seen it before, we go straight to its
+        ID; searching by title is only needed the first time, or if it was deleted on Canvas.
+        """
+        remote_id = registry.find_remote_id(canvas.name, cls.name, title)
+        if remote_id is not None:
+            resource = cls.find_by_id(canvas, remote_id)
+            if resource is not None:
+                return resource
+            registry.forget_remote_reference(canvas.name, cls.name, title)
+        resource = cls.find(canvas, title)
+        if resource is not None:
+            cls.remember(registry, canvas, title, resource)
+        return resource
+
+    @classmethod
+    def remember(cls, registry: Registry, canvas, title, resource, pulled=False, pushed=False):
+        # Only after a pull does our copy of the data match this remote version
+        remote_updated_at = resource.get('updated_at') if pulled else None
+        registry.store_remote_reference(canvas.name, cls.name, title, resource[cls.id],
+                                        remote_url=resource.get('html_url'), remote_updated_at=remote_updated_at,
+                                        pulled=pulled, pushed=pushed)
+
     @classmethod
     def download_all(cls, registry: Registry, args):
         canvas = registry.get_service(args.service, "canvas")
         local = registry.get_service('local')
-        resources = canvas.api.get(cls.endpoint, retrieve_all=True)
         rows = []
-        for resource in tqdm(natsorted(resources, key=cls.sort_resource)):
-            try:
-                path = local.find_existing(registry, resource[cls.title_attribute], args=args)
-                rows.append(("Yes", "Yes", resource[cls.title_attribute], os.path.relpath(path)))
-            except WaltzAmbiguousResource as war:
-                paths = "\n".join(os.path.relpath(path) for path in war.args[0])
-                rows.append(("Yes", "Multiple", resource[cls.title_attribute], paths))
-            except FileNotFoundError:
-                rows.append(("Yes", "No", resource[cls.title_attribute], ""))
-            full_resource = canvas.api.get(cls.endpoint + str(resource[cls.id]))
-            registry.store_resource(canvas.name, cls.name, resource[cls.title_attribute], "", json.dumps(full_resource))
+        unchanged = 0
+        known_versions = registry.find_remote_versions(canvas.name, cls.name)
+        progress = tqdm(unit=cls.name)
+        for resources in canvas.api.iter_pages(cls.endpoint):
+            rows.extend((cls.sort_resource(resource), cls.make_list_row(registry, local, resource, args))
+                        for resource in resources)
+            # No need to download anything that hasn't changed since we last did
+            changed = [resource for resource in resources
+                       if resource.get('updated_at') is None
+                       or known_versions.get(str(resource[cls.id])) != resource['updated_at']]
+            unchanged += len(resources) - len(changed)
+            # Grab every full resource on this page at once, while the next page downloads
+            full_resources = canvas.api.get_many([cls.endpoint + str(resource[cls.id]) for resource in changed])
+            with registry.transaction():
+                pulled = [(canvas.name, cls.name, resource[cls.title_attribute], "", json.dumps(full_resource))
+                          for resource, full_resource in zip(changed, full_resources)]
+                registry.store_resources(pulled)
+                registry.record_versions(pulled)
+                for resource, full_resource in zip(changed, full_resources):
+                    cls.remember(registry, canvas, resource[cls.title_attribute], full_resource, pulled=True)
+            progress.update(len(resources))
+        progress.close()
+        rows = [row for _, row in natsorted(rows, key=lambda pair: pair[0])]
         print(tabulate(rows, ('Remote', 'Local', 'Title', 'Path')))
-        print("Downloaded", len(resources), cls.name_plural)
+        print("Downloaded", len(rows) - unchanged, cls.name_plural, "({} unchanged)".format(unchanged))
 
     @classmethod
     def download(cls, registry: Registry, args):
@@ -81,23 +133,25 @@ class CanvasResource(Resource):
             cls.download_all(registry, args)
             return
         canvas = registry.get_service(args.service, "canvas")
-        resource_json = cls.find(canvas, args.title)
+        resource_json = cls.find_remote(registry, canvas, args.title)
         if resource_json is not None:
             try:
                 registry.find_resource(canvas.name, cls.name, args.title, "")
                 print("Downloaded new version of {}: ".format(cls.name), args.title)
             except WaltzException:
                 print("Downloaded new {}:".format(cls.name), args.title)
-            resource_json = json.dumps(resource_json)
-            registry.store_resource(canvas.name, cls.name, args.title, "", resource_json)
+            remote_resource, resource_json = resource_json, json.dumps(resource_json)
+            with registry.transaction():
+                registry.store_resource(canvas.name, cls.name, args.title, "", resource_json)
+                registry.record_versions([(canvas.name, cls.name, args.title, "", resource_json)])
+                cls.remember(registry, canvas, args.title, remote_resource, pulled=True)
             return resource_json
         cls.find_similar(registry, canvas, args)
 
     @classmethod
     def find_similar(cls, registry: Registry, canvas, args):
         print("No", cls.name_plural, "with that title was found:", args.title)
-        all_resources = canvas.api.get(cls.endpoint, retrieve_all=True)
-        all_titles = [resource['title'] for resource in all_resources]
+        all_titles = [resource[cls.title_attribute] for resource in canvas.api.iter_items(cls.endpoint)]
         similar_titles = difflib.get_close_matches(args.title, all_titles)
         if similar_titles:
             print("Similar", cls.name_plural, "found:")
@@ -111,7 +165,7 @@ class CanvasResource(Resource):
         local = registry.get_service(args.local_service, 'local')
         # TODO: use disambiguate
         if args.all:
-            raw_resources = registry.find_all_resources(service=args.service, category=cls.name)
+            raw_resources = registry.iter_resources(service=args.service, category=cls.name)
         else:
             raw_resources = [registry.find_resource(title=args.title, service=args.service, category=cls.name)]
         folder = None if args.combine else cls.folder_file
@@ -29,11 +29,14 @@ class Page(CanvasResource):
         raw_resource = registry.find_resource(title=args.title, service=args.service,
                                               category=args.category, disambiguate=args.url)
         full_page = json.loads(raw_resource.data)
-        canvas.api.put("pages/{url}".format(url=full_page['title']), data={
+        page_url = registry.find_remote_id(canvas.name, cls.name, args.title) or full_page['title']
+        updated_page = canvas.api.put("pages/{url}".format(url=page_url), data={
             'wiki_page[title]': full_page['title'],
             'wiki_page[body]': full_page['body'],
             'wiki_page[published]': full_page['published']
         })
+        if 'url' in updated_page:
+            cls.remember(registry, canvas, args.title, updated_page, pushed=True)
         # TODO: Handle other fields
         # wiki_page[editing_roles]
         # wiki_page[notify_of_update]
@@ -1,7 +1,9 @@
+import copy
 import difflib
 import json
 import os
 import sys
+import time
 from pprint import pprint
 
 from ruamel.yaml.comments import CommentedMap
@@ -16,7 +18,7 @@ from waltz.resources.raw import RawResource
 from waltz.resources.resource import Resource
 from waltz.tools.html_markdown_utilities import hide_data_in_html, m2h
 from waltz.tools.utilities import get_files_last_update, from_canvas_date, to_friendly_date_from_datetime, start_file, \
-    to_friendly_date, from_friendly_date, json_bool
+    to_friendly_date, from_friendly_date, json_bool, fingerprint_payload
 
 
 class Quiz(CanvasResource):
@@ -60,20 +62,53 @@ class Quiz(CanvasResource):
     @classmethod
     def find(cls, canvas, title):
         # TODO: Change canvas -> registry, title -> args
-        resources = canvas.api.get(cls.endpoint, retrieve_all=True, data={"search_term": title})
-        for resource in resources:
-            if resource['title'] == title:
-                quiz = canvas.api.get(cls.endpoint + str(resource[cls.id]))
-                # Grab the questions' JSON
-                quiz['questions'] = canvas.api.get("quizzes/{quiz_id}/questions/".format(quiz_id=quiz['id']), retrieve_all=True)
-                # And the groups' JSON
-                group_ids = {question['quiz_group_id'] for question in quiz['questions']
-                             if question['quiz_group_id'] is not None}
-                quiz['groups'] = {group_id: canvas.api.get(
-                    'quizzes/{quiz_id}/groups/{group_id}'.format(quiz_id=quiz['id'], group_id=group_id))
-                          for group_id in group_ids}
-                return quiz
-        return None
+        quiz_id = canvas.memo.get('quiz_ids', {}).get(title)
+        if quiz_id is None:
+            for resource in canvas.api.iter_items(cls.endpoint, data={"search_term": title}):
+                if resource['title'] == title:
+                    quiz_id = resource[cls.id]
+                    break
+            else:
+                return None
+        return cls.find_by_id(canvas, quiz_id)
+
+    @classmethod
+    def find_by_id(cls, canvas, quiz_id):
+        # Full quizzes that were already found during this command, by quiz id
+        found_quizzes = canvas.memo.setdefault('quizzes', {})
+        key = str(quiz_id)
+        if key not in found_quizzes:
+            quiz = canvas.api.run(cls._find_full_quiz(canvas, quiz_id))
+            if quiz is None:
+                return None
+            found_quizzes[key] = quiz
+            canvas.memo.setdefault('quiz_ids', {})[quiz['title']] = quiz_id
+        # Callers are free to modify what they get back
+        return copy.deepcopy(found_quizzes[key])
+
+    @classmethod
+    def forget(cls, canvas, quiz_id):
+        """ Drops a quiz from the memo, e.g. because we just changed it on Canvas. """
+        quiz = canvas.memo.get('quizzes', {}).pop(str(quiz_id), None)
+        if quiz is not None:
+            canvas.memo.get('quiz_ids', {}).pop(quiz['title'], None)
+
+    @classmethod
+    async def _find_full_quiz(cls, canvas, quiz_id):
+        # Grab the quiz and its questions' JSON at the same time
+        quiz, questions = await canvas.api.aio.gather(
+            canvas.api.aio.get(cls.endpoint + str(quiz_id)),
+            canvas.api.aio.get("quizzes/{quiz_id}/questions/".format(quiz_id=quiz_id), retrieve_all=True))
+        if 'errors' in quiz:
+            return None
+        quiz['questions'] = questions
+        # And the groups' JSON
+        group_ids = sorted({question['quiz_group_id'] for question in quiz['questions']
+                            if question['quiz_group_id'] is not None})
+        groups = await canvas.api.aio.get_many(['quizzes/{quiz_id}/groups/{group_id}'.format(
+            quiz_id=quiz_id, group_id=group_id) for group_id in group_ids])
+        quiz['groups'] = dict(zip(group_ids, groups))
+        return quiz
 
     @classmethod
     def upload(cls, registry: Registry, args):
@@ -83,103 +118,146 @@ class Quiz(CanvasResource):
                                               category=args.category, disambiguate=args.id)
         local_quiz = json.loads(raw_resource.data)
         # Get the remote version
-        remote_quiz = cls.find(canvas, args.title)
+        remote_quiz = cls.find_remote(registry, canvas, args.title)
         # Either put or post the quiz
         if remote_quiz is None:
             cls.upload_new(registry, local_quiz, args)
         else:
             cls.upload_edit(registry, remote_quiz, local_quiz, args)
+            cls.remember(registry, canvas, args.title, remote_quiz, pushed=True)
 
     @classmethod
     def upload_new(cls, registry: Registry, local_quiz, args):
         canvas = registry.get_service(args.service, "canvas")
+        aio = canvas.api.aio
+        started, requests_before = time.perf_counter(), canvas.api.request_count
         quiz_data = cls._make_canvas_upload(registry, local_quiz, args)
         created_quiz = canvas.api.post('quizzes/', data=quiz_data)
         if 'errors' in created_quiz:
             pprint(created_quiz['errors'])
             raise WaltzException("Error loading data, see above.")
         print("Created quiz", local_quiz['title'], "on canvas")
-        # Create the groups
+        cls.remember(registry, canvas, local_quiz['title'], created_quiz, pushed=True)
+        # Create the groups (all at once); the questions need their new IDs
+        created_groups = canvas.api.run(aio.gather(*[
+            aio.post('quizzes/{quiz_id}/groups'.format(quiz_id=created_quiz['id']),
+                     data=QuizGroup._make_canvas_upload(registry, group, args))
+            for group in local_quiz['groups'].values()]))
         group_name_to_id = {}
-        for group in local_quiz['groups'].values():
-            group_data = QuizGroup._make_canvas_upload(registry, group, args)
-            created_group = canvas.api.post('quizzes/{quiz_id}/groups'.format(quiz_id=created_quiz['id']),
-                                            data=group_data)
+        for created_group in created_groups:
             created_group = created_group['quiz_groups'][0]  # acbart: Weird response type
             # acbart: Okay because names are strings and IDs are ints
             group_name_to_id[created_group['name']] = created_group['id']
             group_name_to_id[created_group['id']] = created_group['id']
         if local_quiz['groups']:
             print("Created quiz", local_quiz['title'], "groups on canvas")
-        # Create the questions
-        for question in local_quiz['questions']:
+        # Create the questions (all at once, so their order has to be explicit)
+        question_uploads = []
+        for position, question in enumerate(local_quiz['questions'], 1):
             if 'quiz_group_id' in question and question['quiz_group_id'] is not None:
                 question['quiz_group_id'] = group_name_to_id[question['quiz_group_id']]
+            question['position'] = position
             question_data = QuizQuestion._make_canvas_upload(registry, question, args)
-            created_question = canvas.api.post('quizzes/{quiz_id}/questions'.format(quiz_id=created_quiz['id']),
-                                               data=question_data)
+            question_uploads.append(aio.post('quizzes/{quiz_id}/questions'.format(quiz_id=created_quiz['id']),
+                                             data=question_data))
+        canvas.api.run(aio.gather(*question_uploads))
         print("Created quiz", local_quiz['title'], "questions on canvas")
-
+        cls.print_upload_summary(local_quiz['title'], started, canvas.api.request_count - requests_before)
 
     @classmethod
     def upload_edit(cls, registry: Registry, old_quiz, new_quiz, args):
         canvas = registry.get_service(args.service, "canvas")
+        aio = canvas.api.aio
+        started, requests_before = time.perf_counter(), canvas.api.request_count
         quiz_id = old_quiz['id']
+        cls.forget(canvas, quiz_id)
         # Edit the quiz on canvas
         quiz_data = cls._make_canvas_upload(registry, new_quiz, args)
-        canvas.api.put('quizzes/{quiz_id}'.format(quiz_id=quiz_id), data=quiz_data)
-        print("Updated quiz", old_quiz['title'], "on canvas")
+        if fingerprint_payload(quiz_data) != fingerprint_payload(cls._make_canvas_upload(registry, old_quiz, args)):
+            canvas.api.put('quizzes/{quiz_id}'.format(quiz_id=quiz_id), data=quiz_data)
+            print("Updated quiz", old_quiz['title'], "on canvas")
         # Make a map of the old groups' names/ids to the groups
         old_group_map = {}
         for group in old_quiz['groups'].values():
             old_group_map[group['name']] = group
             old_group_map[group['id']] = group
         # Update groups with the same name and create new ones
+        # (skipping any whose upload would be identical to what Canvas already has)
+        group_uploads = []
         used_groups = {}
         for group in new_quiz['groups'].values():
             group_data = QuizGroup._make_canvas_upload(registry, group, args)
             if group['name'] in old_group_map:
                 canvas_group = old_group_map[group['name']]
-                canvas_group = canvas.api.put('quizzes/{quiz_id}/groups/{group_id}'.format(quiz_id=quiz_id,
-                                                                                           group_id=canvas_group['id']),
-                                              data=group_data)
+                if cls.is_unchanged(QuizGroup, registry, canvas_group, group, args):
+                    used_groups[canvas_group['name']] = canvas_group
+                    used_groups[canvas_group['id']] = canvas_group
+                    continue
+                group_uploads.append(aio.put('quizzes/{quiz_id}/groups/{group_id}'.format(
+                    quiz_id=quiz_id, group_id=canvas_group['id']), data=group_data))
             else:
-                canvas_group = canvas.api.post('quizzes/{quiz_id}/groups'.format(quiz_id=quiz_id),
-                                               data=group_data)
+                group_uploads.append(aio.post('quizzes/{quiz_id}/groups'.format(quiz_id=quiz_id),
+                                              data=group_data))
+        for canvas_group in canvas.api.run(aio.gather(*group_uploads)):
             canvas_group = canvas_group['quiz_groups'][0] # acbart: Weird response type
             used_groups[canvas_group['name']] = canvas_group
             used_groups[canvas_group['id']] = canvas_group
         if new_quiz['groups']:
             print("Updated quiz", old_quiz['title'], "groups on canvas")
         # Delete any groups that no longer have a reference
-        for old_group in old_quiz['groups'].values():
-            if old_group['id'] not in used_groups:
-                canvas.api.delete('quizzes/{quiz_id}/groups/{group_id}'.format(quiz_id=quiz_id,
-                                                                               group_id=old_group['id']))
-                print("Deleted question group", old_group['name'], " (ID: {})".format(old_group['id']))
-        # Push all the questions
+        stale_groups = [old_group for old_group in old_quiz['groups'].values()
+                        if old_group['id'] not in used_groups]
+        canvas.api.run(aio.gather(*[
+            aio.delete('quizzes/{quiz_id}/groups/{group_id}'.format(quiz_id=quiz_id, group_id=old_group['id']))
+            for old_group in stale_groups]))
+        for old_group in stale_groups:
+            print("Deleted question group", old_group['name'], " (ID: {})".format(old_group['id']))
+        # Push all the questions (all at once, so their order has to be explicit)
         name_map = {q['question_name']: q for q in old_quiz['questions']}
+        question_uploads = []
         used_questions = {}
-        for new_question in new_quiz['questions']:
+        for position, new_question in enumerate(new_quiz['questions'], 1):
             if new_question.get('quiz_group_id') is not None:
                 new_question['quiz_group_id'] = used_groups[new_question['quiz_group_id']]['id']
+            new_question['position'] = position
             question_data = QuizQuestion._make_canvas_upload(registry, new_question, args)
             if new_question['question_name'] in name_map:
                 canvas_question = name_map[new_question['question_name']]
-                canvas_question = canvas.api.put('quizzes/{quiz_id}/questions/{question_id}'.format(quiz_id=quiz_id,
-                                                                                                    question_id=canvas_question['id']),
-                                                 data=question_data)
+                if cls.is_unchanged(QuizQuestion, registry, canvas_question, new_question, args):
+                    used_questions[canvas_question['id']] = canvas_question
+                    continue
+                question_uploads.append(aio.put('quizzes/{quiz_id}/questions/{question_id}'.format(
+                    quiz_id=quiz_id, question_id=canvas_question['id']), data=question_data))
             else:
-                canvas_question = canvas.api.post('quizzes/{quiz_id}/questions'.format(quiz_id=quiz_id),
-                                                  data=question_data)
+                question_uploads.append(aio.post('quizzes/{quiz_id}/questions'.format(quiz_id=quiz_id),
+                                                 data=question_data))
+        for canvas_question in canvas.api.run(aio.gather(*question_uploads)):
             used_questions[canvas_question['id']] = canvas_question
-        print("Updated quiz", old_quiz['title'], "questions on canvas")
+        print("Updated quiz", old_quiz['title'], "questions on canvas",
+              "({} unchanged)".format(len(new_quiz['questions']) - len(question_uploads)))
         # Delete any old questions
-        for question in old_quiz['questions']:
-            if question['id'] not in used_questions:
-                canvas.api.delete('quizzes/{quiz_id}/questions/{question_id}'.format(quiz_id=quiz_id,
-                                                                                     question_id=question['id']))
-                print("Deleted question", question.get('name', "NO NAME"), " (ID: {})".format(question['id']))
+        stale_questions = [question for question in old_quiz['questions']
+                           if question['id'] not in used_questions]
+        canvas.api.run(aio.gather(*[
+            aio.delete('quizzes/{quiz_id}/questions/{question_id}'.format(
+                quiz_id=quiz_id, question_id=question['id']))
+            for question in stale_questions]))
+        for question in stale_questions:
+            print("Deleted question", question.get('name', "NO NAME"), " (ID: {})".format(question['id']))
+        cls.print_upload_summary(old_quiz['title'], started, canvas.api.request_count - requests_before)
+
+    @classmethod
+    def is_unchanged(cls, kind, registry: Registry, remote, local, args):
+        """ Whether uploading the ``local`` question/group would leave the ``remote`` one as it is. """
+        # A question that changed type is always uploaded (Waltz may not even be able to encode the old type)
+        if remote.get('question_type') != local.get('question_type'):
+            return False
+        return kind.fingerprint(registry, remote, args) == kind.fingerprint(registry, local, args)
+
+    @classmethod
+    def print_upload_summary(cls, title, started, request_count):
+        print("Uploaded quiz {} in {:.1f}s using {} requests".format(title, time.perf_counter() - started,
+                                                                      request_count))
 
     REQUIRED_UPLOAD_FIELDS = ['title', 'description', 'quiz_type']
     OPTIONAL_UPLOAD_FIELDS = ['time_limit', 'shuffle_answers', 'hide_results',
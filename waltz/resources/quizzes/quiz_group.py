@@ -3,6 +3,7 @@ from ruamel.yaml.comments import CommentedMap
 from waltz.registry import Registry
 from waltz.resources.canvas_resource import CanvasResource
 from waltz.resources.quizzes import QuizQuestion
+from waltz.tools.utilities import fingerprint_payload
 
 
 class QuizGroup(CanvasResource):
@@ -51,6 +52,10 @@ class QuizGroup(CanvasResource):
             'quiz_groups[][question_points]': data['question_points']
         }
 
+    @classmethod
+    def fingerprint(cls, registry: Registry, data, args):
+        return fingerprint_payload(cls._make_canvas_upload(registry, data, args))
+
     @classmethod
     def from_json(cls, course, json_data):
         new_question = QuizGroup(course=course, **json_data)
@@ -9,7 +9,7 @@ from waltz.registry import Registry
 from waltz.resources.canvas_resource import CanvasResource
 from waltz.tools import h2m, extract_front_matter, m2h
 from waltz.tools.html_markdown_utilities import hide_data_in_html
-from waltz.tools.utilities import make_safe_filename
+from waltz.tools.utilities import make_safe_filename, fingerprint_payload
 
 
 class QuizQuestion(CanvasResource):
@@ -128,6 +128,14 @@ class QuizQuestion(CanvasResource):
         question_type = cls.TYPES[question['question_type']]
         return question_type._make_canvas_upload_raw(registry, question, args)
 
+    @classmethod
+    def fingerprint(cls, registry: Registry, question, args):
+        """
+        Hashes what would be uploaded for this question, whether it came from a local
+        file or from Canvas.
+        """
+        return fingerprint_payload(cls._make_canvas_upload(registry, question, args))
+
     @classmethod
     def _make_canvas_upload_raw(cls, registry: Registry, question, args):
         raise NotImplementedError(question['question_type'])
@@ -143,6 +151,7 @@ class QuizQuestion(CanvasResource):
             'question[correct_comments_html]': data['correct_comments_html'],
             'question[incorrect_comments_html]': data['incorrect_comments_html'],
             'question[neutral_comments_html]': data['neutral_comments_html'],
+            'question[position]': data.get('position'),
         }
 
     @classmethod
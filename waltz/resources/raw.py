@@ -1,3 +1,6 @@
+from waltz.tools.compression import decompress
+
+
 class RawResource:
     service: str
     category: str
@@ -14,4 +17,5 @@ class RawResource:
 
     @classmethod
     def from_database(cls, row):
-        return RawResource(*row)
+        service, category, title, disambiguate, data, codec = row
+        return RawResource(service, category, title, disambiguate, decompress(data, codec))
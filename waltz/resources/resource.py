@@ -1,11 +1,14 @@
 import difflib
 import json
 import os
+from datetime import datetime
 from typing import List
 
+from tabulate import tabulate
+
 from waltz.registry import Registry
 from waltz.services.service import Service
-from waltz.tools.utilities import start_file, get_parent_directory
+from waltz.tools.utilities import start_file, get_parent_directory, to_friendly_date_from_datetime
 
 
 class Resource:
@@ -82,7 +85,7 @@ class Resource:
         # Get remote version
         service = registry.get_service(args.service, cls.default_service)
         service_name = service.type.title()
-        resource_json = cls.find(service, args.title)
+        resource_json = cls.find_remote(registry, service, args.title)
         if resource_json is None:
             print(f"No {service_name} version of {args.title}")
         # Do the diff if we can
@@ -143,6 +146,48 @@ class Resource:
             if not args.prevent_open:
                 start_file(local_diff_path)
 
+    @classmethod
+    def history(cls, registry: Registry, args):
+        """
+        Lists, compares, and restores the versions of this resource that were pulled before,
+        entirely from the Registry Database.
+        """
+        service = registry.get_service(args.service, cls.default_service)
+        disambiguate = args.id or args.url or ""
+        key = (service.name, cls.name, args.title)
+        if args.keep is not None:
+            evicted = registry.prune_history(*key, disambiguate=disambiguate, max_versions=args.keep)
+            print("Removed", evicted, "old versions of", args.title)
+        versions = registry.find_versions(*key, disambiguate=disambiguate)
+        if not versions:
+            print("No versions of {} have been downloaded.".format(args.title))
+            return
+        if args.restore is not None:
+            registry.restore_version(*key, args.restore, disambiguate=disambiguate)
+            print("Restored version {} of {}; decode it to update your local copy.".format(args.restore, args.title))
+        elif args.diff:
+            older = args.diff[0]
+            newer = args.diff[1] if len(args.diff) > 1 else versions[-1][0]
+            older_lines = cls.format_version(registry.load_version(*key, older, disambiguate=disambiguate))
+            newer_lines = cls.format_version(registry.load_version(*key, newer, disambiguate=disambiguate))
+            for difference in difflib.unified_diff(older_lines, newer_lines, "Version {}".format(older),
+                                                   "Version {}".format(newer)):
+                print(difference, end="")
+        else:
+            rows = [(version, to_friendly_date_from_datetime(datetime.utcfromtimestamp(pulled_at)), size)
+                    for version, pulled_at, size, _ in versions]
+            print(tabulate(rows, ('Version', 'Downloaded', 'Bytes')))
+
+    @classmethod
+    def format_version(cls, data):
+        if isinstance(data, bytes):
+            return ["<{} bytes of binary data>\n".format(len(data))]
+        try:
+            data = json.dumps(json.loads(data), indent=2, sort_keys=True)
+        except ValueError:
+            pass
+        return (data + "\n").splitlines(True)
+
     @classmethod
     def decode_json(cls, registry: Registry, data, args):
         raise NotImplementedError(repr(data))
@@ -163,6 +208,10 @@ class Resource:
     def find(cls, service: Service, data):
         raise NotImplementedError(repr(data))
 
+    @classmethod
+    def find_remote(cls, registry: Registry, service: Service, title):
+        return cls.find(service, title)
+
     @classmethod
     def diff_extra_files(cls, registry: Registry, data, args):
         return []
@@ -1,6 +1 @@
 import waltz.services.service
-
-import waltz.services.local
-import waltz.services.canvas
-import waltz.services.blockpy
-import waltz.services.gradescope
\ No newline at end of file
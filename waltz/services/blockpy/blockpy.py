@@ -1,5 +1,4 @@
 from waltz.exceptions import WaltzException
-from waltz.services.blockpy.api import BlockPyAPI
 from waltz.services.service import Service
 
 
@@ -24,7 +23,11 @@ class BlockPy(Service):
                 raise WaltzException("Missing required BlockPy configuration parameter {}".format(field))
             else:
                 used_settings[field] = default_value
-        self.api = BlockPyAPI(**used_settings)
+        self.used_settings = used_settings
+
+    def connect(self):
+        from waltz.services.blockpy.api import BlockPyAPI
+        return BlockPyAPI(**self.used_settings)
 
     @classmethod
     def configure(cls, args):
@@ -53,11 +56,11 @@ class BlockPy(Service):
 
     def list(self, registry, args):
         if args.category in ('course', 'courses', 'blockpy_course', 'blockpy_courses'):
-            self.RESOURCES['blockpy_course'].list(registry, self, args)
+            self.get_resource_base('blockpy_course').list(registry, self, args)
         elif args.category in ('problem', 'problems', 'blockpy_problem', 'blockpy_problems'):
-            self.RESOURCES['problem'].list(registry, self, args)
+            self.get_resource_base('problem').list(registry, self, args)
         elif args.category in ('group', 'groups', 'blockpy_group', 'blockpy_groups'):
-            self.RESOURCES['group'].list(registry, self, args)
+            self.get_resource_base('group').list(registry, self, args)
         # waltz list blockpy courses
         # waltz list blockpy groups
         pass
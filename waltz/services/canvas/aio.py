@@ -0,0 +1,50 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncCanvasAPI:
+    """
+    An asyncio flavor of :class:`CanvasAPI` with the same ``get/post/put/delete/progress_loop``
+    surface. It shares the wrapped API's session, throttle, and cache; each call runs the
+    blocking request on a worker thread, so many of them can be awaited at once on a single
+    event loop (e.g., with :meth:`gather`). The throttle still decides how many are
+    actually in flight.
+    """
+    api: 'CanvasAPI'
+    executor: ThreadPoolExecutor
+
+    def __init__(self, api):
+        self.api = api
+        self.executor = ThreadPoolExecutor(max_workers=api.pool_size, thread_name_prefix='canvas')
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+    async def get(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
+        return await self._call(self.api.get, command, data, retrieve_all, params, json, skip_course)
+
+    async def post(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
+        return await self._call(self.api.post, command, data, retrieve_all, params, json, skip_course)
+
+    async def put(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
+        return await self._call(self.api.put, command, data, retrieve_all, params, json, skip_course)
+
+    async def delete(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
+        return await self._call(self.api.delete, command, data, retrieve_all, params, json, skip_course)
+
+    async def progress_loop(self, progress_id, seconds_delay=3):
+        return await self._call(self.api.progress_loop, progress_id, seconds_delay)
+
+    @classmethod
+    async def gather(cls, *requests):
+        """ Awaits all of the given requests together, returning their results in order. """
+        return list(await asyncio.gather(*requests))
+
+    async def get_many(self, commands, **kwargs):
+        """ GETs every one of the ``commands`` at once, returning the results in order. """
+        return await self.gather(*[self.get(command, **kwargs) for command in commands])
@@ -1,6 +1,22 @@
+import asyncio
+import random
+import threading
+
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+
+from requests.adapters import HTTPAdapter
+
+from waltz.exceptions import WaltzException
+from waltz.services.canvas.aio import AsyncCanvasAPI
+from waltz.services.canvas.cache import CanvasResponseCache
+
+
+class WaltzCanvasServiceError(WaltzException):
+    pass
 
 
 def download_file(url, destination):
@@ -12,29 +28,199 @@ def download_file(url, destination):
     f.close()
 
 
+class CanvasThrottle:
+    """
+    Adaptive (AIMD) limit on the number of requests in flight to Canvas.
+
+    Canvas charges every request against a leaky bucket and reports what is left in
+    the ``X-Rate-Limit-Remaining`` header. While the budget is healthy, the limit grows
+    by roughly one request per round of responses; when the budget runs low or Canvas
+    starts throttling us, the limit is halved.
+    """
+    limit: float
+    maximum: int
+    in_flight: int
+    remaining: float
+
+    LOW_BUDGET = 150.0
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.remaining = None
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record(self, response, throttled=False):
+        with self.condition:
+            remaining = response.headers.get('X-Rate-Limit-Remaining')
+            if remaining is not None:
+                try:
+                    self.remaining = float(remaining)
+                except ValueError:
+                    pass
+            if throttled or (self.remaining is not None and self.remaining < self.LOW_BUDGET):
+                self.decrease()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def decrease(self):
+        with self.condition:
+            self.limit = max(1.0, self.limit / 2)
+
+
 class CanvasAPI:
     course: str
     token: str
     base: str
+    pool_size: int
+    max_workers: int
+    max_retries: int
+    session: requests.Session
+    throttle: CanvasThrottle
+    cache: 'Optional[CanvasResponseCache]'
+    request_count: int
 
-    def __init__(self, base, token, course):
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_MAX_RETRIES = 5
+    PER_PAGE = 100
+    # Retrying these cannot apply a change twice
+    IDEMPOTENT_VERBS = ('GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS')
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 30.0
+
+    def __init__(self, base, token, course, pool_size=None, max_workers=None, max_retries=None, cache=None):
         self.base = base
         self.token = token
         self.course = course
+        self.pool_size = pool_size or self.DEFAULT_POOL_SIZE
+        self.max_workers = max_workers or self.DEFAULT_MAX_WORKERS
+        self.max_retries = self.DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+        self.session = self._make_session(self.pool_size)
+        self.throttle = CanvasThrottle(self.max_workers)
+        self.cache = cache
+        self._aio = None
+        self.request_count = 0
+        self._request_count_lock = threading.Lock()
+
+    @classmethod
+    def _make_session(cls, pool_size):
+        """
+        Builds a keep-alive session so that repeated calls reuse the same
+        TCP/TLS connection instead of paying the handshake on every request.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+
+    @property
+    def aio(self) -> AsyncCanvasAPI:
+        """ The asyncio flavor of this API, sharing its session, throttle, and cache. """
+        if self._aio is None:
+            self._aio = AsyncCanvasAPI(self)
+        return self._aio
+
+    def run(self, coroutine):
+        """ Synchronously runs a coroutine built from :attr:`aio` calls, returning its result. """
+        return asyncio.run(coroutine)
+
+    def get_many(self, commands, **kwargs):
+        return self.run(self.aio.get_many(commands, **kwargs))
+
+    def close(self):
+        if self._aio is not None:
+            self._aio.close()
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
 
     def get(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
-        return self._canvas_request(requests.get, command, data, params, json, retrieve_all, skip_course)
+        return self._canvas_request('GET', command, data, params, json, retrieve_all, skip_course)
 
     def post(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
-        return self._canvas_request(requests.post, command, data, params, json, retrieve_all, skip_course)
+        return self._canvas_request('POST', command, data, params, json, retrieve_all, skip_course)
 
     def put(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
-        return self._canvas_request(requests.put, command, data, params, json, retrieve_all, skip_course)
+        return self._canvas_request('PUT', command, data, params, json, retrieve_all, skip_course)
 
     def delete(self, command, data=None, retrieve_all=False, params=None, json=None, skip_course=False):
-        return self._canvas_request(requests.delete, command, data, params, json, retrieve_all, skip_course)
+        return self._canvas_request('DELETE', command, data, params, json, retrieve_all, skip_course)
 
-    def _canvas_request(self, verb, command, data, params, json, retrieve_all, skip_course):
+    def _send(self, verb, url, data, params, json, headers):
+        if verb != 'GET' or self.cache is None:
+            return self._send_with_retries(verb, url, data, params, json, headers)
+        key = self.cache.make_key(url, self.token, data, params)
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                self.cache.touch(key)
+                return self.cache.make_response(entry)
+            headers = self.cache.add_validators(entry, dict(headers))
+        response = self._send_with_retries(verb, url, data, params, json, headers)
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(key, revalidated=True)
+            return self.cache.make_response(entry)
+        self.cache.store(key, response)
+        return response
+
+    def _send_with_retries(self, verb, url, data, params, json, headers):
+        """
+        Sends a single request through the throttle, retrying when Canvas throttles us.
+        Server errors and dropped connections are only retried for idempotent verbs; a
+        throttled request was refused before Canvas did anything, so any verb is safe.
+        """
+        attempt = 0
+        while True:
+            response = None
+            try:
+                with self._request_count_lock:
+                    self.request_count += 1
+                with self.throttle:
+                    response = self.session.request(verb, url, data=data, params=params, json=json,
+                                                    headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if verb not in self.IDEMPOTENT_VERBS or attempt >= self.max_retries:
+                    raise WaltzCanvasServiceError("Could not connect to Canvas ({}):\n{}\n{}".format(
+                        verb, url, error))
+                self.throttle.decrease()
+            else:
+                throttled = self._is_throttled(response)
+                self.throttle.record(response, throttled)
+                retryable = throttled or (response.status_code >= 500 and verb in self.IDEMPOTENT_VERBS)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+            time.sleep(self._backoff_delay(attempt, response))
+            attempt += 1
+
+    @classmethod
+    def _is_throttled(cls, response):
+        return response.status_code == 403 and 'rate limit exceeded' in response.text.lower()
+
+    def _backoff_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+        if retry_after.isdigit():
+            return float(retry_after)
+        # "Full jitter" exponential backoff, so that parallel workers don't retry in lockstep
+        return random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt))
+
+    def _prepare_request(self, command, data, params, json, skip_course):
         if data is None:
             data = {}
         if params is None:
@@ -45,36 +231,120 @@ class CanvasAPI:
             headers['Authorization'] = "Bearer "+self.token
         else:
             data['access_token'] = self.token
-        next_url = self.base+"api/v1/"
+        url = self.base+"api/v1/"
         if not skip_course:
-            next_url += "courses/{course_id}/".format(course_id=self.course)
-        next_url += command
+            url += "courses/{course_id}/".format(course_id=self.course)
+        url += command
+        return url, data, params, headers
+
+    def _canvas_request(self, verb, command, data, params, json, retrieve_all, skip_course):
         if retrieve_all:
-            data['per_page'] = 100
             final_result = []
-            while True:
-                response = verb(next_url, data=data, params=params, json=json, headers=headers)
-                try:
-                    final_result += response.json()
-                except JSONDecodeError:
-                    raise Exception("{}\n{}".format(response, next_url))
-                if 'next' in response.links:
-                    next_url = response.links['next']['url']
+            for page in self.iter_pages(command, data, params, json, skip_course, verb):
+                final_result += page
+            return final_result
+        url, data, params, headers = self._prepare_request(command, data, params, json, skip_course)
+        response = self._send(verb, url, data, params, json, headers)
+        if response.status_code == 204:
+            return response
+        return self._parse_json(response, url)
+
+    def iter_items(self, command, data=None, params=None, json=None, skip_course=False):
+        """
+        Yields the items of a paginated endpoint one at a time, as their pages arrive.
+        """
+        for page in self.iter_pages(command, data, params, json, skip_course):
+            yield from page
+
+    def iter_pages(self, command, data=None, params=None, json=None, skip_course=False, verb='GET'):
+        """
+        Yields each page of a paginated endpoint as a list, in the server's order. Upcoming
+        pages are fetched in the background while the caller works on the current one, but
+        only a few pages are ever held at once, so memory is bounded by the page size.
+        """
+        url, data, params, headers = self._prepare_request(command, data, params, json, skip_course)
+        if data is not None:
+            data['per_page'] = self.PER_PAGE
+
+        def fetch(page_url):
+            response = self._send(verb, page_url, data, params, json, headers)
+            return response, self._parse_json(response, page_url)
+
+        response, page = fetch(url)
+        if 'next' not in response.links:
+            yield page
+            return
+        page_urls = self._get_remaining_page_urls(response)
+        pending = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                if page_urls is not None:
+                    # We know every page up front, so keep a window of them in flight
+                    page_urls = iter(page_urls)
+                    for page_url in page_urls:
+                        pending.append(executor.submit(fetch, page_url))
+                        if len(pending) >= self.max_workers:
+                            break
+                    yield page
+                    while pending:
+                        _, page = pending.pop(0).result()
+                        next_page_url = next(page_urls, None)
+                        if next_page_url is not None:
+                            pending.append(executor.submit(fetch, next_page_url))
+                        yield page
                 else:
-                    return final_result
+                    # No way to know how many pages there are, so walk them in order,
+                    # always asking for the next page before handing over the current one
+                    while True:
+                        if 'next' in response.links:
+                            pending.append(executor.submit(fetch, response.links['next']['url']))
+                        yield page
+                        if not pending:
+                            return
+                        response, page = pending.pop(0).result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _parse_json(self, response, url):
+        try:
+            return response.json()
+        except JSONDecodeError:
+            raise WaltzCanvasServiceError("{}: Could not parse Canvas response:\n{}\n{}".format(
+                response.status_code, url, response.text[:500]))
+
+    def _get_remaining_page_urls(self, first_response):
+        """
+        Uses the ``last`` link (or a total count header) of the first page to build the
+        URLs of every remaining page, so that they can be fetched in parallel. Returns
+        None if the server did not tell us how many pages there are (e.g., Canvas uses
+        opaque bookmarks instead of page numbers for some endpoints).
+        """
+        next_url = urlparse(first_response.links['next']['url'])
+        query = parse_qs(next_url.query)
+        if not query.get('page', [''])[0].isdigit():
+            return None
+        first_page = int(query['page'][0])
+        if 'last' in first_response.links:
+            last_page = parse_qs(urlparse(first_response.links['last']['url']).query).get('page', [''])[0]
+            if not last_page.isdigit():
+                return None
+            last_page = int(last_page)
+        elif first_response.headers.get('X-Total-Count', '').isdigit():
+            per_page = int(query.get('per_page', [self.PER_PAGE])[0])
+            last_page = -(-int(first_response.headers['X-Total-Count']) // per_page)
         else:
-            response = verb(next_url, data=data, params=params, json=json, headers=headers)
-            if response.status_code == 204:
-                return response
-            try:
-                return response.json()
-            except JSONDecodeError:
-                raise Exception("{}\n{}".format(response, next_url))
+            return None
+        page_urls = []
+        for page in range(first_page, last_page + 1):
+            query['page'] = [str(page)]
+            page_urls.append(urlunparse(next_url._replace(query=urlencode(query, doseq=True))))
+        return page_urls
 
     def progress_loop(self, progress_id, seconds_delay=3):
         attempt = 0
         while True:
-            result = self._canvas_request(requests.get, 'progress/{}'.format(progress_id),
+            result = self._canvas_request('GET', 'progress/{}'.format(progress_id),
                                           {'_dummy_counter': attempt}, None, None, False, True)[0]
             if result['workflow_state'] == 'completed':
                 return True
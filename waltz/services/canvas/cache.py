@@ -0,0 +1,149 @@
+import fnmatch
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class CanvasResponseCache:
+    """
+    A persistent cache of Canvas GET responses, kept in its own SQLite file next to
+    the Waltz database. Entries are revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``, so an unchanged resource costs a 304 instead of a full
+    body. Entries younger than their endpoint's TTL are reused without asking Canvas
+    at all. Once the cache grows past ``max_bytes``, the least recently used entries
+    are evicted.
+
+    TTLs are given as ``{pattern: seconds}``, where the pattern is matched (with
+    shell-style wildcards) against the request path after ``api/v1/``. A TTL of 0
+    means "always revalidate", and a negative TTL means "never cache".
+    """
+    path: str
+    ttls: dict
+    max_bytes: int
+
+    DEFAULT_TTL = 0
+    DEFAULT_TTLS = {'progress/*': -1}
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+    KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link', 'X-Total-Count')
+
+    def __init__(self, path, ttls=None, max_bytes=None):
+        self.path = path
+        self.ttls = dict(self.DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_bytes = max_bytes or self.DEFAULT_MAX_BYTES
+        self._db = None
+        self.lock = threading.RLock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key text PRIMARY KEY, url text, "
+                             "headers text, body blob, size integer, stored_at real, accessed_at real)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+            self._db.commit()
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    @classmethod
+    def make_key(cls, url, token, data, params):
+        # The token only goes into the key as a digest, so it never touches the disk
+        request_data = {key: value for key, value in (data or {}).items() if key != 'access_token'}
+        return hashlib.sha256(json.dumps([url, hashlib.sha256(token.encode('utf8')).hexdigest(),
+                                          request_data, params or {}],
+                                         sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+    def ttl_for(self, url):
+        path = url.split("api/v1/", 1)[-1].split("?", 1)[0]
+        if path.startswith("courses/"):
+            path = path.split("/", 2)[-1]
+        ttl = self.DEFAULT_TTL
+        for pattern, pattern_ttl in self.ttls.items():
+            if fnmatch.fnmatch(path, pattern):
+                ttl = pattern_ttl
+        return ttl
+
+    def lookup(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT url, headers, body, stored_at FROM responses WHERE key = ?",
+                                  (key,)).fetchone()
+        if row is None:
+            return None
+        url, headers, body, stored_at = row
+        return {'url': url, 'headers': json.loads(headers), 'body': body, 'stored_at': stored_at}
+
+    def is_fresh(self, entry):
+        ttl = self.ttl_for(entry['url'])
+        return ttl > 0 and entry['stored_at'] + ttl > time.time()
+
+    @classmethod
+    def add_validators(cls, entry, headers):
+        if 'ETag' in entry['headers']:
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if 'Last-Modified' in entry['headers']:
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def touch(self, key, revalidated=False):
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.db.execute("UPDATE responses SET accessed_at = ?, stored_at = ? WHERE key = ?",
+                                (now, now, key))
+            else:
+                self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+
+    def store(self, key, response):
+        ttl = self.ttl_for(response.url)
+        headers = {name: response.headers[name] for name in self.KEPT_HEADERS if name in response.headers}
+        if ttl < 0 or response.status_code != 200:
+            return
+        if ttl == 0 and 'ETag' not in headers and 'Last-Modified' not in headers:
+            # Nothing to revalidate with, so the entry could never be reused
+            return
+        body = response.content
+        now = time.time()
+        with self.lock:
+            self.db.execute("REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (key, response.url, json.dumps(headers), body, len(body), now, now))
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        total, = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC")
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    @classmethod
+    def make_response(cls, entry):
+        # Only needed once the API (and so requests) is already loaded
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['body']
+        response.encoding = 'utf-8'
+        response.from_cache = True
+        return response
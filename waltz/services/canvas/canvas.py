@@ -1,38 +1,87 @@
+import argparse
+
 from waltz.exceptions import WaltzException
-from waltz.services.canvas.api import CanvasAPI
+from waltz.services.canvas.cache import CanvasResponseCache
 from waltz.services.service import Service
 
 
+def parse_cache_ttl(value):
+    pattern, _, seconds = value.rpartition("=")
+    if not pattern or not seconds.lstrip("-").isdigit():
+        raise argparse.ArgumentTypeError("expected PATTERN=SECONDS, not {!r}".format(value))
+    return pattern, int(seconds)
+
+
 class Canvas(Service):
     type: str = "canvas"
     RESOURCES = {}
-    api: CanvasAPI
+    api: 'CanvasAPI'
+
+    cache: CanvasResponseCache = None
 
     def __init__(self, name: str, settings: dict):
         super().__init__(name, settings)
         token, base, course = settings.get('token'), settings.get('base'), settings.get('course')
-        if token and base and course:
-            self.api = CanvasAPI(base, token, course)
-        else:
+        if not (token and base and course):
             raise WaltzException(("Canvas API needs token, base, and course:\n"
                                   "\ttoken: {}\n\tbase: {}\n\tcourse: {}"
                                   ).format(token, base, course))
 
+    def connect(self):
+        # requests and asyncio are slow to import, so wait until Canvas is really needed
+        from waltz.services.canvas.api import CanvasAPI
+        settings = self.settings
+        return CanvasAPI(settings['base'], settings['token'], settings['course'],
+                         pool_size=settings.get('pool_size'),
+                         max_workers=settings.get('max_workers'),
+                         max_retries=settings.get('max_retries'),
+                         cache=self.cache)
+
+    def attach(self, registry):
+        if registry.use_cache:
+            self.cache = CanvasResponseCache(registry.get_waltz_cache_path(registry.directory),
+                                             ttls=self.settings.get('cache_ttl'),
+                                             max_bytes=self.settings.get('cache_size'))
+            if self._api is not None:
+                self._api.cache = self.cache
+
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
     @classmethod
     def configure(cls, args):
         return cls(args.new, {
             'base': args.base,
             'course': args.course,
             'token': args.token,
+            'pool_size': args.pool_size,
+            'max_workers': args.max_workers,
+            'cache_ttl': dict(args.cache_ttl) if args.cache_ttl else None,
+            'cache_size': args.cache_size,
         })
 
     @classmethod
     def add_parser_configure(cls, parser):
+        from waltz.services.canvas.api import CanvasAPI
         canvas_parser = parser.add_parser('canvas', help="Connect to a specific Canvas course")
         canvas_parser.add_argument('new', type=str, help="The new service that you will be creating.")
         canvas_parser.add_argument('--base', type=str, help="The base canvas URL (e.g., https://udel.instructure.com/)")
         canvas_parser.add_argument('--course', type=str, help="The course ID from Canvas (e.g., 17703022)")
         canvas_parser.add_argument('--token', type=str, help="The access token (long string of gibberish)")
+        canvas_parser.add_argument('--pool_size', type=int, default=None,
+                                   help="How many keep-alive connections to hold open to Canvas (default {}).".format(
+                                       CanvasAPI.DEFAULT_POOL_SIZE))
+        canvas_parser.add_argument('--max_workers', type=int, default=None,
+                                   help="How many requests to have in flight at once (default {}).".format(
+                                       CanvasAPI.DEFAULT_MAX_WORKERS))
+        canvas_parser.add_argument('--cache_ttl', type=parse_cache_ttl, action='append', metavar='PATTERN=SECONDS',
+                                   help="How long to reuse cached responses for matching request paths without "
+                                        "asking Canvas (e.g., 'pages/*=60'); 0 always revalidates, and negative "
+                                        "never caches. Can be given more than once.")
+        canvas_parser.add_argument('--cache_size', type=int, default=None,
+                                   help="How many bytes of responses to cache (default {}).".format(
+                                       CanvasResponseCache.DEFAULT_MAX_BYTES))
         return canvas_parser
 
     @classmethod
@@ -44,7 +93,7 @@ class Canvas(Service):
         return canvas_parser
 
     def list(self, registry, args):
-        self.RESOURCES[args.category].list(registry, self, args)
+        self.get_resource_base(args.category).list(registry, self, args)
 
 
 
@@ -1,11 +1,11 @@
 from waltz.exceptions import WaltzException
-from waltz.services.gradescope.pyscope.pyscope import GSConnection, ConnState
 from waltz.services.service import Service
 
 
 class GradeScope(Service):
     type: str = "gradescope"
     RESOURCES = {}
+    registry = None
 
     CONFIGURATION_SETTINGS = [
         ('email', True, None, 'The email used to login to an account for GradeScope.'),
@@ -23,11 +23,34 @@ class GradeScope(Service):
                 raise WaltzException("Missing required GradeScope configuration parameter {}".format(field))
             else:
                 used_settings[field] = default_value
-        self.api = GSConnection(used_settings['course'])
-        success = self.api.login(used_settings['email'], used_settings['password'])
+        self.used_settings = used_settings
+
+    def attach(self, registry):
+        self.registry = registry
+
+    def connect(self):
+        from waltz.services.gradescope.pyscope.pyscope import GSConnection
+        api = GSConnection(self.used_settings['course'])
+        api.session.relogin = lambda: self.login(api)
+        # Logging in is slow (and rate limited), so reuse the last session's cookies if we can
+        cookies = self.registry.find_session(self.name) if self.registry is not None else None
+        if cookies and api.restore(self.used_settings['email'], cookies):
+            return api
+        self.login(api)
+        return api
+
+    def login(self, api):
+        from waltz.services.gradescope.pyscope.pyscope import ConnState
+        success = api.login(self.used_settings['email'], self.used_settings['password'])
         # WARNING
-        if not success or self.api.state != ConnState.LOGGED_IN:
+        if not success or api.state != ConnState.LOGGED_IN:
             print("Warning: Not currently logged in to GradeScope")
+            if self.registry is not None:
+                self.registry.forget_session(self.name)
+            return False
+        if self.registry is not None:
+            self.registry.store_session(self.name, api.session.export_cookies())
+        return True
 
     @classmethod
     def configure(cls, args):
@@ -55,6 +78,6 @@ class GradeScope(Service):
 
     def list(self, registry, args):
         if args.category in ('course', 'courses', 'gradescope_course', 'gradescope_courses'):
-            self.RESOURCES['gradescope_course'].list(registry, self, args)
+            self.get_resource_base('gradescope_course').list(registry, self, args)
         elif args.category in ('gradescope_assignment', 'gradescope_assignments'):
-            self.RESOURCES['gradescope_assignment'].list(registry, self, args)
+            self.get_resource_base('gradescope_assignment').list(registry, self, args)
@@ -1,4 +1,7 @@
 import sys
+import time
+from urllib.parse import urlparse
+
 import requests
 from bs4 import BeautifulSoup
 from enum import Enum
@@ -19,16 +22,69 @@ class ConnState(Enum):
     LOGGED_IN = 1
 
 
+class GSSession(requests.Session):
+    """
+    A session that notices when Gradescope has logged it out (by redirecting it to the login
+    page), logs back in by calling `relogin`, and then retries the request once.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.relogin = None
+        self.logging_in = False
+
+    def request(self, method, url, *args, **kwargs):
+        response = super().request(method, url, *args, **kwargs)
+        if self.relogin is not None and not self.logging_in and self.was_logged_out(response):
+            self.logging_in = True
+            try:
+                logged_in = self.relogin()
+            finally:
+                self.logging_in = False
+            if logged_in:
+                response = super().request(method, url, *args, **kwargs)
+        return response
+
+    @staticmethod
+    def was_logged_out(response):
+        return bool(response.history) and urlparse(response.url).path.rstrip('/') == '/login'
+
+    def export_cookies(self):
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                 'path': cookie.path, 'expires': cookie.expires, 'secure': cookie.secure}
+                for cookie in self.cookies]
+
+    def import_cookies(self, cookies):
+        """ Loads cookies from `export_cookies`, returning how many of them have not expired. """
+        now = time.time()
+        fresh = [cookie for cookie in cookies if cookie['expires'] is None or cookie['expires'] > now]
+        for cookie in fresh:
+            self.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                             expires=cookie['expires'], secure=cookie['secure'])
+        return len(fresh)
+
+
 class GSConnection:
     """The main connection class that keeps state about the current connection."""
 
     def __init__(self, course):
         '''Initialize the session for the connection.'''
-        self.session = requests.Session()
+        self.session = GSSession()
         self.state = ConnState.INIT
         self.account = None
         self.course = course
 
+    def restore(self, email, cookies):
+        '''
+        Reuse the cookies of an earlier login instead of logging in again. If they turn out
+        to be stale, the session's relogin takes care of it on the first request.
+        '''
+        if not self.session.import_cookies(cookies):
+            return False
+        self.state = ConnState.LOGGED_IN
+        self.account = GSAccount(email, self.session)
+        return True
+
     def login(self, email, pswd):
         '''
         Login to gradescope using email and password.
@@ -1,14 +1,54 @@
+import hashlib
 import os
+from argparse import Namespace
 from datetime import datetime
 
-from natsort import natsorted
-from tabulate import tabulate
-
 from waltz.exceptions import WaltzException, WaltzAmbiguousResource
 from waltz.resources.raw import RawResource
 from waltz.services.service import Service
-from waltz.tools import yaml, extract_front_matter
-from waltz.tools.utilities import make_safe_filename, ensure_dir, make_end_path, all_path_parts_match, os_walk_cache
+from waltz.tools import full_text
+from waltz.tools.front_matter import decode_front_matter, load_yaml, read_front_matter, read_waltz_front_matter
+from waltz.tools.utilities import make_safe_filename, ensure_dir, make_end_path
+
+# Below this many Markdown files per process, starting processes costs more than it saves
+PARALLEL_SCAN_MINIMUM = 100
+PARALLEL_SCAN_CHUNK_SIZE = 32
+
+
+def describe_file(path):
+    """
+    What the registry's index of local files keeps about a file: its resource category, title,
+    and parse status. Only the front matter of Markdown files is read, however long their body.
+    """
+    if not path.endswith(".md"):
+        return None, None, None
+    try:
+        text = read_front_matter(path)
+        metadata = (load_yaml(text) if text.strip() else None) or {}
+        waltz = metadata.get('waltz') or {}
+        if not isinstance(waltz, dict):
+            raise ValueError("The waltz front matter is not a mapping")
+    except Exception:
+        return None, None, 'invalid'
+    resource, title = waltz.get('resource'), waltz.get('title')
+    return None if resource is None else str(resource), None if title is None else str(title), 'ok'
+
+
+def describe_file_text(path):
+    """ The content hash and searchable text of a whole Markdown file, for the search index. """
+    try:
+        with open(path, 'rb') as input_file:
+            data = input_file.read()
+    except OSError:
+        return None, None
+    content_hash = hashlib.sha256(data).hexdigest()
+    data = data.decode('utf8', errors='replace')
+    try:
+        regular, waltz, body = decode_front_matter(data)
+    except Exception:
+        return content_hash, data
+    return content_hash, (body + "\n" + full_text.front_matter_text(regular) + " " +
+                          full_text.front_matter_text(waltz))
 
 
 class Local(Service):
@@ -99,11 +139,15 @@ class Local(Service):
     name: str
     type: str = "local"
     RESOURCES = {}
+    registry = None
 
     def __init__(self, name: str, settings: dict):
         super().__init__(name, settings)
         self.path = settings['path']
 
+    def attach(self, registry):
+        self.registry = registry
+
     @classmethod
     def configure(cls, args):
         return cls(args.new, {'path': args.path})
@@ -116,25 +160,25 @@ class Local(Service):
         return local_parser
 
     def list(self, registry, args):
+        # Imported here, since every command loads the local service but few of them list it
+        from natsort import natsorted
+        from tabulate import tabulate
         if args.category:
             category_names = registry.get_resource_category(args.category).category_names
         else:
             category_names = None
         rows = []
-        for root, dirs, files in os_walk_cache(self.path):
-            for name in natsorted(files):
-                if name.endswith(".md"):
-                    path = os.path.join(root, name)
-                    decoded_markdown = self.read(path)
-                    try:
-                        regular, waltz, body = extract_front_matter(decoded_markdown)
-                    except:
-                        if category_names is None:
-                            rows.append(("[invalid]", "", os.path.relpath(path)))
-                        continue
-                    resource = "[{}]".format(waltz.get('resource', 'unknown'))
-                    if category_names is None or waltz.get('resource') in category_names:
-                        rows.append((resource, waltz.get("title", ""), os.path.relpath(path)))
+        registry.refresh_local_files(self.name, self.path, self.describe_files)
+        for local_file in natsorted(registry.find_local_files(self.path), key=lambda local_file: local_file.path):
+            if not local_file.path.endswith(".md"):
+                continue
+            if local_file.status == 'invalid':
+                if category_names is None:
+                    rows.append(("[invalid]", "", os.path.relpath(local_file.path)))
+                continue
+            resource = "[{}]".format(local_file.resource or 'unknown')
+            if category_names is None or local_file.resource in category_names:
+                rows.append((resource, local_file.title or "", os.path.relpath(local_file.path)))
         print(tabulate(rows, ("Resource", "Title", "Path")))
 
     @classmethod
@@ -144,8 +188,117 @@ class Local(Service):
         local_parser.add_argument('--term', type=str, help="An optional search term")
         return local_parser
 
-    def search(self, category, resource):
-        return []
+    def refresh_search_index(self, registry):
+        # Searching happens once per command, so always look for changes first. Only searching
+        # needs the whole of each file, so only now are the changed ones read in full.
+        registry.refresh_local_files(self.name, self.path, self.describe_files, force=True)
+        registry.index_local_texts(self.path, self.describe_file_texts)
+
+    def describe_file(self, path):
+        return describe_file(path)
+
+    def describe_files(self, paths):
+        """ Describes many files from their front matter (see ``describe_file``). """
+        return self.map_markdown_files(paths, describe_file, self.describe_file)
+
+    def describe_file_texts(self, paths):
+        """ The content hash and searchable text of many files (see ``describe_file_text``). """
+        return self.map_markdown_files(paths, describe_file_text, describe_file_text)
+
+    def map_markdown_files(self, paths, describe, describe_here):
+        """ Describes each file, spreading the Markdown ones over several processes if there are enough. """
+        markdown_paths = [path for path in paths if path.endswith(".md")]
+        workers = min(os.cpu_count() or 1, len(markdown_paths) // PARALLEL_SCAN_MINIMUM)
+        if workers < 2:
+            return [describe_here(path) for path in paths]
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            # map keeps the results in the same order as the paths
+            described = dict(zip(markdown_paths, executor.map(describe, markdown_paths,
+                                                               chunksize=PARALLEL_SCAN_CHUNK_SIZE)))
+        return [described[path] if path in described else describe_here(path) for path in paths]
+
+    def watch(self, registry, args, should_stop=lambda: False):
+        """
+        Keeps the index of local files up to date as they change, until interrupted. With
+        ``args.push``, also encodes and uploads the changed resources; question files saved
+        together only push each quiz that uses them once.
+        """
+        from waltz.tools.watching import make_watcher, watch_changes, PollingWatcher
+        registry.refresh_local_files(self.name, self.path, self.describe_files, force=True)
+        watcher = make_watcher(self.path, args.poll, args.interval)
+        print("Watching {} for changes{}".format(os.path.abspath(self.path),
+                                                 " (polling)" if isinstance(watcher, PollingWatcher) else ""))
+
+        def handle(paths):
+            # Each batch is a command of its own, so it sees any changes made on the remote side
+            registry.start_command()
+            changed_files = []
+            for path in sorted(paths):
+                if path == watcher.root:
+                    registry.refresh_local_files(self.name, self.path, self.describe_files, force=True)
+                    continue
+                local_file = registry.refresh_local_file(self.name, path, self.describe_file)
+                if local_file is not None and local_file.resource:
+                    changed_files.append(local_file)
+            if args.push:
+                for category, title in self.plan_pushes(registry, changed_files):
+                    self.push(registry, category, title, args)
+
+        try:
+            watch_changes(watcher, args.debounce, handle, should_stop)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            watcher.close()
+
+    def plan_pushes(self, registry, changed_files):
+        """ The (category, title) of each resource to push for these changed files, without repeats. """
+        pushes = []
+        quiz_questions = None
+        for local_file in changed_files:
+            if local_file.resource == 'quiz question':
+                # Question files are pushed as part of the quizzes that use them
+                if quiz_questions is None:
+                    quiz_questions = self.find_quiz_questions(registry)
+                targets = [('quiz', quiz) for quiz, questions in quiz_questions.items()
+                           if local_file.title in questions]
+            else:
+                targets = [(local_file.resource, local_file.title)]
+            for target in targets:
+                if target not in pushes:
+                    pushes.append(target)
+        return pushes
+
+    def find_quiz_questions(self, registry):
+        """ The titles of the questions (in files of their own) that each local quiz uses. """
+        quiz_questions = {}
+        for local_file in registry.find_local_files(self.path):
+            if local_file.resource not in ('quiz', 'quizzes') or local_file.status != 'ok':
+                continue
+            waltz = read_waltz_front_matter(local_file.path)
+            titles = set()
+            for question in waltz.get('questions', []):
+                if isinstance(question, str):
+                    titles.add(question)
+                elif isinstance(question, dict):
+                    titles.update(inner for inner in question.get('questions', []) if isinstance(inner, str))
+            quiz_questions[local_file.title] = titles
+        return quiz_questions
+
+    def push(self, registry, category, title, args):
+        try:
+            resource_category = registry.get_resource_category(category)
+            push_args = Namespace(resource=[title], category=category, title=title,
+                                  service=registry.get_service(resource_category.default_service).name,
+                                  local_service=self.name, banks=args.banks, combine=False, hide_answers=False,
+                                  destination=None, id=None, url=None, filename=None, all=False)
+            resource_category.encode(registry, push_args)
+            resource_category.upload(registry, push_args)
+            print("Pushed {} {!r}".format(category, title))
+        except Exception as error:
+            # Keep watching, even if one resource couldn't be pushed
+            print("Could not push {} {!r}: {}".format(category, title, error))
 
     @classmethod
     def make_markdown_filename(cls, filename, folder_file=None,
@@ -188,15 +341,17 @@ class Local(Service):
                 top_directories = [registry.search_up_for_waltz_registry('./')]
             potential_files = []
             for top_directory in top_directories:
-                for root, dirs, files in os_walk_cache(top_directory):
-                    for file in files:
-                        potential_file = os.path.join(root, file)
-                        if all_path_parts_match(potential_file, safe_filename):
-                            potential_files.append(potential_file)
-                        elif check_front_matter and file.endswith(".md"):
-                            _, waltz, _ = extract_front_matter(self.read(potential_file))
-                            if waltz.get('title') == title:
-                                potential_files.append(potential_file)
+                registry.refresh_local_files(self.name, top_directory, self.describe_files)
+                absolute_top_directory = os.path.abspath(top_directory)
+                local_files = set(registry.find_local_files_ending_with(top_directory, safe_filename))
+                if check_front_matter:
+                    local_files.update(local_file
+                                       for local_file in registry.find_local_files_titled(top_directory, title)
+                                       if local_file.path.endswith(".md"))
+                for local_file in sorted(local_files):
+                    # Keep reporting paths relative to the directory we were given
+                    potential_files.append(os.path.join(top_directory,
+                                                        os.path.relpath(local_file.path, absolute_top_directory)))
             if len(potential_files) > 1:
                 raise WaltzAmbiguousResource("Ambiguous resource named {}:\n\t{}".format(
                     safe_filename, "\n\t".join(potential for potential in potential_files)
@@ -219,13 +374,17 @@ class Local(Service):
         ensure_dir(destination_path)
         with open(destination_path, 'w', encoding='utf8') as output_file:
             output_file.write(body)
+        if self.registry is not None:
+            self.registry.refresh_local_file(self.name, destination_path, self.describe_file)
 
     def read(self, source_path):
         with open(source_path, 'r', encoding='utf8') as input_file:
             return input_file.read()
 
     def get_title(self, filename):
-        data = self.read(filename)
-        regular, waltz, body = extract_front_matter(data)
         filename_as_title = os.path.splitext(os.path.basename(filename))[0]
-        return waltz.get('title', filename_as_title)
\ No newline at end of file
+        if self.registry is not None and filename.endswith(".md"):
+            local_file = self.registry.refresh_local_file(self.name, filename, self.describe_file)
+            if local_file is not None and local_file.status == 'ok':
+                return local_file.title or filename_as_title
+        return read_waltz_front_matter(filename).get('title', filename_as_title)
\ No newline at end of file
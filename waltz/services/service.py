@@ -1,5 +1,5 @@
 from waltz.exceptions import WaltzException
-from waltz.defaults import get_service_types
+from waltz.defaults import get_service_type, load_resources
 
 
 class Service:
@@ -14,14 +14,35 @@ class Service:
     type: str
     # The service that this one extends; if None, then this is an Abstract service
     settings: dict
+    _api = None
 
     def __init__(self, name: str, settings: dict):
         self.name = name
         self.settings = settings
+        # Whatever resources remember while a single command runs (see start_command)
+        self.memo = {}
+
+    @property
+    def api(self):
+        # Nothing talks to the remote service until a command actually needs it
+        if self._api is None:
+            self._api = self.connect()
+        return self._api
+
+    @api.setter
+    def api(self, api):
+        self._api = api
+
+    def connect(self):
+        """
+        Creates the client for this service's remote API (e.g., logging in). Called the first
+        time that `api` is used, rather than when the service is loaded.
+        """
+        return None
 
     @classmethod
     def from_type(cls, service_type: str):
-        return get_service_types()[service_type]
+        return get_service_type(service_type)
 
     @classmethod
     def register_resource(cls, resource_category):
@@ -30,7 +51,7 @@ class Service:
 
     @classmethod
     def get_resource_base(cls, resource_category):
-        return cls.RESOURCES[resource_category]
+        return load_resources(cls)[resource_category]
 
     def as_data(self):
         return {
@@ -48,8 +69,29 @@ class Service:
     def service_type(self, parser):
         pass
 
-    def search(self, category, resource):
-        return []
+    def attach(self, registry):
+        """
+        Called once this service belongs to a registry, so that it can keep any
+        local state (e.g., caches) alongside the registry's files.
+        """
+        pass
+
+    def clear_cache(self):
+        pass
+
+    def start_command(self):
+        """
+        Called as each command starts (and each batch of a long-running one, like watch), so
+        that nothing remembered during one command is trusted by the next.
+        """
+        self.memo = {}
+
+    def refresh_search_index(self, registry):
+        """
+        Called before searching, so that services whose content lives outside the registry
+        (e.g., local files) can update the registry's search index first.
+        """
+        pass
 
     @classmethod
     def add_parser_download(cls, parser):
@@ -61,7 +103,8 @@ def services_as_data(services_types):
             for name, services in services_types.items()}
 
 
-def services_from_data(services_by_type, service_types):
-    return {name: [service_types[service['type']].from_data(service)
+def services_from_data(services_by_type):
+    # Only the types of service that are actually configured get imported
+    return {name: [get_service_type(service['type']).from_data(service)
                    for service in services]
             for name, services in services_by_type.items()}
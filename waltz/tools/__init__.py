@@ -1,2 +1,18 @@
-from waltz.tools.yaml_setup import yaml
-from waltz.tools.html_markdown_utilities import m2h, h2m, extract_front_matter
+"""
+The helpers used throughout Waltz. They are only imported on first use, since the
+YAML, markdown, and HTML libraries behind them are slow to load.
+"""
+from importlib import import_module
+
+LAZY_HELPERS = {
+    'yaml': 'waltz.tools.yaml_setup',
+    'm2h': 'waltz.tools.html_markdown_utilities',
+    'h2m': 'waltz.tools.html_markdown_utilities',
+    'extract_front_matter': 'waltz.tools.html_markdown_utilities',
+}
+
+
+def __getattr__(name):
+    if name in LAZY_HELPERS:
+        return getattr(import_module(LAZY_HELPERS[name]), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,136 @@
+"""
+How raw resources are packed into the registry's ``data`` column.
+
+Every stored value is a BLOB tagged with a codec name, so that new codecs
+(or new dictionaries) can be added without touching old rows:
+
+    text     UTF-8 text, uncompressed (also how pre-compression rows decode)
+    zlib-1   UTF-8 text, deflated against PRESET_DICTIONARY_1
+    bytes    raw bytes (e.g. autograder zips), returned as bytes
+
+The version history keeps most versions of a resource as deltas against the
+version before them (see ``make_delta``), which are then packed like any other text.
+"""
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from waltz.exceptions import WaltzException
+
+CODEC_TEXT = 'text'
+CODEC_ZLIB = 'zlib-1'
+CODEC_BYTES = 'bytes'
+
+# Anything shorter than this isn't worth compressing
+MINIMUM_COMPRESSED_SIZE = 128
+
+# A preset dictionary made of the keys and boilerplate that show up in almost every
+# Canvas resource, so that even a small page compresses well on its own. zlib favours
+# the end of the dictionary, so the most common strings go last. Never change this
+# string: add PRESET_DICTIONARY_2 (and a new codec name) instead.
+PRESET_DICTIONARY_1 = (
+    '"grading_standard_id": null, "peer_reviews": false, "automatic_peer_reviews": false, '
+    '"group_category_id": null, "grade_group_students_individually": false, '
+    '"moderated_grading": false, "omit_from_final_grade": false, "intra_group_peer_reviews": false, '
+    '"anonymous_instructor_annotations": false, "anonymous_peer_reviews": false, '
+    '"post_manually": false, "only_visible_to_overrides": false, "has_overrides": false, '
+    '"needs_grading_count": 0, "submissions_download_url": "", "assignment_group_id": '
+    '"secure_params": "", "lti_context_id": "", "course_id": , "html_url": "https://", '
+    '"external_tool_tag_attributes": {"url": "", "new_tab": false}, "allowed_extensions": [], '
+    '"submission_types": ["online_upload"], "grading_type": "points", '
+    '"anonymize_students": false, "anonymous_grading": false, "lock_info": {}, '
+    '"lock_explanation": "", "locked_for_user": false, "unpublishable": true, '
+    '"editing_roles": "teachers", "front_page": false, "hide_from_students": false, '
+    '"last_edited_by": {"id": , "display_name": "", "avatar_image_url": "", "html_url": ""}, '
+    '"quiz_type": "assignment", "time_limit": null, "shuffle_answers": false, '
+    '"hide_results": null, "show_correct_answers": true, "show_correct_answers_last_attempt": false, '
+    '"show_correct_answers_at": null, "hide_correct_answers_at": null, "one_time_results": false, '
+    '"scoring_policy": "keep_highest", "allowed_attempts": 1, "one_question_at_a_time": false, '
+    '"question_count": , "cant_go_back": false, "access_code": null, "ip_filter": null, '
+    '"mobile_url": "", "preview_url": "", "require_lockdown_browser": false, '
+    '"require_lockdown_browser_for_results": false, "require_lockdown_browser_monitor": false, '
+    '"lockdown_browser_monitor_data": null, "speedgrader_url": "", "quiz_extensions_url": "", '
+    '"permissions": {"read": true, "submit": true, "create": true, "manage": true, '
+    '"read_statistics": true, "review_grades": true, "update": true}, "all_dates": [], '
+    '"version_number": , "has_access_code": false, "migration_id": null, '
+    '"question_types": ["multiple_choice_question", "true_false_question", "short_answer_question", '
+    '"fill_in_multiple_blanks_question", "multiple_answers_question", "multiple_dropdowns_question", '
+    '"matching_question", "numerical_question", "calculated_question", "essay_question", '
+    '"file_upload_question", "text_only_question"], "quiz_group_id": null, "quiz_id": , '
+    '"assessment_question_id": , "question_name": "", "question_type": "", "question_text": "", '
+    '"correct_comments": "", "incorrect_comments": "", "neutral_comments": "", '
+    '"correct_comments_html": "", "incorrect_comments_html": "", "neutral_comments_html": "", '
+    '"matching_answer_incorrect_matches": null, "variables": null, "formulas": null, '
+    '"answer_tolerance": null, "formula_decimal_places": null, "matches": null, '
+    '"answers": [{"id": , "text": "", "html": "", "comments": "", "comments_html": "", '
+    '"weight": 100.0}, {"id": , "text": "", "html": "", "comments": "", "comments_html": "", '
+    '"weight": 0.0}], "pick_count": 1, "question_points": 1.0, "position": , '
+    '"created_at": "T:00Z", "updated_at": "T:00Z", "due_at": null, "unlock_at": null, '
+    '"lock_at": null, "points_possible": 1.0, "published": true, "description": "", '
+    '"body": "", "title": "", "name": "", "url": "", "id": '
+    '<p></p><div></div><span></span><strong></strong><em></em><code></code><pre></pre>'
+    '<ul><li></li></ul><ol><li></li></ol><table><tr><td></td></tr></table>'
+    '<a href="https://" target="_blank" rel="noopener"></a><img src="" alt="" />'
+    '<br />&nbsp;&lt;&gt;&amp;&quot;\\n\\"'
+).encode('utf8')
+
+
+def compress(data):
+    """ Packs text or bytes for storage, returning the ``(blob, codec)`` pair. """
+    if data is None:
+        return None, None
+    if isinstance(data, bytes):
+        return data, CODEC_BYTES
+    encoded = data.encode('utf8')
+    if len(encoded) < MINIMUM_COMPRESSED_SIZE:
+        return encoded, CODEC_TEXT
+    compressor = zlib.compressobj(level=6, zdict=PRESET_DICTIONARY_1)
+    compressed = compressor.compress(encoded) + compressor.flush()
+    if len(compressed) >= len(encoded):
+        return encoded, CODEC_TEXT
+    return compressed, CODEC_ZLIB
+
+
+def decompress(blob, codec):
+    """ Unpacks what ``compress`` produced. """
+    if codec is None or blob is None:
+        return blob
+    if codec == CODEC_TEXT:
+        return bytes(blob).decode('utf8')
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj(zdict=PRESET_DICTIONARY_1)
+        return (decompressor.decompress(blob) + decompressor.flush()).decode('utf8')
+    if codec == CODEC_BYTES:
+        return bytes(blob)
+    raise WaltzException("Unknown registry data codec: {}".format(codec))
+
+
+# Canvas JSON is usually a single line, so deltas work on smaller chunks than lines
+CHUNK_BOUNDARY = re.compile(r'(?<=[,>\n])')
+
+
+def split_chunks(text):
+    return CHUNK_BOUNDARY.split(text)
+
+
+def make_delta(base, text):
+    """
+    Describes ``text`` in terms of ``base``, as a JSON list of either ``[start, end]``
+    (copy those chunks of the base) or strings (insert this text).
+    """
+    base_chunks, chunks = split_chunks(base), split_chunks(text)
+    delta = []
+    matcher = SequenceMatcher(None, base_chunks, chunks, autojunk=False)
+    for tag, base_start, base_end, start, end in matcher.get_opcodes():
+        if tag == 'equal':
+            delta.append([base_start, base_end])
+        elif start < end:
+            delta.append("".join(chunks[start:end]))
+    return json.dumps(delta, separators=(',', ':'))
+
+
+def apply_delta(base, delta):
+    base_chunks = split_chunks(base)
+    return "".join("".join(base_chunks[operation[0]:operation[1]]) if isinstance(operation, list) else operation
+                   for operation in json.loads(delta))
@@ -0,0 +1,96 @@
+"""
+Reading front matter when nothing will be written back: just the front matter of a
+Markdown file (for the many places that only need its ``waltz`` settings, e.g. the
+resource and title), without loading a possibly huge body, and decoded with PyYAML's
+libyaml-backed ``CSafeLoader`` instead of ruamel's round-trip loader, which keeps
+track of comments and formatting. Anything that rewrites YAML should keep using
+``waltz.tools.extract_front_matter``.
+"""
+import re
+
+# The same boundary that python-frontmatter uses
+FRONT_MATTER_BOUNDARY = re.compile(r"^-{3,}\s*$")
+
+# ruamel reads YAML 1.2, where (unlike PyYAML's YAML 1.1) "No" and "on" are strings,
+# "010" is ten, and "1:30" isn't a number. These make PyYAML resolve plain scalars the same way.
+YAML_1_2_RESOLVERS = [
+    ('tag:yaml.org,2002:bool', re.compile(r'^(?:true|True|TRUE|false|False|FALSE)$'), list('tTfF')),
+    ('tag:yaml.org,2002:int', re.compile(r'^(?:[-+]?[0-9]+|0o[0-7]+|0x[0-9a-fA-F]+)$'), list('-+0123456789')),
+    ('tag:yaml.org,2002:float', re.compile(r'^(?:[-+]?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][-+]?[0-9]+)?'
+                                           r'|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$'), list('-+0123456789.')),
+]
+
+_loader = None
+
+
+def construct_yaml_1_2_int(loader, node):
+    value = loader.construct_scalar(node)
+    return int(value, 0) if value[:2] in ('0o', '0x') else int(value)
+
+
+def get_loader():
+    """ The fastest available PyYAML safe loader, made to resolve scalars like YAML 1.2. """
+    global _loader
+    if _loader is None:
+        import yaml
+        base = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        replaced = {tag for tag, _, _ in YAML_1_2_RESOLVERS}
+        _loader = type('FrontMatterLoader', (base,), {})
+        _loader.yaml_implicit_resolvers = {
+            first: [(tag, regexp) for tag, regexp in resolvers if tag not in replaced]
+            for first, resolvers in base.yaml_implicit_resolvers.items()}
+        for tag, regexp, first in YAML_1_2_RESOLVERS:
+            _loader.add_implicit_resolver(tag, regexp, first)
+        _loader.add_constructor('tag:yaml.org,2002:int', construct_yaml_1_2_int)
+    return _loader
+
+
+def load_yaml(text):
+    import yaml
+    return yaml.load(text, Loader=get_loader())
+
+
+def decode_front_matter(text):
+    """
+    A read-only ``extract_front_matter``: returns the regular front matter, the ``waltz``
+    front matter, and the body, as plain dicts and strings.
+    """
+    lines = text.splitlines(True)
+    if not lines or not FRONT_MATTER_BOUNDARY.match(lines[0]):
+        return {}, {}, text
+    for index, line in enumerate(lines[1:], 1):
+        if FRONT_MATTER_BOUNDARY.match(line):
+            metadata = load_yaml("".join(lines[1:index]))
+            if metadata is None:
+                metadata = {}
+            elif not isinstance(metadata, dict):
+                raise ValueError("The front matter is not a mapping")
+            waltz = metadata.pop('waltz', None) or {}
+            return metadata, waltz, "".join(lines[index + 1:]).strip()
+    return {}, {}, text
+
+
+def read_front_matter(path):
+    """
+    Returns the YAML between the opening and closing ``---`` lines of the file, or an empty
+    string if it doesn't start with front matter. Stops reading at the closing line.
+    """
+    lines = []
+    with open(path, 'r', encoding='utf8') as markdown_file:
+        if not FRONT_MATTER_BOUNDARY.match(markdown_file.readline()):
+            return ""
+        for line in markdown_file:
+            if FRONT_MATTER_BOUNDARY.match(line):
+                return "".join(lines)
+            lines.append(line)
+    # Never closed, so it wasn't front matter after all
+    return ""
+
+
+def read_waltz_front_matter(path):
+    """ The ``waltz`` section of the file's front matter (empty if there isn't one). """
+    text = read_front_matter(path)
+    metadata = load_yaml(text) if text.strip() else None
+    if not isinstance(metadata, dict):
+        return {}
+    return metadata.get('waltz') or {}
@@ -0,0 +1,68 @@
+"""
+Turns raw resources and local Markdown files into the plain text kept in the
+registry's full-text search index, and user queries into FTS5 query syntax.
+"""
+import json
+import re
+from html import unescape
+
+# The fields of a raw resource (at any depth) that people would search for
+SEARCHABLE_KEYS = {
+    'title', 'name', 'body', 'description', 'message', 'instructions',
+    'question_name', 'question_text', 'text', 'html',
+    'comments', 'comments_html', 'correct_comments', 'incorrect_comments', 'neutral_comments',
+    'correct_comments_html', 'incorrect_comments_html', 'neutral_comments_html',
+}
+
+HTML_TAG = re.compile(r'<[^>]*>')
+
+
+def strip_html(text):
+    return unescape(HTML_TAG.sub(' ', text))
+
+
+def searchable_text(data):
+    """ The text worth indexing from a raw resource's data (JSON, or anything else as text). """
+    if data is None or isinstance(data, bytes):
+        return ""
+    try:
+        value = json.loads(data)
+    except ValueError:
+        return strip_html(data)
+    parts = []
+    collect_text(value, None, parts)
+    return "\n".join(parts)
+
+
+def collect_text(value, key, parts):
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            collect_text(child, child_key, parts)
+    elif isinstance(value, list):
+        for child in value:
+            collect_text(child, key, parts)
+    elif isinstance(value, str) and value and key in SEARCHABLE_KEYS:
+        parts.append(strip_html(value))
+
+
+def front_matter_text(metadata):
+    """ Every value in some (possibly nested) front matter, as text. """
+    if isinstance(metadata, dict):
+        return " ".join(front_matter_text(value) for value in metadata.values())
+    if isinstance(metadata, list):
+        return " ".join(front_matter_text(value) for value in metadata)
+    return "" if metadata is None else str(metadata)
+
+
+def make_match_query(query):
+    """
+    Quotes each word of the query, so that punctuation is never read as FTS5 syntax.
+    A trailing ``*`` still searches by prefix (e.g., ``recur*``).
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"{}"{}'.format(word.replace('"', '""'), '*' if prefix else ''))
+    return " ".join(terms)
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import os
 import re
 from datetime import datetime
@@ -54,6 +56,22 @@ def all_path_parts_match(full_path, end_path):
                for left, right in zip(end_path_parts, full_path_parts))
 
 
+def make_path_suffix_key(path):
+    """
+    The parts of the path in reverse order, each followed by a ``/``. The key of a file
+    starts with the key of every path it ends with (``Quiz/index.md`` gives
+    ``index.md/Quiz/``), so sorting the keys makes a trie of path suffixes: the files
+    ending with a path are a range of them, found in time proportional to its depth.
+
+    Args:
+        path (str):
+
+    Returns:
+        str: The key.
+    """
+    return "".join(part + "/" for part in reversed(pathlib.PurePath(path).parts))
+
+
 def get_parent_directory(path):
     return pathlib.Path(path).parent.parent
 
@@ -146,15 +164,39 @@ def replace_namespace(original, **kwargs):
     return new_version
 
 
-_OS_WALK_CACHE = {}
+# Upload fields that Canvas stores as numbers, so that ``1`` comes back as ``1.0``
+NUMERIC_PAYLOAD_FIELDS = {'points_possible', 'position', 'quiz_group_id', 'pick_count', 'question_points',
+                          'matching_answer_incorrect_matches', 'answer_weight', 'answer_exact',
+                          'answer_error_margin', 'answer_range_start', 'answer_range_end', 'answer_precision',
+                          'answer_approximate', 'time_limit', 'allowed_attempts'}
 
 
-def os_walk_cache(path):
-    if path in _OS_WALK_CACHE:
-        for result in _OS_WALK_CACHE[path]:
-            yield result
-    else:
-        _OS_WALK_CACHE[path] = []
-        for result in os.walk(path):
-            _OS_WALK_CACHE[path].append(result)
-            yield result
+def normalize_payload_value(key, value):
+    """
+    Canonical text for a form value, undoing only the rewriting that Canvas itself
+    does (numbers in numeric fields, and Windows line endings), so that the same
+    value locally and from Canvas compares equal but any real edit does not.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return json_bool(value)
+    field = key.rsplit("[", 1)[-1].rstrip("]")
+    if field in NUMERIC_PAYLOAD_FIELDS:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            pass
+        else:
+            return str(int(number)) if number.is_integer() else repr(number)
+    return str(value).replace("\r\n", "\n")
+
+
+def fingerprint_payload(payload):
+    """
+    Hashes an upload payload (a flat dictionary of form fields), ignoring empty
+    fields and the differences that Canvas's own rewriting introduces.
+    """
+    normalized = {key: normalize_payload_value(key, value) for key, value in payload.items()}
+    normalized = {key: value for key, value in normalized.items() if value not in (None, "")}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf8')).hexdigest()
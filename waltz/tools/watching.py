@@ -0,0 +1,161 @@
+"""
+Notices when files under a directory change, using Linux's inotify when it is
+available (through ctypes, so nothing extra needs installing) and falling back to
+polling the file stats otherwise.
+
+Both watchers have the same interface: ``changes(timeout)`` waits up to ``timeout``
+seconds and returns the set of paths that were created, modified, moved, or deleted.
+If the watcher may have missed something (e.g., the inotify queue overflowed), the
+set includes the root directory itself, meaning "check everything again".
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def is_hidden(name):
+    return name.startswith('.')
+
+
+class InotifyWatcher:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.directories = {}
+        self.watch_tree(self.root)
+
+    def watch_tree(self, root):
+        """ Watches the directory and everything in it, returning the files already inside. """
+        found = set()
+        for directory, directories, names in os.walk(root):
+            directories[:] = [name for name in directories if not is_hidden(name)]
+            watch = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if watch >= 0:
+                self.directories[watch] = directory
+            found.update(os.path.join(directory, name) for name in names if not is_hidden(name))
+        return found
+
+    def read_events(self):
+        data = b""
+        while True:
+            try:
+                chunk = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return data
+            if not chunk:
+                return data
+            data += chunk
+
+    def changes(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        data, offset = self.read_events(), 0
+        while offset < len(data):
+            watch, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0'))
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                changed.add(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(watch, None)
+                continue
+            if watch not in self.directories or not name or is_hidden(name):
+                continue
+            path = os.path.join(self.directories[watch], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files can land in a new directory before we start watching it
+                    changed.update(self.watch_tree(path))
+                elif mask & IN_MOVED_FROM:
+                    changed.add(self.root)
+            else:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, root, interval=1.0):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.stamps = self.scan()
+
+    def scan(self):
+        stamps = {}
+        for directory, directories, names in os.walk(self.root):
+            directories[:] = [name for name in directories if not is_hidden(name)]
+            for name in names:
+                if is_hidden(name):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def changes(self, timeout):
+        time.sleep(min(self.interval, timeout))
+        stamps = self.scan()
+        changed = {path for path in stamps.keys() | self.stamps.keys() if stamps.get(path) != self.stamps.get(path)}
+        self.stamps = stamps
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(root, poll=False, interval=1.0):
+    """ An inotify watcher if possible (and not told to poll), otherwise a polling one. """
+    if not poll and hasattr(select, 'select'):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root, interval)
+
+
+def watch_changes(watcher, debounce, handle, should_stop=lambda: False):
+    """
+    Calls ``handle`` with each burst of changes, once no more have arrived for ``debounce``
+    seconds, so that (for example) saving many files at once is dealt with in one go.
+    """
+    pending, last_change = set(), None
+    while not should_stop():
+        changes = watcher.changes(debounce if pending else 1.0)
+        if changes:
+            pending |= changes
+            last_change = time.monotonic()
+        elif pending and time.monotonic() - last_change >= debounce:
+            handle(pending)
+            pending = set()